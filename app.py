@@ -5,11 +5,30 @@
 Не содержит бизнес-логики генерации, общается с ядром через HTTP.
 """
 
+import json
+
 import streamlit as st
 import requests
 from datetime import datetime
 
-API_URL = "http://127.0.0.1:8080/api/v1/generate"
+API_URL = "http://127.0.0.1:8080/api/v1/generate/stream"
+
+
+def iter_sse_events(response):
+    """Разбирает поток Server-Sent Events на пары (событие, данные)."""
+    response.encoding = "utf-8"
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
 
 st.set_page_config(page_title="IaC RAG API Demo", page_icon="🤖", layout="wide")
 st.title("🤖 RAG-генератор (API Web Client)")
@@ -36,29 +55,47 @@ if st.button("🚀 Отправить API-запрос", type="primary"):
     if not user_query.strip():
         st.warning("Пожалуйста, введите запрос.")
     else:
-        with st.spinner("Ожидание ответа от REST API (генерация и валидация)..."):
-            try:
+        lang = "hcl" if iac_tool == "terraform" else "yaml"
+        placeholder = st.empty()
+        try:
+            with st.spinner("Ожидание ответа от REST API (генерация и валидация)..."):
                 response = requests.post(
-                    API_URL, 
+                    API_URL,
                     json={"query": user_query, "iac_tool": iac_tool},
                     proxies={"http": None, "https": None},
-                    timeout=60
+                    stream=True,
+                    timeout=(10, 300)
                 )
-                
-                if response.status_code == 200:
-                    data = response.json()
+
+            if response.status_code == 200:
+                streamed = ""
+                data = None
+                for event, payload in iter_sse_events(response):
+                    if event == "token":
+                        streamed += payload.get("text", "")
+                        placeholder.code(streamed, language=lang)
+                    elif event == "repair":
+                        st.info(f"🔧 Код не прошел валидацию, исправление по ошибкам парсера (попытка {payload.get('attempt')})...")
+                    elif event == "result":
+                        data = payload
+                    elif event == "error":
+                        st.error(f"Ошибка API: {payload.get('detail')}")
+
+                if data is not None:
                     is_valid = data.get("is_valid")
                     code = data.get("code")
-                    
+                    placeholder.empty()
+
                     if is_valid:
                         st.success(f"✅ Успешный ответ API. Синтаксис {iac_tool.upper()} проверен и полностью корректен!")
-                        
-                        lang = "hcl" if iac_tool == "terraform" else "yaml"
+                        if data.get("repair_attempts"):
+                            st.caption(f"Код исправлен по ошибкам валидатора, попыток: {data['repair_attempts']}")
+
                         st.code(code, language=lang)
-                        
+
                         ext = "tf" if iac_tool == "terraform" else "yml"
                         filename = f"main_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
-                        
+
                         st.download_button(
                             label=f"⬇️ Скачать {filename}",
                             data=code,
@@ -67,13 +104,16 @@ if st.button("🚀 Отправить API-запрос", type="primary"):
                         )
                     else:
                         st.error("❌ API сгенерировал код, но он не прошел строгую валидацию синтаксиса. Ошибка в структуре.")
+                        for diagnostic in data.get("diagnostics", []):
+                            position = f"строка {diagnostic['line']}, столбец {diagnostic['column']}: " if diagnostic.get("line") else ""
+                            st.warning(f"{position}{diagnostic['message']}")
                         st.code(code, language="text")
-                else:
-                    st.error(f"Ошибка API: {response.status_code} - {response.text}")
-                    
-            except requests.exceptions.ConnectionError:
-                st.error(
-                    "❌ Не удалось подключиться к REST API. "
-                    "Убедитесь, что сервер FastAPI запущен в другом терминале командой: "
-                    "`uvicorn src.api:app --reload`"
-                )
\ No newline at end of file
+            else:
+                st.error(f"Ошибка API: {response.status_code} - {response.text}")
+
+        except requests.exceptions.ConnectionError:
+            st.error(
+                "❌ Не удалось подключиться к REST API. "
+                "Убедитесь, что сервер FastAPI запущен в другом терминале командой: "
+                "`uvicorn src.api:app --reload`"
+            )
@@ -0,0 +1 @@
+"""Бенчмарки производительности индексации, поиска и генерации."""
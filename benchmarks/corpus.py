@@ -0,0 +1,94 @@
+"""
+Генератор синтетического корпуса документации для бенчмарков.
+
+Каждый документ состоит из нескольких разделов-регламентов. У раздела есть
+уникальный код (маркер) и уникальное название проекта, а к каждому разделу
+формируется размеченный запрос, по которому считается полнота поиска:
+запрос считается найденным, если маркер раздела попал в собранный контекст.
+"""
+
+import random
+
+SYLLABLES = ("ка", "ро", "ви", "ла", "ту", "мен", "ар", "со", "дел", "ни", "гра", "зор", "пел", "ста", "ми", "кор")
+TOPICS = (
+    ("виртуальные машины", "Для виртуальных машин проекта {project} используется платформа {platform} "
+                           "с {cores} vCPU и {memory} ГБ памяти, загрузочный диск {disk} ГБ."),
+    ("сетевые правила", "Сеть проекта {project} использует диапазон {cidr}; входящий трафик разрешен "
+                        "только на порт {port}, исходящий ограничен группой безопасности {group}."),
+    ("метки и учет затрат", "Все ресурсы проекта {project} обязаны иметь метку cost_center={cost_center} "
+                            "и метку owner={owner}; бюджет ограничен {budget} рублями в месяц."),
+    ("резервное копирование", "Снимки дисков проекта {project} создаются каждые {hours} часов "
+                              "и хранятся {days} дней в бакете {bucket}."),
+    ("доступ и безопасность", "Доступ к ресурсам проекта {project} выдается через сервисный аккаунт {account} "
+                              "с ролью {role}; публичные IP-адреса запрещены."),
+)
+FILLER = (
+    "Требование обязательно для всех сред, включая тестовые.",
+    "Отклонения согласуются с архитектурным комитетом.",
+    "Нарушение регламента блокирует выкатку изменений.",
+    "Параметры проверяются автоматически в конвейере CI/CD.",
+    "Исключения фиксируются в реестре технического долга.",
+)
+PLATFORMS = ("standard-v1", "standard-v2", "standard-v3", "highfreq-v3")
+ROLES = ("viewer", "editor", "compute.admin", "vpc.user")
+
+
+def _project_name(rng: random.Random, index: int) -> str:
+    word = "".join(rng.choice(SYLLABLES) for _ in range(3))
+    return f"{word.capitalize()}-{index}"
+
+
+def _section(rng: random.Random, code: str, project: str, topic_index: int):
+    title, template = TOPICS[topic_index]
+    fact = template.format(
+        project=project,
+        platform=rng.choice(PLATFORMS),
+        cores=rng.choice((2, 4, 8, 16)),
+        memory=rng.choice((4, 8, 16, 32)),
+        disk=rng.choice((20, 50, 100)),
+        cidr=f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.0/24",
+        port=rng.choice((22, 80, 443, 8080)),
+        group=f"sg-{rng.randint(1000, 9999)}",
+        cost_center=f"cc-{rng.randint(100, 999)}",
+        owner=f"team-{rng.randint(10, 99)}",
+        budget=rng.randint(10, 500) * 1000,
+        hours=rng.choice((6, 12, 24)),
+        days=rng.choice((7, 14, 30)),
+        bucket=f"backup-{rng.randint(100, 999)}",
+        account=f"sa-{rng.randint(100, 999)}",
+        role=rng.choice(ROLES),
+    )
+    filler = " ".join(rng.sample(FILLER, 3))
+    text = f"## Регламент {code}: {title} ({project})\n\n{fact} {filler}\n"
+    query = f"Какие требования к теме «{title}» действуют для проекта {project}?"
+    return text, query
+
+
+def generate_corpus(directory, n_docs: int, sections_per_doc: int = 4, seed: int = 42) -> list:
+    """
+    Создает синтетические markdown-документы в каталоге.
+
+    Args:
+        directory: Каталог документов (создается при необходимости).
+        n_docs (int): Число документов.
+        sections_per_doc (int): Число разделов в каждом документе.
+        seed (int): Зерно генератора случайных чисел.
+
+    Returns:
+        list: Размеченные запросы {"query", "marker", "source"}.
+    """
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    labelled = []
+    for doc_index in range(n_docs):
+        sections = []
+        for section_index in range(sections_per_doc):
+            code = f"REG-{doc_index:05d}-{section_index}"
+            project = _project_name(rng, doc_index * sections_per_doc + section_index)
+            text, query = _section(rng, code, project, (doc_index + section_index) % len(TOPICS))
+            sections.append(text)
+            labelled.append({"query": query, "marker": code, "source": f"standard_{doc_index:05d}.md"})
+        body = f"# Корпоративный стандарт №{doc_index}\n\n" + "\n".join(sections)
+        (directory / f"standard_{doc_index:05d}.md").write_text(body, encoding="utf-8")
+    return labelled
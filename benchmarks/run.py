@@ -0,0 +1,261 @@
+"""
+Офлайн-бенчмарк индексации, поиска и генерации.
+
+Для каждого размера корпуса создается временный каталог с синтетическими
+документами (см. benchmarks.corpus), векторной базой и кэшем, и в отдельном
+процессе с LLM_PROVIDER=stub замеряются:
+- пропускная способность индексации create_vector_db (полной и повторной);
+- задержка get_relevant_context при разных k, с расширением запроса и без;
+- полнота поиска (recall@k) по размеченным запросам;
+- пропускная способность REST API под конкурентной нагрузкой.
+
+Результаты сохраняются в JSON для сравнения запусков. Модель эмбеддингов
+должна быть заранее загружена в локальный кэш HuggingFace.
+
+Запуск: python -m benchmarks.run --sizes 50 200 --output bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.corpus import generate_corpus
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BASE_DIR / "benchmarks" / "results"
+LABELS_FILE = "labels.json"
+
+
+def _latency_summary(seconds: list) -> dict:
+    """Сводка задержек в миллисекундах."""
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(percentile(0.50), 3),
+        "p95_ms": round(percentile(0.95), 3),
+        "p99_ms": round(percentile(0.99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _bench_indexing() -> dict:
+    from src.config import DOCS_DIR
+    from src.indexer import create_vector_db
+    from src.retriever import get_engine
+
+    documents = sum(1 for _ in DOCS_DIR.rglob("*.md"))
+    get_engine().embeddings  # загрузка модели не входит в замер индексации
+
+    started = time.perf_counter()
+    create_vector_db(incremental=False)
+    full_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    create_vector_db(incremental=True)
+    noop_seconds = time.perf_counter() - started
+
+    engine_metrics = get_engine().get_metrics()
+    chunks = engine_metrics.get("lexical_index_size") or None
+    return {
+        "documents": documents,
+        "chunks": chunks,
+        "full_seconds": round(full_seconds, 3),
+        "documents_per_second": round(documents / full_seconds, 2) if full_seconds else None,
+        "chunks_per_second": round(chunks / full_seconds, 2) if chunks and full_seconds else None,
+        "incremental_noop_seconds": round(noop_seconds, 3),
+        "vector_store": engine_metrics.get("vector_store"),
+        "store_load_seconds": engine_metrics.get("store_load_seconds"),
+    }
+
+
+def _bench_retrieval(labelled: list, k_values: list) -> list:
+    from src.generator import get_llm
+    from src.retriever import get_relevant_context
+
+    get_relevant_context(labelled[0]["query"], llm=None, k=max(k_values))
+
+    results = []
+    for expansion in (False, True):
+        llm = get_llm() if expansion else None
+        for k in k_values:
+            latencies, hits = [], 0
+            for item in labelled:
+                started = time.perf_counter()
+                context = get_relevant_context(item["query"], llm=llm, k=k)
+                latencies.append(time.perf_counter() - started)
+                hits += item["marker"] in context
+            results.append({
+                "k": k,
+                "expansion": expansion,
+                "latency": _latency_summary(latencies),
+                "recall": round(hits / len(labelled), 4),
+            })
+    return results
+
+
+async def _api_load(queries: list, concurrency: int, n_requests: int) -> dict:
+    import httpx
+    from src.api import app
+
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=600) as client:
+
+        async def one(i: int):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    "/api/v1/generate", json={"query": queries[i % len(queries)], "iac_tool": "terraform"}
+                )
+                ok = response.status_code == 200 and response.json().get("is_valid", False)
+                return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(one(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": sum(1 for _, ok in outcomes if not ok),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(n_requests / elapsed, 2) if elapsed else None,
+        "latency": _latency_summary([seconds for seconds, _ in outcomes]),
+    }
+
+
+def _bench_api(labelled: list, concurrency_levels: list, n_requests: int) -> list:
+    queries = [item["query"] for item in labelled]
+    return [asyncio.run(_api_load(queries, level, n_requests)) for level in concurrency_levels]
+
+
+def run_worker(options: dict, result_path: str) -> None:
+    """Выполняет замеры для одного корпуса (в процессе с настроенным окружением)."""
+    from src.config import DOCS_DIR
+
+    labelled = json.loads((DOCS_DIR.parent / LABELS_FILE).read_text(encoding="utf-8"))
+    rng = random.Random(options["seed"])
+    sample = rng.sample(labelled, min(options["queries"], len(labelled)))
+
+    result = {"indexing": _bench_indexing()}
+    result["retrieval"] = _bench_retrieval(sample, options["k"])
+    if options["requests"]:
+        result["api"] = _bench_api(sample, options["concurrency"], options["requests"])
+    Path(result_path).write_text(json.dumps(result, ensure_ascii=False), encoding="utf-8")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_size(size: int, args) -> dict:
+    """Готовит корпус во временном каталоге и запускает замеры в отдельном процессе."""
+    root = Path(tempfile.mkdtemp(prefix=f"iac-bench-{size}-"))
+    try:
+        labelled = generate_corpus(root / "docs", size, sections_per_doc=args.sections, seed=args.seed)
+        (root / LABELS_FILE).write_text(json.dumps(labelled, ensure_ascii=False), encoding="utf-8")
+
+        env = dict(os.environ)
+        env.update({
+            "IAC_DOCS_DIR": str(root / "docs"),
+            "IAC_DB_DIR": str(root / "vector_db"),
+            "IAC_CACHE_DIR": str(root / "cache"),
+            "IAC_OUTPUT_DIR": str(root / "output"),
+            "LLM_PROVIDER": "stub",
+            "LLM_MODEL_NAME": "stub",
+            "STUB_LLM_LATENCY": str(args.stub_latency),
+            "RESPONSE_CACHE_ENABLED": "false",
+            "REPAIR_MAX_ATTEMPTS": "0",
+            "VECTOR_STORE_BACKEND": args.vector_store,
+            "VECTOR_STORE_DTYPE": args.vector_dtype,
+            "RERANK_MODE": args.rerank,
+        })
+        options = {
+            "seed": args.seed,
+            "queries": args.queries,
+            "k": args.k,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        }
+        result_path = root / "result.json"
+        print(f"Корпус {size} документов: замеры в {root}", flush=True)
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--worker", json.dumps(options), "--result", str(result_path)],
+            cwd=BASE_DIR, env=env, check=True
+        )
+        result = json.loads(result_path.read_text(encoding="utf-8"))
+        result["corpus"] = {"documents": size, "sections_per_doc": args.sections, "labelled_queries": len(labelled)}
+        return result
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк индексации, поиска и API с тестовой моделью.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200], help="Размеры корпуса (число документов)")
+    parser.add_argument("--sections", type=int, default=4, help="Число разделов в документе")
+    parser.add_argument("--queries", type=int, default=50, help="Число размеченных запросов для замеров поиска")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10], help="Значения k для поиска")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Уровни конкурентности API")
+    parser.add_argument("--requests", type=int, default=32, help="Число запросов к API на уровень (0 - пропустить)")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="Задержка ответа тестовой модели, с")
+    parser.add_argument("--vector-store", choices=["chroma", "numpy"], default="chroma", help="Векторное хранилище")
+    parser.add_argument("--vector-dtype", choices=["float32", "int8"], default="float32",
+                        help="Формат векторов встроенного индекса")
+    parser.add_argument("--rerank", choices=["none", "cosine", "cross-encoder"], default="none",
+                        help="Переранжирование фрагментов перед сборкой контекста")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора корпуса и выборки запросов")
+    parser.add_argument("--output", type=str, help="Файл результатов (по умолчанию benchmarks/results/bench_<время>.json)")
+    parser.add_argument("--keep", action="store_true", help="Не удалять временные каталоги корпуса")
+    parser.add_argument("--worker", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--result", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(json.loads(args.worker), args.result)
+        return
+
+    started_at = datetime.now()
+    report = {
+        "meta": {
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": {key: value for key, value in vars(args).items() if key not in ("worker", "result")},
+        },
+        "runs": [_run_size(size, args) for size in args.sizes],
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"bench_{started_at.strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Результаты сохранены: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,21 @@
 
 Служит оберткой для прямого вызова ядра (генератора и валидатора) 
 из консоли или CI/CD пайплайнов без необходимости поднимать веб-сервер.
+
+Тяжелые зависимости (LangChain, модель эмбеддингов, Chroma) импортируются
+лениво, только когда они действительно нужны. Если запущен локальный демон
+(cli.py --serve) с той же конфигурацией, запросы передаются ему через Unix-сокет
+и не требуют повторной загрузки модели; иначе генерация выполняется в текущем процессе.
 """
 
 import argparse
+import asyncio
+import json
 import sys
 import logging
 from datetime import datetime
 
-from src.generator import generate_iac_script
-from src.validator import validate_iac
-from src.config import OUTPUT_DIR
+from src.config import OUTPUT_DIR, BATCH_PARALLELISM, BATCH_RATE_LIMIT, REPAIR_MAX_ATTEMPTS, VALIDATION_WORKERS
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 logging.getLogger("transformers").setLevel(logging.ERROR)
@@ -20,18 +25,127 @@ logging.getLogger("sentence_transformers").setLevel(logging.ERROR)
 logging.getLogger("chromadb.telemetry.product.posthog").setLevel(logging.ERROR)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
+def run_batch_mode(args) -> int:
+    """
+    Пакетный режим: читает JSONL с записями {query, iac_tool} и пишет JSONL с результатами.
+
+    Returns:
+        int: Код завершения (0 - все элементы успешны и валидны).
+    """
+    from src.batch import iter_batch, read_jsonl
+
+    items = read_jsonl(args.batch)
+    for item in items:
+        item.setdefault("max_repair_attempts", args.repair)
+    output_path = args.output or OUTPUT_DIR / f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+
+    print("=" * 60)
+    print(f" 📦 Пакетная генерация: {len(items)} запросов из {args.batch}")
+    print(f" ⚙️  Параллелизм: {args.parallel}, лимит: {args.rate or '∞'} запр./с")
+    print("=" * 60)
+
+    async def process() -> int:
+        failed = 0
+        with open(output_path, "w", encoding="utf-8") as out:
+            async for result in iter_batch(items, parallelism=args.parallel, rate_limit=args.rate,
+                                           validation_workers=VALIDATION_WORKERS):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                ok = result["error"] is None and result["is_valid"]
+                failed += 0 if ok else 1
+                status = "✅" if ok else "❌"
+                detail = result["error"] or ("" if result["is_valid"] else "ошибка синтаксиса: " + "; ".join(
+                    d["message"] for d in result["diagnostics"]))
+                print(f"{status} #{result['index']} ({result['seconds']} с) {detail}")
+        return failed
+
+    failed = asyncio.run(process())
+    print(f"\n💾 Результаты сохранены: {output_path}")
+    print(f"Итого: успешно {len(items) - failed}, с ошибками {failed}.")
+    return 0 if failed == 0 else 1
+
+def _print_token(text: str) -> None:
+    print(text, end="", flush=True)
+
+def _print_repair(attempt: int) -> None:
+    print(f"\n🔧 Код не прошел валидацию, исправление по ошибкам парсера (попытка {attempt})...")
+
+def generate_local(query: str, iac_tool: str, stream: bool, max_repair_attempts=None) -> dict:
+    """Генерирует и валидирует код в текущем процессе."""
+    from src.generator import generate_iac, stream_iac_script
+
+    if stream:
+        result = None
+        for kind, payload in stream_iac_script(query, iac_tool, max_repair_attempts):
+            if kind == "token":
+                _print_token(payload)
+            elif kind == "repair":
+                _print_repair(payload.repair_attempts)
+            else:
+                result = payload
+    else:
+        result = generate_iac(query, iac_tool, max_repair_attempts)
+    return {
+        "code": result.code,
+        "is_valid": result.is_valid,
+        "diagnostics": result.validation.to_dict()["diagnostics"],
+        "repair_attempts": result.repair_attempts
+    }
+
+def generate(query: str, iac_tool: str, stream: bool, use_daemon: bool, max_repair_attempts=None) -> dict:
+    """
+    Генерирует код через локальный демон, а при его недоступности, отличии его
+    конфигурации от текущей или обрыве соединения - в текущем процессе.
+
+    Returns:
+        dict: code, is_valid, diagnostics (диагностика валидатора) и repair_attempts.
+    """
+    if use_daemon:
+        from src.daemon import DaemonUnavailable, generate_via_daemon
+
+        printed = []
+
+        def on_token(text: str) -> None:
+            printed.append(text)
+            _print_token(text)
+
+        try:
+            return generate_via_daemon(
+                query, iac_tool, stream=stream, max_repair_attempts=max_repair_attempts,
+                on_token=on_token if stream else None,
+                on_repair=_print_repair if stream else None
+            )
+        except DaemonUnavailable as e:
+            if printed:
+                # Частичный вывод демона завершается переводом строки, генерация начинается заново
+                print()
+            logging.getLogger(__name__).debug(f"Демон недоступен ({e}), генерация в текущем процессе.")
+    return generate_local(query, iac_tool, stream, max_repair_attempts)
+
 def main():
     """Основная функция обработки аргументов командной строки."""
     parser = argparse.ArgumentParser(
         description="CLI утилита для AI-генерации инфраструктуры (IaC) с помощью RAG."
     )
     
-    parser.add_argument(
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument(
         "-q", "--query", 
         type=str, 
-        required=True, 
         help="Текстовый запрос (например: 'Создай ВМ на Ubuntu с 2 ядрами')"
     )
+
+    mode.add_argument(
+        "-b", "--batch",
+        type=str,
+        help="JSONL-файл с записями {\"query\": ..., \"iac_tool\": ...} для пакетной генерации"
+    )
+
+    mode.add_argument(
+        "--serve",
+        action="store_true",
+        help="Запустить локальный демон, который держит модель в памяти и обслуживает вызовы CLI"
+    )
     
     parser.add_argument(
         "-t", "--tool", 
@@ -47,21 +161,81 @@ def main():
         help="Флаг для автоматического сохранения результата в папку output/"
     )
 
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Выводить код по мере генерации, не дожидаясь полного ответа модели"
+    )
+
+    parser.add_argument(
+        "--repair",
+        type=int,
+        default=None,
+        help=f"Максимум попыток исправления невалидного кода по ошибкам парсера (по умолчанию: {REPAIR_MAX_ATTEMPTS}, 0 - отключить)"
+    )
+
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        help="JSONL-файл для результатов пакетного режима (по умолчанию: output/batch_<время>.jsonl)"
+    )
+
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=BATCH_PARALLELISM,
+        help=f"Число одновременно обрабатываемых запросов в пакетном режиме (по умолчанию: {BATCH_PARALLELISM})"
+    )
+
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=BATCH_RATE_LIMIT,
+        help="Максимум новых запросов в секунду в пакетном режиме (0 - без ограничения)"
+    )
+
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Не обращаться к локальному демону, выполнять генерацию в текущем процессе"
+    )
+
     args = parser.parse_args()
 
+    if args.serve:
+        from src.daemon import serve
+        serve()
+        sys.exit(0)
+
+    if args.batch:
+        try:
+            sys.exit(run_batch_mode(args))
+        except Exception as e:
+            print(f"\n❌ Критическая системная ошибка: {e}")
+            sys.exit(1)
+
     print("=" * 60)
     print(f" 🚀 Запуск генерации IaC для: {args.tool.upper()}")
     print(f" ❓ Запрос: {args.query}")
     print("=" * 60)
 
     try:
-        code = generate_iac_script(args.query, args.tool)
-        
-        is_valid = validate_iac(code, args.tool)
+        if args.stream:
+            print("\n--- ИТОГОВЫЙ КОД ---")
+        result = generate(
+            args.query, args.tool, args.stream, use_daemon=not args.no_daemon, max_repair_attempts=args.repair
+        )
+        code, is_valid = result["code"], result["is_valid"]
+
+        if args.stream and not result["repair_attempts"]:
+            print("\n--------------------\n")
+        else:
+            print("\n--- ИТОГОВЫЙ КОД ---")
+            print(code)
+            print("--------------------\n")
 
-        print("\n--- ИТОГОВЫЙ КОД ---")
-        print(code)
-        print("--------------------\n")
+        if result["repair_attempts"]:
+            print(f"🔧 Попыток исправления: {result['repair_attempts']}")
 
         if is_valid:
             print("✅ СТАТУС: Синтаксис полностью корректен.")
@@ -78,6 +252,9 @@ def main():
             sys.exit(0)
         else:
             print("❌ СТАТУС: Ошибка структуры/синтаксиса.")
+            for diagnostic in result["diagnostics"]:
+                position = f"{diagnostic['line']}:{diagnostic['column']}: " if diagnostic.get("line") else ""
+                print(f"   {position}{diagnostic['message']}")
             sys.exit(1)
 
     except Exception as e:
@@ -4,27 +4,136 @@ REST API интерфейс для модуля генерации IaC.
 Обеспечивает интеграцию компонента со сторонними системами (CI/CD, Web UI).
 """
 
+import re
+import json
+import time
 import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
-from src.generator import generate_iac_script
-from src.validator import validate_iac
+from src.batch import run_batch
+from src.concurrency import run_blocking
+from src.config import BATCH_PARALLELISM, BATCH_RATE_LIMIT
+from src.generator import GenerationResult, agenerate_iac, astream_iac_script
+from src.llm_clients import get_llm_registry
+from src.metrics import (
+    HTTP_REQUEST_SECONDS, current_trace, end_trace, get_metrics_registry, render_metrics, start_trace
+)
+from src.response_cache import get_response_cache
+from src.retriever import get_engine, get_expansion_cache
+from src.shared_cache import get_shared_cache
+from src.validator import get_validation_cache_stats
 
 logger = logging.getLogger(__name__)
 
+TRACE_HEADER = "X-Trace-Id"
+TRACE_ID_PATTERN = re.compile(r"^[\w.\-]{1,128}$")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Прогревает движок поиска при старте сервиса."""
+    try:
+        await run_blocking(get_engine().warmup)
+        logger.info("Движок поиска прогрет и готов к работе.")
+    except Exception as e:
+        logger.warning(f"Не удалось прогреть движок поиска: {str(e)}")
+    yield
+    await get_llm_registry().aclose()
+    get_engine().release()
+
+
 app = FastAPI(
     title="IaC RAG API",
     description="API для автоматизированной генерации инфраструктурных сценариев.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+
+def _cache_stats() -> dict:
+    """Собирает статистику всех кэшей процесса."""
+    stats = {
+        "responses": get_response_cache().get_stats(),
+        "expansion": get_expansion_cache().get_stats(),
+        "validation": get_validation_cache_stats(),
+    }
+    embedding_stats = get_engine().get_metrics().get("embedding_cache")
+    if embedding_stats:
+        stats["embeddings"] = embedding_stats
+    shared = get_shared_cache()
+    if shared is not None:
+        stats["shared"] = shared.get_stats()
+    return stats
+
+
+get_metrics_registry().gauge(
+    "iac_cache_hit_ratio", "Доля попаданий в кэш.", ("cache",),
+    collect=lambda: {name: stats["hit_rate"] for name, stats in _cache_stats().items()}
 )
 
 
+@app.middleware("http")
+async def trace_middleware(request: Request, call_next):
+    """
+    Начинает трассу запроса и замеряет его длительность.
+
+    Идентификатор трассы берется из заголовка X-Trace-Id (или генерируется)
+    и возвращается в том же заголовке ответа.
+    """
+    trace_id = request.headers.get(TRACE_HEADER)
+    trace, token = start_trace(trace_id if trace_id and TRACE_ID_PATTERN.match(trace_id) else None)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            path=getattr(route, "path", "unmatched"),
+            status=status
+        )
+        end_trace(token)
+    response.headers[TRACE_HEADER] = trace.trace_id
+    return response
+
+
 class GenerateRequest(BaseModel):
     """Модель запроса на генерацию кода."""
     query: str = Field(..., description="Текстовый запрос пользователя")
     iac_tool: str = Field("terraform", description="Целевой инструмент (terraform или ansible)")
+    max_repair_attempts: Optional[int] = Field(
+        None, ge=0, description="Максимум попыток исправления невалидного кода (по умолчанию из конфигурации)"
+    )
+    trace: bool = Field(False, description="Вернуть идентификатор трассы и длительности этапов в ответе")
+
+
+class DiagnosticModel(BaseModel):
+    """Сообщение валидатора с позицией в сгенерированном коде."""
+    message: str
+    line: Optional[int] = None
+    column: Optional[int] = None
+    severity: str = "error"
+
+
+class SpanModel(BaseModel):
+    """Длительность одного этапа обработки запроса."""
+    stage: str
+    seconds: float
+
+
+class TraceModel(BaseModel):
+    """Трасса запроса: длительности этапов и расход токенов."""
+    trace_id: str
+    spans: List[SpanModel] = []
+    tokens: Dict[str, int] = {}
 
 
 class GenerateResponse(BaseModel):
@@ -32,23 +141,171 @@ class GenerateResponse(BaseModel):
     tool: str
     is_valid: bool
     code: str
+    diagnostics: List[DiagnosticModel] = []
+    repair_attempts: int = 0
+    trace_id: Optional[str] = None
+    trace: Optional[TraceModel] = None
+
+
+class BatchGenerateRequest(BaseModel):
+    """Модель запроса пакетной генерации."""
+    items: List[GenerateRequest] = Field(..., description="Список запросов на генерацию")
+    parallelism: int = Field(BATCH_PARALLELISM, ge=1, description="Максимум одновременно обрабатываемых запросов")
+    rate_limit: float = Field(BATCH_RATE_LIMIT, ge=0, description="Максимум новых запросов в секунду (0 - без ограничения)")
+
+
+class BatchItemResult(BaseModel):
+    """Результат обработки одного элемента пакета."""
+    index: int
+    query: Optional[str] = None
+    iac_tool: str
+    is_valid: bool
+    code: Optional[str] = None
+    diagnostics: List[DiagnosticModel] = []
+    repair_attempts: int = 0
+    error: Optional[str] = None
+    seconds: float
+
+
+class BatchGenerateResponse(BaseModel):
+    """Модель ответа пакетной генерации."""
+    results: List[BatchItemResult]
+    succeeded: int
+    failed: int
+
+
+def _generate_response(request: GenerateRequest, result: GenerationResult) -> GenerateResponse:
+    """Формирует ответ API по результату генерации."""
+    trace = current_trace()
+    return GenerateResponse(
+        tool=request.iac_tool,
+        is_valid=result.is_valid,
+        code=result.code,
+        diagnostics=result.validation.to_dict()["diagnostics"],
+        repair_attempts=result.repair_attempts,
+        trace_id=trace.trace_id if trace is not None else None,
+        trace=trace.to_dict() if trace is not None and request.trace else None
+    )
 
 
 @app.post("/api/v1/generate", response_model=GenerateResponse)
 async def generate_endpoint(request: GenerateRequest):
     """
     Основной эндпоинт генерации кода.
+
+    Обращения к LLM выполняются асинхронно, а поиск и валидация - в пуле
+    потоков, поэтому медленный ответ модели не блокирует другие запросы.
+    Невалидный код исправляется по ошибкам валидатора (не более
+    max_repair_attempts попыток), число попыток возвращается в repair_attempts.
     """
     logger.info(f"API Request: Генерация для {request.iac_tool.upper()}")
     try:
-        generated_code = generate_iac_script(request.query, request.iac_tool)
-        is_valid = validate_iac(generated_code, request.iac_tool)
+        result = await agenerate_iac(request.query, request.iac_tool, request.max_repair_attempts)
+        return _generate_response(request, result)
+    except Exception as e:
+        logger.error(f"API Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return GenerateResponse(
-            tool=request.iac_tool,
-            is_valid=is_valid,
-            code=generated_code
-        )
+
+@app.post("/api/v1/generate/batch", response_model=BatchGenerateResponse)
+async def generate_batch_endpoint(request: BatchGenerateRequest):
+    """
+    Пакетная генерация кода.
+
+    Элементы обрабатываются конкурентно с общим движком поиска и пулом
+    клиентов LLM. Ошибка в одном элементе не прерывает обработку остальных
+    и возвращается в поле error соответствующего результата.
+    """
+    logger.info(f"API Request: Пакетная генерация ({len(request.items)} запросов)")
+    results = await run_batch(
+        [item.model_dump() for item in request.items],
+        parallelism=request.parallelism,
+        rate_limit=request.rate_limit
+    )
+    failed = sum(1 for r in results if r["error"] is not None)
+    return BatchGenerateResponse(results=results, succeeded=len(results) - failed, failed=failed)
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Форматирует событие Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/v1/generate/stream")
+async def generate_stream_endpoint(request: GenerateRequest):
+    """
+    Потоковая генерация кода (Server-Sent Events).
+
+    События token содержат очередные фрагменты кода без markdown-разметки,
+    события repair - номер очередной попытки исправления невалидного кода,
+    финальное событие result - итоговый код, результат валидации и диагностику,
+    событие error - описание сбоя.
+    """
+    logger.info(f"API Request: Потоковая генерация для {request.iac_tool.upper()}")
+
+    async def events():
+        try:
+            async for kind, payload in astream_iac_script(
+                request.query, request.iac_tool, request.max_repair_attempts
+            ):
+                if kind == "token":
+                    yield _sse_event("token", {"text": payload})
+                elif kind == "repair":
+                    yield _sse_event("repair", {"attempt": payload.repair_attempts, "is_valid": payload.is_valid})
+                else:
+                    yield _sse_event("result", _generate_response(request, payload).model_dump())
+        except Exception as e:
+            logger.error(f"API Error: {str(e)}")
+            yield _sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/v1/retriever/stats")
+async def retriever_stats_endpoint():
+    """
+    Метрики движка поиска: время загрузки модели и базы, статистика запросов.
+    """
+    return get_engine().get_metrics()
+
+
+@app.post("/api/v1/retriever/reload")
+def retriever_reload_endpoint():
+    """
+    Принудительно перечитывает векторную базу после пересборки индекса.
+    """
+    try:
+        get_engine().reload()
+        return get_engine().get_metrics()
     except Exception as e:
         logger.error(f"API Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/v1/llm/stats")
+async def llm_stats_endpoint():
+    """
+    Статистика реестра клиентов LLM: переиспользование экземпляров и HTTP-соединений.
+    """
+    return get_llm_registry().get_stats()
+
+
+@app.get("/api/v1/cache/stats")
+async def cache_stats_endpoint():
+    """
+    Статистика кэшей: ответов генератора, подзапросов, валидации и эмбеддингов.
+    """
+    return _cache_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Метрики в формате Prometheus: длительности этапов и HTTP-запросов,
+    расход токенов LLM и доли попаданий в кэши.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,195 @@
+"""
+Пакетная генерация IaC.
+
+Обрабатывает наборы запросов {query, iac_tool} конкурентно, используя
+общий движок поиска и реестр клиентов LLM процесса. Параллелизм и
+частота запросов ограничиваются, ошибки фиксируются для каждого
+элемента отдельно и не прерывают обработку остальных.
+
+Проверки кода от одновременно обрабатываемых элементов собираются в группы
+и выполняются через validate_many. В пакетном режиме CLI группы проверяются
+в пуле процессов, живущем на время пакета (разбор HCL и YAML не упирается
+в GIL); в REST API - в общем пуле потоков, без запуска процессов на каждый запрос.
+"""
+
+import json
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from src.config import BATCH_PARALLELISM, BATCH_RATE_LIMIT
+from src.concurrency import run_blocking
+from src.generator import agenerate_iac
+from src.validator import validate_many
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Асинхронный ограничитель частоты запросов (равномерные интервалы).
+
+    Args:
+        rate (float): Максимум запросов в секунду (0 - без ограничения).
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class BatchValidator:
+    """
+    Группирующая проверка кода для элементов пакета.
+
+    Запросы на проверку, поступившие в течение окна window, выполняются
+    одним вызовом validate_many в пуле процессов пакета. Процессы запускаются
+    методом spawn: дочерние процессы не наследуют потоки и модели родителя.
+
+    Args:
+        workers (int): Число процессов валидации (0 или 1 - проверка в пуле потоков).
+        window (float): Окно накопления запросов в секундах.
+    """
+
+    def __init__(self, workers: int = 0, window: float = 0.01):
+        self.workers = workers
+        self.window = window
+        self._pool = (
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            if workers > 1 else None
+        )
+        self._pending = []
+        self._flush_task = None
+
+    async def validate(self, content: str, iac_tool: str):
+        """Проверяет код в составе ближайшей группы."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((content, iac_tool, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(self.window)
+        pending, self._pending = self._pending, []
+        self._flush_task = None
+        try:
+            results = await run_blocking(
+                validate_many, [(content, tool) for content, tool, _ in pending], self.workers, self._pool
+            )
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+    def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _process_item(index: int, item: dict, semaphore: asyncio.Semaphore, limiter: RateLimiter,
+                        validator: BatchValidator) -> dict:
+    """Генерирует и валидирует код для одного элемента пакета."""
+    query = item.get("query")
+    iac_tool = item.get("iac_tool") or "terraform"
+    result = {"index": index, "query": query, "iac_tool": iac_tool, "is_valid": False, "code": None,
+              "diagnostics": [], "repair_attempts": 0, "error": None}
+
+    async with semaphore:
+        await limiter.acquire()
+        started = time.perf_counter()
+        try:
+            if item.get("_parse_error"):
+                raise ValueError(item["_parse_error"])
+            if not isinstance(query, str) or not query.strip():
+                raise ValueError("Поле 'query' отсутствует или пустое")
+            generated = await agenerate_iac(query, iac_tool, item.get("max_repair_attempts"),
+                                            validate=validator.validate)
+            result["code"] = generated.code
+            result["is_valid"] = generated.is_valid
+            result["diagnostics"] = generated.validation.to_dict()["diagnostics"]
+            result["repair_attempts"] = generated.repair_attempts
+        except Exception as e:
+            logger.error(f"Ошибка обработки элемента пакета #{index}: {str(e)}")
+            result["error"] = str(e)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def iter_batch(items, parallelism: int = BATCH_PARALLELISM, rate_limit: float = BATCH_RATE_LIMIT,
+                     validation_workers: int = 0):
+    """
+    Обрабатывает пакет запросов, отдавая результаты по мере готовности.
+
+    Args:
+        items: Последовательность словарей {query, iac_tool}.
+        parallelism (int): Максимум одновременно обрабатываемых элементов.
+        rate_limit (float): Максимум новых запросов в секунду (0 - без ограничения).
+        validation_workers (int): Число процессов валидации на время пакета
+            (0 - проверка в общем пуле потоков, как в REST API).
+
+    Yields:
+        dict: Результат элемента (index, query, iac_tool, is_valid, code, diagnostics,
+            repair_attempts, error, seconds).
+    """
+    semaphore = asyncio.Semaphore(max(1, parallelism))
+    limiter = RateLimiter(rate_limit)
+    validator = BatchValidator(min(validation_workers, max(1, parallelism)))
+    tasks = [
+        asyncio.ensure_future(_process_item(index, item, semaphore, limiter, validator))
+        for index, item in enumerate(items)
+    ]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
+        validator.close()
+
+
+async def run_batch(items, parallelism: int = BATCH_PARALLELISM, rate_limit: float = BATCH_RATE_LIMIT) -> list:
+    """Обрабатывает пакет запросов и возвращает результаты в исходном порядке."""
+    results = [result async for result in iter_batch(items, parallelism, rate_limit)]
+    return sorted(results, key=lambda r: r["index"])
+
+
+def read_jsonl(path) -> list:
+    """
+    Читает JSONL-файл с запросами.
+
+    Некорректные строки превращаются в элементы с описанием ошибки,
+    чтобы их номер сохранился в отчете.
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("ожидается JSON-объект")
+                items.append(record)
+            except ValueError as e:
+                items.append({"query": None, "_parse_error": f"Строка {line_no}: {e}"})
+    return items
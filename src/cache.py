@@ -0,0 +1,87 @@
+"""
+Общие примитивы кэширования.
+
+Потокобезопасный LRU-кэш в памяти с ограничением размера и временем жизни записей.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    LRU-кэш с вытеснением по размеру и по времени жизни (TTL).
+
+    Args:
+        max_entries (int): Максимальное число записей.
+        ttl (float): Время жизни записи в секундах (0 - без ограничения).
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl > 0 and now - stored_at > self.ttl
+
+    def get(self, key, default=None):
+        """Возвращает значение по ключу, обновляя его позицию в LRU."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return default
+            value, stored_at = item
+            if self._expired(stored_at, now):
+                del self._data[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value) -> None:
+        """Сохраняет значение, вытесняя самые старые записи при переполнении."""
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items(self) -> list:
+        """Возвращает снимок живых записей (ключ, значение) без обновления LRU."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (_, stored_at) in self._data.items() if self._expired(stored_at, now)]
+            for k in expired:
+                del self._data[k]
+            self._stats["expirations"] += len(expired)
+            return [(k, value) for k, (value, _) in self._data.items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def get_stats(self) -> dict:
+        """Возвращает статистику попаданий и вытеснений."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._data)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
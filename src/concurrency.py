@@ -0,0 +1,71 @@
+"""
+Вспомогательные средства асинхронного выполнения.
+
+Содержит общий ограниченный пул потоков для блокирующих операций
+(векторизация, поиск, парсинг HCL/YAML), отдельный пул для фоновых задач
+синхронного кода и семафоры, ограничивающие
+число одновременных обращений к каждому провайдеру LLM.
+"""
+
+import os
+import asyncio
+import functools
+import logging
+import contextvars
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config import BLOCKING_EXECUTOR_WORKERS, LLM_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_WORKERS, thread_name_prefix="iac-blocking")
+# Отдельный пул для фоновых задач, запускаемых из кода, который сам может выполняться
+# в _executor: при занятых воркерах общего пула вложенная задача иначе ждала бы их освобождения
+_background_executor = ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_WORKERS, thread_name_prefix="iac-background")
+_semaphores = {}
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Выполняет блокирующую функцию в общем пуле потоков, не блокируя цикл событий.
+
+    Функция выполняется в копии текущего контекста, поэтому трассировка
+    запроса (src.metrics) продолжается и в пуле потоков.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def submit_blocking(func, *args, **kwargs):
+    """
+    Запускает блокирующую функцию в фоновом пуле потоков и возвращает Future.
+
+    Используется синхронным кодом, который может сам выполняться в общем пуле
+    (run_blocking), поэтому задача не занимает и не ждет его воркеров.
+    """
+    return _background_executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+def get_provider_limit(provider: str) -> int:
+    """
+    Возвращает лимит одновременных запросов к провайдеру.
+
+    Лимит берется из переменной LLM_MAX_CONCURRENCY_<PROVIDER>,
+    а при ее отсутствии - из общего LLM_MAX_CONCURRENCY.
+    """
+    value = os.getenv(f"LLM_MAX_CONCURRENCY_{provider.upper()}")
+    return max(1, int(value)) if value else LLM_MAX_CONCURRENCY
+
+
+@asynccontextmanager
+async def llm_slot(provider: str):
+    """Асинхронный контекст, занимающий слот в лимите одновременных вызовов провайдера."""
+    loop = asyncio.get_running_loop()
+    key = (id(loop), provider)
+    semaphore = _semaphores.get(key)
+    if semaphore is None:
+        semaphore = _semaphores.setdefault(key, asyncio.Semaphore(get_provider_limit(provider)))
+    async with semaphore:
+        yield
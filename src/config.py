@@ -7,6 +7,7 @@
 
 import os
 import logging
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -27,11 +28,104 @@ CUSTOM_LLM_URL = os.getenv("CUSTOM_LLM_URL")
 if LLM_PROVIDER == "custom" and not CUSTOM_LLM_URL:
     logger.warning("Выбран CUSTOM провайдер, но CUSTOM_LLM_URL не задан в .env")
 
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+
+LLM_MAX_CONCURRENCY = max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+BLOCKING_EXECUTOR_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() != "false"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "1.0"))
+
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() != "false"
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+RETRIEVAL_FILTERS_ENABLED = os.getenv("RETRIEVAL_FILTERS_ENABLED", "true").lower() != "false"
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.0"))
+
+RERANK_MODE = os.getenv("RERANK_MODE", "none").lower()
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "8"))
+RERANK_THRESHOLD = float(os.getenv("RERANK_THRESHOLD", "0.0"))
+RERANK_MAX_CANDIDATES = int(os.getenv("RERANK_MAX_CANDIDATES", "40"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+
+if RERANK_MODE not in ("none", "cosine", "cross-encoder"):
+    logger.warning(f"Неизвестный RERANK_MODE={RERANK_MODE}, переранжирование отключено")
+    RERANK_MODE = "none"
+
+EXPANSION_CACHE_MAX_ENTRIES = int(os.getenv("EXPANSION_CACHE_MAX_ENTRIES", "1000"))
+EXPANSION_CACHE_TTL = float(os.getenv("EXPANSION_CACHE_TTL", "86400"))
+EXPANSION_LATENCY_BUDGET = float(os.getenv("EXPANSION_LATENCY_BUDGET", "0"))
+
+BATCH_PARALLELISM = max(1, int(os.getenv("BATCH_PARALLELISM", "4")))
+BATCH_RATE_LIMIT = float(os.getenv("BATCH_RATE_LIMIT", "0"))
+
+DAEMON_SOCKET = os.getenv(
+    "IAC_DAEMON_SOCKET",
+    os.path.join(tempfile.gettempdir(), f"iac-rag-{getattr(os, 'getuid', lambda: 0)()}.sock")
+)
+DAEMON_CONNECT_TIMEOUT = float(os.getenv("IAC_DAEMON_CONNECT_TIMEOUT", "2"))
+
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", str(os.cpu_count() or 1)))
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma").lower()
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32").lower()
+
+if VECTOR_STORE_BACKEND not in ("chroma", "numpy"):
+    logger.warning(f"Неизвестный VECTOR_STORE_BACKEND={VECTOR_STORE_BACKEND}, используется chroma")
+    VECTOR_STORE_BACKEND = "chroma"
+if VECTOR_STORE_DTYPE not in ("float32", "int8"):
+    logger.warning(f"Неизвестный VECTOR_STORE_DTYPE={VECTOR_STORE_DTYPE}, используется float32")
+    VECTOR_STORE_DTYPE = "float32"
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "paraphrase-multilingual-MiniLM-L12-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+EMBEDDING_QUANTIZATION_CONFIG = os.getenv("EMBEDDING_QUANTIZATION_CONFIG", "auto").lower()
+EMBEDDING_TOLERANCE = float(os.getenv("EMBEDDING_TOLERANCE", "0.99"))
+
+if EMBEDDING_BACKEND not in ("torch", "onnx", "onnx-int8"):
+    logger.warning(f"Неизвестный EMBEDDING_BACKEND={EMBEDDING_BACKEND}, используется torch")
+    EMBEDDING_BACKEND = "torch"
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "false"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_DISK_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_DISK_CACHE_MAX_ENTRIES", "200000"))
+
+VALIDATION_CACHE_SIZE = int(os.getenv("VALIDATION_CACHE_SIZE", "2000"))
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS", str(os.cpu_count() or 1)))
+
+REPAIR_MAX_ATTEMPTS = max(0, int(os.getenv("REPAIR_MAX_ATTEMPTS", "0")))
+REPAIR_TIME_BUDGET = float(os.getenv("REPAIR_TIME_BUDGET", "60"))
+
+STUB_LLM_LATENCY = float(os.getenv("STUB_LLM_LATENCY", "0"))
+
 BASE_DIR = Path(__file__).resolve().parent.parent
-DOCS_DIR = BASE_DIR / "docs"
-DB_DIR = BASE_DIR / "vector_db"
-OUTPUT_DIR = BASE_DIR / "output"
+DOCS_DIR = Path(os.getenv("IAC_DOCS_DIR", BASE_DIR / "docs"))
+DB_DIR = Path(os.getenv("IAC_DB_DIR", BASE_DIR / "vector_db"))
+OUTPUT_DIR = Path(os.getenv("IAC_OUTPUT_DIR", BASE_DIR / "output"))
+CACHE_DIR = Path(os.getenv("IAC_CACHE_DIR", BASE_DIR / "cache"))
 
-for directory in (DOCS_DIR, DB_DIR, OUTPUT_DIR):
+for directory in (DOCS_DIR, DB_DIR, OUTPUT_DIR, CACHE_DIR):
     directory.mkdir(parents=True, exist_ok=True)
-    logger.debug(f"Директория проверена/создана: {directory}")
\ No newline at end of file
+    logger.debug(f"Директория проверена/создана: {directory}")
+
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "none").lower()
+SHARED_CACHE_PATH = Path(os.getenv("SHARED_CACHE_PATH", CACHE_DIR / "shared_cache.sqlite3"))
+SHARED_CACHE_REDIS_URL = os.getenv("SHARED_CACHE_REDIS_URL", "redis://localhost:6379/0")
+SHARED_CACHE_TTL = float(os.getenv("SHARED_CACHE_TTL", "86400"))
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "100000"))
+SHARED_CACHE_FLIGHT_TIMEOUT = float(os.getenv("SHARED_CACHE_FLIGHT_TIMEOUT", "120"))
+
+if SHARED_CACHE_BACKEND not in ("none", "sqlite", "redis"):
+    logger.warning(f"Неизвестный SHARED_CACHE_BACKEND={SHARED_CACHE_BACKEND}, общий кэш отключен")
+    SHARED_CACHE_BACKEND = "none"
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Сборка контекста для системного промпта.
+
+Объединяет соседние и перекрывающиеся фрагменты одного источника,
+отбрасывает почти дубликаты (SimHash) и заполняет ограниченный бюджет
+токенов целевой модели фрагментами в порядке релевантности.
+"""
+
+import re
+import math
+import hashlib
+import logging
+
+from src.config import CONTEXT_TOKEN_BUDGET, CONTEXT_CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+SIMHASH_MAX_DISTANCE = 3
+OVERLAP_PROBE = 64
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценивает число токенов текста по средней длине токена в символах."""
+    return math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN)
+
+
+def simhash(text: str) -> int:
+    """Вычисляет 64-битный SimHash текста по словесным триграммам."""
+    words = _WORD_PATTERN.findall(text.lower())
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+class _Block:
+    """Фрагмент контекста (один или несколько объединенных чанков)."""
+
+    def __init__(self, text: str, score: float, rank: int, start):
+        self.text = text
+        self.score = score
+        self.rank = rank
+        self.start = start
+
+    @property
+    def end(self):
+        return self.start + len(self.text) if self.start is not None else None
+
+
+def _text_overlap(left: str, right: str) -> int:
+    """Возвращает длину перекрытия конца left с началом right (0, если его нет)."""
+    probe = right[:OVERLAP_PROBE]
+    if not probe:
+        return 0
+    pos = left.rfind(probe)
+    while pos != -1:
+        if right.startswith(left[pos:]):
+            return len(left) - pos
+        pos = left.rfind(probe, 0, pos)
+    return 0
+
+
+def _offsets_agree(current: _Block, block: _Block) -> bool:
+    """Проверяет, что перекрытие по start_index совпадает с текстом (смещения не устарели)."""
+    offset = block.start - current.start
+    length = min(current.end - block.start, len(block.text))
+    return current.text[offset:offset + length] == block.text[:length]
+
+
+def _merge_group(blocks: list) -> list:
+    """Сливает соседние и перекрывающиеся фрагменты одного источника."""
+    positioned = [b for b in blocks if b.start is not None]
+    merged = [b for b in blocks if b.start is None]
+
+    positioned.sort(key=lambda b: b.start)
+    current = None
+    for block in positioned:
+        if current is not None and block.start <= current.end and _offsets_agree(current, block):
+            tail = block.text[current.end - block.start:]
+            current = _Block(current.text + tail, max(current.score, block.score),
+                             min(current.rank, block.rank), current.start)
+        else:
+            if current is not None:
+                merged.append(current)
+            current = block
+    if current is not None:
+        merged.append(current)
+
+    changed = True
+    while changed:
+        changed = False
+        for i, left in enumerate(merged):
+            for j, right in enumerate(merged):
+                if i == j:
+                    continue
+                overlap = _text_overlap(left.text, right.text)
+                if overlap:
+                    left.text += right.text[overlap:]
+                    left.score = max(left.score, right.score)
+                    left.rank = min(left.rank, right.rank)
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def assemble_context(ranked_docs, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Собирает контекст из ранжированных фрагментов в пределах бюджета токенов.
+
+    Args:
+        ranked_docs: Пары (Document, score) в порядке убывания релевантности.
+        token_budget (int): Максимальный объем контекста в токенах (0 - без ограничения).
+
+    Returns:
+        str: Текст контекста, фрагменты разделены CONTEXT_SEPARATOR.
+    """
+    groups = {}
+    for rank, (doc, score) in enumerate(ranked_docs):
+        metadata = doc.metadata or {}
+        key = (metadata.get("source"), metadata.get("page"))
+        groups.setdefault(key, []).append(_Block(doc.page_content, score, rank, metadata.get("start_index")))
+
+    blocks = [block for group in groups.values() for block in _merge_group(group)]
+    blocks.sort(key=lambda b: (-b.score, b.rank))
+
+    selected, fingerprints = [], []
+    used_tokens = 0
+    separator_tokens = estimate_tokens(CONTEXT_SEPARATOR)
+    for block in blocks:
+        fingerprint = simhash(block.text)
+        if any(bin(fingerprint ^ other).count("1") <= SIMHASH_MAX_DISTANCE for other in fingerprints):
+            continue
+
+        cost = estimate_tokens(block.text) + (separator_tokens if selected else 0)
+        if token_budget and used_tokens + cost > token_budget:
+            if selected:
+                continue
+            block.text = block.text[:int(token_budget * CONTEXT_CHARS_PER_TOKEN)]
+            cost = estimate_tokens(block.text)
+
+        selected.append(block.text)
+        fingerprints.append(fingerprint)
+        used_tokens += cost
+
+    logger.info(
+        f"Контекст собран: {len(selected)} фрагментов из {len(ranked_docs)} найденных, "
+        f"~{used_tokens} токенов (бюджет {token_budget or '∞'})."
+    )
+    return CONTEXT_SEPARATOR.join(selected)
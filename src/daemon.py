@@ -0,0 +1,221 @@
+"""
+Локальный демон генерации IaC.
+
+Держит в памяти прогретые модель эмбеддингов, векторную базу и клиентов LLM
+и принимает запросы CLI через Unix-сокет. Протокол - JSON-строки:
+клиент отправляет один запрос, сервер отвечает событиями token и repair
+(при потоковом режиме) и финальным result или error.
+
+Запрос содержит отпечаток конфигурации клиента. Если он не совпадает с
+отпечатком демона (другие провайдер, модель, каталоги индекса и т.д.), демон
+отвечает событием config_mismatch, и клиент выполняет генерацию сам.
+"""
+
+import os
+import json
+import socket
+import hashlib
+import logging
+import functools
+import socketserver
+
+from src.config import DAEMON_SOCKET, DAEMON_CONNECT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class DaemonUnavailable(Exception):
+    """Демон не запущен или не отвечает."""
+
+
+@functools.lru_cache(maxsize=1)
+def config_fingerprint() -> str:
+    """
+    Отпечаток конфигурации процесса (src.config), влияющей на результат генерации.
+
+    Параметры подключения к самому демону (DAEMON_*) в отпечаток не входят.
+    """
+    from src import config
+
+    values = {
+        name: str(getattr(config, name)) for name in dir(config)
+        if name.isupper() and not name.startswith("DAEMON_")
+    }
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Обрабатывает один запрос клиента."""
+
+    def _send(self, payload: dict) -> None:
+        self.wfile.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self):
+        from src.generator import generate_iac, stream_iac_script
+
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8"))
+        except ValueError as e:
+            self._send({"event": "error", "detail": f"Некорректный запрос: {e}"})
+            return
+
+        if request.get("action") == "ping":
+            self._send({"event": "pong", "pid": os.getpid(), "fingerprint": config_fingerprint()})
+            return
+
+        if request.get("fingerprint") != config_fingerprint():
+            logger.info("Конфигурация клиента отличается от конфигурации демона. Запрос отклонен.")
+            self._send({"event": "config_mismatch", "fingerprint": config_fingerprint()})
+            return
+
+        query = request.get("query", "")
+        iac_tool = request.get("iac_tool", "terraform")
+        max_repair_attempts = request.get("max_repair_attempts")
+        logger.info(f"Daemon Request: Генерация для {iac_tool.upper()}")
+        try:
+            if request.get("stream"):
+                result = None
+                for kind, payload in stream_iac_script(query, iac_tool, max_repair_attempts):
+                    if kind == "token":
+                        self._send({"event": "token", "text": payload})
+                    elif kind == "repair":
+                        self._send({"event": "repair", "attempt": payload.repair_attempts})
+                    else:
+                        result = payload
+            else:
+                result = generate_iac(query, iac_tool, max_repair_attempts)
+            self._send({
+                "event": "result", "code": result.code, "is_valid": result.is_valid,
+                "diagnostics": result.validation.to_dict()["diagnostics"],
+                "repair_attempts": result.repair_attempts
+            })
+        except (BrokenPipeError, ConnectionResetError):
+            logger.warning("Клиент отключился до завершения генерации.")
+        except Exception as e:
+            logger.error(f"Daemon Error: {str(e)}")
+            self._send({"event": "error", "detail": str(e)})
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path: str = DAEMON_SOCKET) -> None:
+    """
+    Запускает демон на Unix-сокете (блокирующий вызов).
+
+    Args:
+        socket_path (str): Путь к Unix-сокету.
+    """
+    from src.retriever import get_engine
+
+    if os.path.exists(socket_path):
+        try:
+            ping(socket_path)
+            raise RuntimeError(f"Демон уже запущен на сокете {socket_path}")
+        except DaemonUnavailable:
+            os.unlink(socket_path)
+
+    logger.info("Прогрев движка поиска...")
+    try:
+        get_engine().warmup()
+    except Exception as e:
+        logger.warning(f"Не удалось прогреть движок поиска: {str(e)}")
+
+    with _DaemonServer(socket_path, _RequestHandler) as server:
+        os.chmod(socket_path, 0o600)
+        logger.info(f"Демон IaC RAG слушает {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Остановка демона.")
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+def _connect(socket_path: str):
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        raise DaemonUnavailable("Сокет демона не найден")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+    try:
+        sock.connect(socket_path)
+    except OSError as e:
+        sock.close()
+        raise DaemonUnavailable(str(e))
+    return sock
+
+
+def _iter_events(sock, request: dict):
+    sock.sendall((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+    sock.settimeout(None)
+    with sock.makefile("r", encoding="utf-8") as stream:
+        for line in stream:
+            yield json.loads(line)
+
+
+def ping(socket_path: str = DAEMON_SOCKET) -> dict:
+    """Проверяет, что демон запущен и отвечает."""
+    sock = _connect(socket_path)
+    try:
+        sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+        sock.sendall(b'{"action": "ping"}\n')
+        line = sock.makefile("r", encoding="utf-8").readline()
+        if not line:
+            raise DaemonUnavailable("Демон не ответил")
+        return json.loads(line)
+    except (OSError, ValueError) as e:
+        raise DaemonUnavailable(str(e))
+    finally:
+        sock.close()
+
+
+def generate_via_daemon(query: str, iac_tool: str, stream: bool = False, on_token=None,
+                        max_repair_attempts=None, on_repair=None, socket_path: str = DAEMON_SOCKET):
+    """
+    Передает запрос на генерацию запущенному демону.
+
+    Args:
+        query (str): Текстовый запрос.
+        iac_tool (str): Целевой инструмент IaC.
+        stream (bool): Получать код по мере генерации.
+        on_token: Функция, вызываемая для каждого фрагмента кода при потоковом режиме.
+        max_repair_attempts (int): Максимум попыток исправления невалидного кода.
+        on_repair: Функция, вызываемая с номером попытки исправления при потоковом режиме.
+        socket_path (str): Путь к Unix-сокету демона.
+
+    Returns:
+        dict: Событие result (code, is_valid, diagnostics, repair_attempts).
+
+    Raises:
+        DaemonUnavailable: Если подключиться к демону не удалось, его конфигурация
+            отличается от текущей или соединение прервалось до получения результата.
+        RuntimeError: Если генерация в демоне завершилась ошибкой.
+    """
+    sock = _connect(socket_path)
+    try:
+        request = {
+            "action": "generate", "query": query, "iac_tool": iac_tool, "stream": stream,
+            "max_repair_attempts": max_repair_attempts, "fingerprint": config_fingerprint()
+        }
+        for event in _iter_events(sock, request):
+            if event["event"] == "token" and on_token is not None:
+                on_token(event["text"])
+            elif event["event"] == "repair" and on_repair is not None:
+                on_repair(event["attempt"])
+            elif event["event"] == "result":
+                return event
+            elif event["event"] == "error":
+                raise RuntimeError(event["detail"])
+            elif event["event"] == "config_mismatch":
+                logger.warning("Конфигурация демона отличается от текущей. Генерация выполняется в текущем процессе.")
+                raise DaemonUnavailable("Конфигурация демона отличается от текущей")
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Соединение с демоном прервано: {str(e)}")
+        raise DaemonUnavailable(str(e))
+    finally:
+        sock.close()
+    logger.warning("Демон разорвал соединение без результата.")
+    raise DaemonUnavailable("Демон разорвал соединение без результата")
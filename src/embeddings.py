@@ -0,0 +1,704 @@
+"""
+Модуль эмбеддингов с кэшированием.
+
+Оборачивает модель эмбеддингов HuggingFace двухуровневым кэшем:
+LRU-кэш в памяти процесса и компактное дисковое хранилище
+(float32-массив, отображаемый в память, и хэш-индекс строк).
+При включенном общем кэше (src.shared_cache) векторы также
+разделяются между воркерами и хостами.
+Ключ кэша строится по имени модели, бэкенду и нормализованному тексту,
+поэтому повторные запросы и чанки не требуют прохода трансформера.
+
+Инференс выполняется через PyTorch или ONNX Runtime (в том числе с динамической
+int8-квантизацией для CPU). ONNX-модель экспортируется один раз в каталог кэша
+индексатором или командой python -m src.embeddings и принимается в работу,
+только если ее векторы совпадают с исходными в пределах допуска EMBEDDING_TOLERANCE.
+Рабочие процессы API модель не экспортируют: при ее отсутствии они
+используют бэкенд torch.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+import argparse
+import platform
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.config import (
+    CACHE_DIR,
+    DOCS_DIR,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_DISK_CACHE_MAX_ENTRIES,
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_THREADS,
+    EMBEDDING_QUANTIZATION_CONFIG,
+    EMBEDDING_TOLERANCE,
+)
+from src.shared_cache import get_shared_cache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SHARED_NAMESPACE = "embedding"
+CURRENT_FILE = "CURRENT"
+DISK_TAIL_MAX_ROWS = 50000
+DISK_COMPACT_SLACK = 1.25
+DISK_COMPACT_BLOCK_ROWS = 16384
+
+
+def normalize_text(text: str) -> str:
+    """Приводит текст к каноническому виду для построения ключа кэша."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_key(model_name: str, kind: str, text: str) -> str:
+    """Строит ключ кэша по имени модели, типу эмбеддинга и нормализованному тексту."""
+    payload = f"{model_name}\0{kind}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+class EmbeddingDiskStore:
+    """
+    Дисковое хранилище эмбеддингов с дозаписью и периодическим сжатием.
+
+    Каталог содержит поколения g-<id>/ и файл CURRENT с именем активного.
+    В поколении vectors.f32 хранит векторы подряд (float32), keys.npy и rows.npy -
+    отсортированные ключи сжатой части и номера их строк, index.tsv - строки
+    "<ключ>\\t<номер строки>", дописанные после сжатия. Сжатая часть индекса
+    читается через np.memmap и бинарный поиск, поэтому в памяти процесса
+    остается только хвост дозаписей.
+
+    Сжатие (compact) переносит в новое поколение не более max_entries последних
+    записанных векторов и переключает CURRENT; оно выполняется индексатором
+    и автоматически при записи, когда хвост или общий объем превышают пределы.
+    Дозапись и сжатие защищены файловой блокировкой, поэтому хранилище можно
+    разделять между несколькими процессами.
+
+    Args:
+        directory: Каталог хранилища.
+        max_entries (int): Максимум векторов после сжатия (0 - без ограничения).
+    """
+
+    def __init__(self, directory, max_entries: int = EMBEDDING_DISK_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(0, max_entries)
+        self.lock_path = directory / "lock"
+        self.dim_path = directory / "dim"
+
+        self._lock = threading.Lock()
+        self._dim = None
+        self._generation = None
+        self._reset(None)
+
+    def _reset(self, generation) -> None:
+        """Переключает состояние процесса на поколение generation ("" - каталог прежнего формата, None - не прочитано)."""
+        self._generation = generation
+        self._keys = None
+        self._key_rows = None
+        self._rows = {}
+        self._index_offset = 0
+        self._mmap = None
+        self._mmap_rows = 0
+
+    def _generation_dir(self, generation: str):
+        return self.directory / generation if generation else self.directory
+
+    def _read_current(self) -> str:
+        try:
+            return (self.directory / CURRENT_FILE).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return ""
+
+    def _read_dim(self):
+        if self._dim is None and self.dim_path.exists():
+            self._dim = int(self.dim_path.read_text(encoding="utf-8"))
+        return self._dim
+
+    @staticmethod
+    def _load_sorted(generation_dir):
+        """Загружает отсортированные ключи и номера строк сжатой части поколения."""
+        try:
+            keys = np.load(generation_dir / "keys.npy", mmap_mode="r")
+            rows = np.load(generation_dir / "rows.npy", mmap_mode="r")
+        except FileNotFoundError:
+            return None, None
+        except ValueError:
+            # Пустой массив не отображается в память
+            return np.load(generation_dir / "keys.npy"), np.load(generation_dir / "rows.npy")
+        return keys, rows
+
+    def _refresh_index(self) -> None:
+        """Переходит на актуальное поколение и дочитывает строки индекса, добавленные с прошлого чтения."""
+        generation = self._read_current()
+        if generation != self._generation:
+            self._reset(generation)
+            self._keys, self._key_rows = self._load_sorted(self._generation_dir(generation))
+
+        index_path = self._generation_dir(self._generation) / "index.tsv"
+        try:
+            if index_path.stat().st_size <= self._index_offset:
+                return
+            with open(index_path, "rb") as f:
+                f.seek(self._index_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.decode("utf-8").splitlines():
+            key, _, row = line.partition("\t")
+            self._rows[key] = int(row)
+        self._index_offset += len(complete)
+
+    def _find(self, key: str):
+        row = self._rows.get(key)
+        if row is None and self._keys is not None and len(self._keys):
+            encoded = key.encode("ascii")
+            i = int(np.searchsorted(self._keys, encoded))
+            if i < len(self._keys) and self._keys[i] == encoded:
+                row = int(self._key_rows[i])
+        return row
+
+    def _vector(self, row: int):
+        dim = self._read_dim()
+        if dim is None:
+            return None
+        if row >= self._mmap_rows:
+            vectors_path = self._generation_dir(self._generation) / "vectors.f32"
+            try:
+                total_rows = vectors_path.stat().st_size // (dim * 4)
+            except FileNotFoundError:
+                # Поколение удалено после сжатия: при следующем промахе будет прочитано новое
+                return None
+            if row >= total_rows:
+                return None
+            self._mmap = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(total_rows, dim))
+            self._mmap_rows = total_rows
+        return np.array(self._mmap[row])
+
+    def get(self, key: str):
+        """Возвращает вектор по ключу или None, если его нет на диске."""
+        with self._lock:
+            row = self._find(key)
+            if row is None:
+                self._refresh_index()
+                row = self._find(key)
+            if row is None:
+                return None
+            return self._vector(row)
+
+    @contextmanager
+    def _file_lock(self):
+        """Межпроцессная блокировка записи и сжатия."""
+        with open(self.lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def put_many(self, items) -> None:
+        """Дописывает пары (ключ, вектор) в хранилище и при необходимости сжимает его."""
+        if not items:
+            return
+        vectors = np.asarray([vector for _, vector in items], dtype=np.float32)
+        with self._lock, self._file_lock():
+            dim = self._read_dim()
+            if dim is None:
+                dim = vectors.shape[1]
+                self.dim_path.write_text(str(dim), encoding="utf-8")
+                self._dim = dim
+            elif dim != vectors.shape[1]:
+                logger.warning("Размерность эмбеддингов не совпадает с дисковым кэшем. Запись пропущена.")
+                return
+
+            generation_dir = self._generation_dir(self._read_current())
+            with open(generation_dir / "vectors.f32", "ab") as vectors_file:
+                first_row = vectors_file.tell() // (dim * 4)
+                vectors_file.write(vectors.tobytes())
+            lines = "".join(f"{key}\t{first_row + i}\n" for i, (key, _) in enumerate(items))
+            with open(generation_dir / "index.tsv", "ab") as index_file:
+                index_file.write(lines.encode("utf-8"))
+
+            total_rows = first_row + len(items)
+            keys, _ = self._load_sorted(generation_dir)
+            tail_rows = total_rows - (len(keys) if keys is not None else 0)
+            over_limit = self.max_entries and total_rows > self.max_entries * DISK_COMPACT_SLACK
+            if tail_rows > DISK_TAIL_MAX_ROWS or over_limit:
+                self._compact_locked(dim)
+
+    def compact(self):
+        """
+        Сжимает хранилище: оставляет не более max_entries последних векторов
+        и переносит весь индекс в отсортированную отображаемую часть.
+
+        Returns:
+            tuple: Число векторов до и после сжатия (None, если хранилище пусто).
+        """
+        with self._lock, self._file_lock():
+            dim = self._read_dim()
+            if dim is None:
+                return None
+            return self._compact_locked(dim)
+
+    def _compact_locked(self, dim: int):
+        """Строит новое поколение из актуальных записей. Вызывается под файловой блокировкой."""
+        previous = self._read_current()
+        source_dir = self._generation_dir(previous)
+        vectors_path = source_dir / "vectors.f32"
+        total_rows = vectors_path.stat().st_size // (dim * 4) if vectors_path.exists() else 0
+
+        entries = {}
+        keys, rows = self._load_sorted(source_dir)
+        if keys is not None:
+            entries.update(zip((key.decode("ascii") for key in keys), (int(row) for row in rows)))
+        index_path = source_dir / "index.tsv"
+        if index_path.exists():
+            for line in index_path.read_text(encoding="utf-8").splitlines():
+                key, sep, row = line.partition("\t")
+                if sep and int(row) < total_rows:
+                    entries[key] = int(row)
+
+        # Порядок строк совпадает с порядком записи: при ограничении остаются самые свежие векторы
+        kept = sorted(entries.items(), key=lambda item: item[1])
+        if self.max_entries:
+            kept = kept[-self.max_entries:]
+
+        generation = f"g-{uuid.uuid4().hex[:12]}"
+        target = self.directory / generation
+        target.mkdir()
+        source_rows = np.fromiter((row for _, row in kept), dtype=np.int64, count=len(kept))
+        if len(kept):
+            source = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(total_rows, dim))
+            with open(target / "vectors.f32", "wb") as f:
+                for start in range(0, len(kept), DISK_COMPACT_BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(source[source_rows[start:start + DISK_COMPACT_BLOCK_ROWS]]).tobytes())
+            del source
+        else:
+            (target / "vectors.f32").touch()
+        new_keys = np.array([key for key, _ in kept], dtype="S40")
+        order = np.argsort(new_keys, kind="stable")
+        np.save(target / "keys.npy", new_keys[order])
+        np.save(target / "rows.npy", order.astype(np.int64))
+        (target / "index.tsv").touch()
+
+        pointer_tmp = self.directory / f"{CURRENT_FILE}.tmp"
+        pointer_tmp.write_text(generation, encoding="utf-8")
+        os.replace(pointer_tmp, self.directory / CURRENT_FILE)
+
+        # Предыдущее поколение сохраняется для процессов, еще читающих его
+        for stale in self.directory.glob("g-*"):
+            if stale.name not in (generation, previous):
+                shutil.rmtree(stale, ignore_errors=True)
+        if previous:
+            for legacy in ("vectors.f32", "index.tsv"):
+                (self.directory / legacy).unlink(missing_ok=True)
+
+        self._reset(None)
+        logger.info(f"Дисковый кэш эмбеддингов сжат: {total_rows} -> {len(kept)} векторов.")
+        return total_rows, len(kept)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Обертка над моделью эмбеддингов с LRU-кэшем в памяти и дисковым хранилищем.
+
+    Args:
+        base (Embeddings): Исходная модель эмбеддингов.
+        model_name (str): Имя модели, входящее в ключ кэша.
+        cache_dir: Каталог дискового хранилища (None - только память).
+        max_items (int): Максимальное число векторов в памяти.
+    """
+
+    def __init__(self, base: Embeddings, model_name: str, cache_dir=None, max_items: int = EMBEDDING_CACHE_SIZE):
+        self.base = base
+        self.model_name = model_name
+        self.max_items = max_items
+        self.disk = EmbeddingDiskStore(cache_dir) if cache_dir is not None else None
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "shared_hits": 0, "misses": 0}
+
+    def _remember(self, key: str, vector) -> None:
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key: str):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return vector
+        if self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                vector = vector.tolist()
+                self._remember(key, vector)
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                return vector
+        return None
+
+    def _embed(self, texts, kind: str, compute):
+        keys = [embedding_key(self.model_name, kind, text) for text in texts]
+        results = [self._lookup(key) for key in keys]
+
+        missing = {}
+        for i, vector in enumerate(results):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+
+        shared = get_shared_cache() if missing else None
+        if shared is not None:
+            found = shared.get_many(SHARED_NAMESPACE, list(missing))
+            for key, value in found.items():
+                vector = np.frombuffer(value, dtype=np.float32).tolist()
+                self._remember(key, vector)
+                for i in missing.pop(key):
+                    results[i] = vector
+            with self._lock:
+                self._stats["shared_hits"] += len(found)
+
+        if missing:
+            with self._lock:
+                self._stats["misses"] += len(missing)
+            miss_keys = list(missing)
+            vectors = compute([texts[missing[key][0]] for key in miss_keys])
+            for key, vector in zip(miss_keys, vectors):
+                vector = list(vector)
+                self._remember(key, vector)
+                for i in missing[key]:
+                    results[i] = vector
+            if self.disk is not None:
+                try:
+                    self.disk.put_many(list(zip(miss_keys, vectors)))
+                except OSError as e:
+                    logger.warning(f"Не удалось сохранить эмбеддинги в дисковый кэш: {e}")
+            if shared is not None:
+                shared.set_many(SHARED_NAMESPACE, [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in zip(miss_keys, vectors)
+                ])
+        return results
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts), "document", self.base.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed([text], "query", lambda batch: [self.base.embed_query(batch[0])])[0]
+
+    def embed_queries(self, texts):
+        """Векторизует несколько поисковых запросов одним батчем."""
+        return self._embed(list(texts), "query", self.base.embed_documents)
+
+    def get_stats(self) -> dict:
+        """Возвращает статистику попаданий в кэш."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_items"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"] + stats["shared_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+
+def compact_embedding_cache(embeddings) -> None:
+    """Сжимает дисковый кэш модели эмбеддингов, если он используется (см. EmbeddingDiskStore.compact)."""
+    disk = getattr(embeddings, "disk", None)
+    if disk is None:
+        return
+    try:
+        disk.compact()
+    except OSError as e:
+        logger.warning(f"Не удалось сжать дисковый кэш эмбеддингов: {e}")
+
+
+QUALITY_FILE = "quality.json"
+ONNX_FILE = "onnx/model.onnx"
+PROBE_TEXTS = (
+    "Создай виртуальную машину на Ubuntu с 2 ядрами и 4 ГБ памяти",
+    "Все ресурсы должны иметь метку cost_center",
+    "Запрещено открывать порт 22 для всего интернета",
+    "Сеть проекта использует диапазон 10.0.0.0/16",
+    "Резервные копии дисков хранятся 14 дней",
+    "Use t3.medium instances for staging workloads",
+    "Ansible playbook устанавливает nginx на группу серверов app",
+    "Бюджет проекта ограничен 100000 рублей в месяц",
+)
+MAX_PROBE_DOCUMENT_TEXTS = 200
+
+
+def embedding_model_id(model_name: str, backend: str) -> str:
+    """Идентификатор модели для ключей кэша и манифеста индекса (включает бэкенд)."""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def _safe_name(name: str) -> str:
+    return name.replace(os.sep, "_").replace("/", "_").replace("@", "_")
+
+
+def _backend_dir(model_name: str, backend: str):
+    return CACHE_DIR / "models" / _safe_name(embedding_model_id(model_name, backend))
+
+
+def _quantization_config() -> str:
+    """Выбирает набор инструкций для квантизации под текущий процессор."""
+    if EMBEDDING_QUANTIZATION_CONFIG != "auto":
+        return EMBEDDING_QUANTIZATION_CONFIG
+    return "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+
+
+def _configure_threads(backend: str) -> dict:
+    """Ограничивает число потоков инференса и возвращает параметры сессии ONNX Runtime."""
+    if EMBEDDING_THREADS <= 0:
+        return {}
+    if backend == "torch":
+        import torch
+        torch.set_num_threads(EMBEDDING_THREADS)
+        return {}
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = EMBEDDING_THREADS
+    return {"session_options": options}
+
+
+def _probe_texts() -> list:
+    """Тексты для проверки точности: фиксированные фразы и абзацы markdown-документации."""
+    texts = list(PROBE_TEXTS)
+    for path in sorted(DOCS_DIR.rglob("*.md")):
+        for paragraph in path.read_text(encoding="utf-8", errors="ignore").split("\n\n"):
+            paragraph = paragraph.strip()
+            if len(paragraph) > 40:
+                texts.append(paragraph[:2000])
+            if len(texts) >= MAX_PROBE_DOCUMENT_TEXTS:
+                return texts
+    return texts
+
+
+def check_embedding_tolerance(reference, candidate, texts, tolerance: float = EMBEDDING_TOLERANCE) -> dict:
+    """
+    Сравнивает векторы двух моделей на одних и тех же текстах.
+
+    Args:
+        reference: Исходная модель SentenceTransformer.
+        candidate: Проверяемая модель SentenceTransformer.
+        texts: Тексты для сравнения.
+        tolerance (float): Минимально допустимое косинусное сходство.
+
+    Returns:
+        dict: min_cosine, mean_cosine, число текстов и признак passed.
+    """
+    expected = reference.encode(list(texts), batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True)
+    actual = candidate.encode(list(texts), batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True)
+    cosines = np.sum(np.asarray(expected) * np.asarray(actual), axis=1)
+    return {
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "tolerance": tolerance,
+        "passed": bool(cosines.min() >= tolerance),
+    }
+
+
+@contextmanager
+def _export_lock(target):
+    """Межпроцессная блокировка экспорта модели в каталог target."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with open(target.parent / f"{target.name}.lock", "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_quality(model_name: str, backend: str):
+    """Читает отчет о проверке экспортированной модели (None, если модели нет или она не прошла проверку)."""
+    quality_path = _backend_dir(model_name, backend) / QUALITY_FILE
+    try:
+        quality = json.loads(quality_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return quality if quality.get("passed") else None
+
+
+def export_embedding_backend(model_name: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND,
+                             tolerance: float = EMBEDDING_TOLERANCE) -> dict:
+    """
+    Экспортирует модель в ONNX (при необходимости квантизует) и проверяет точность.
+
+    Модель собирается во временном каталоге под межпроцессной блокировкой
+    и переносится в cache/models/ вместе с результатом проверки (quality.json)
+    только после успешной проверки точности.
+
+    Args:
+        model_name (str): Имя модели sentence-transformers.
+        backend (str): 'onnx' или 'onnx-int8'.
+        tolerance (float): Минимально допустимое косинусное сходство с исходной моделью.
+
+    Returns:
+        dict: Отчет о проверке (см. check_embedding_tolerance) и имя файла модели.
+
+    Raises:
+        RuntimeError: Если экспорт не удался или векторы вышли за пределы допуска.
+    """
+    if backend == "torch":
+        return {"backend": "torch", "model": model_name}
+
+    with _export_lock(_backend_dir(model_name, backend)):
+        return _export_locked(model_name, backend, tolerance)
+
+
+def _export_locked(model_name: str, backend: str, tolerance: float) -> dict:
+    """Экспорт модели (вызывается под блокировкой _export_lock)."""
+    target = _backend_dir(model_name, backend)
+    tmp_dir = target.with_name(f"{target.name}.tmp-{uuid.uuid4().hex[:8]}")
+    try:
+        from sentence_transformers import SentenceTransformer
+
+        logger.info(f"Экспорт модели эмбеддингов {model_name} в ONNX ({backend})...")
+        reference = SentenceTransformer(model_name, backend="torch")
+        exported = SentenceTransformer(model_name, backend="onnx")
+        exported.save_pretrained(str(tmp_dir))
+
+        file_name = ONNX_FILE
+        if backend == "onnx-int8":
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+
+            config = _quantization_config()
+            export_dynamic_quantized_onnx_model(exported, quantization_config=config, model_name_or_path=str(tmp_dir))
+            file_name = f"onnx/model_qint8_{config}.onnx"
+
+        candidate = SentenceTransformer(str(tmp_dir), backend="onnx", model_kwargs={"file_name": file_name})
+        report = check_embedding_tolerance(reference, candidate, _probe_texts(), tolerance)
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        logger.error(f"Ошибка экспорта модели эмбеддингов: {str(e)}")
+        raise RuntimeError(f"Сбой компонента Embeddings: {str(e)}")
+
+    report.update({"backend": backend, "model": model_name, "file_name": file_name})
+    logger.info(
+        f"Проверка точности {backend}: минимальное сходство {report['min_cosine']:.4f}, "
+        f"среднее {report['mean_cosine']:.4f} (допуск {tolerance})."
+    )
+    if not report["passed"]:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise RuntimeError(
+            f"Сбой компонента Embeddings: векторы {backend} отличаются от исходных сильнее допуска "
+            f"(min cosine {report['min_cosine']:.4f} < {tolerance})"
+        )
+    (tmp_dir / QUALITY_FILE).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(tmp_dir, target)
+    return report
+
+
+def ensure_embedding_backend(model_name: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND) -> dict:
+    """
+    Экспортирует модель для бэкенда, если она еще не экспортирована (для индексатора и CLI).
+
+    Raises:
+        RuntimeError: Если экспорт не удался или векторы вышли за пределы допуска.
+    """
+    if backend == "torch":
+        return {"backend": "torch", "model": model_name}
+    quality = _read_quality(model_name, backend)
+    if quality is None:
+        with _export_lock(_backend_dir(model_name, backend)):
+            quality = _read_quality(model_name, backend) or _export_locked(model_name, backend, EMBEDDING_TOLERANCE)
+    return quality
+
+
+def resolve_embedding_backend(model_name: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND) -> str:
+    """
+    Возвращает бэкенд, доступный рабочему процессу без экспорта модели.
+
+    Если ONNX-модель не экспортирована или не прошла проверку точности,
+    используется torch (векторы совпадают с ONNX в пределах допуска).
+    """
+    if backend == "torch" or _read_quality(model_name, backend) is not None:
+        return backend
+    logger.warning(
+        f"Модель эмбеддингов {model_name} для бэкенда {backend} не экспортирована или не прошла "
+        f"проверку точности. Используется torch; для экспорта выполните python -m src.embeddings."
+    )
+    return "torch"
+
+
+def _load_backend(model_name: str, backend: str):
+    """Возвращает путь к модели и параметры SentenceTransformer для бэкенда."""
+    session = _configure_threads(backend)
+    if backend == "torch":
+        return model_name, {}
+    quality = _read_quality(model_name, backend)
+    model_dir = _backend_dir(model_name, backend)
+    return str(model_dir), {"backend": "onnx", "model_kwargs": {"file_name": quality["file_name"], **session}}
+
+
+def create_embeddings(model_name: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND):
+    """
+    Создает модель эмбеддингов HuggingFace, обернутую кэшем (если он включен).
+
+    Модель для ONNX-бэкендов не экспортируется: если она отсутствует,
+    используется torch (см. resolve_embedding_backend).
+
+    Args:
+        model_name (str): Имя модели sentence-transformers.
+        backend (str): Бэкенд инференса ('torch', 'onnx' или 'onnx-int8').
+
+    Returns:
+        Embeddings: Модель эмбеддингов.
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    backend = resolve_embedding_backend(model_name, backend)
+    model_path, model_kwargs = _load_backend(model_name, backend)
+    base = HuggingFaceEmbeddings(
+        model_name=model_path,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE}
+    )
+    if not EMBEDDING_CACHE_ENABLED:
+        return base
+
+    model_id = embedding_model_id(model_name, backend)
+    cache_dir = CACHE_DIR / "embeddings" / _safe_name(model_id)
+    return CachedEmbeddings(base, model_id, cache_dir=cache_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Экспорт модели эмбеддингов в ONNX и проверка точности.")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="Имя модели sentence-transformers")
+    parser.add_argument(
+        "--backend", choices=["onnx", "onnx-int8"],
+        default=EMBEDDING_BACKEND if EMBEDDING_BACKEND != "torch" else "onnx-int8",
+        help="Целевой бэкенд"
+    )
+    parser.add_argument("--tolerance", type=float, default=EMBEDDING_TOLERANCE, help="Минимальное косинусное сходство")
+    args = parser.parse_args()
+    print(json.dumps(export_embedding_backend(args.model, args.backend, args.tolerance), ensure_ascii=False, indent=2))
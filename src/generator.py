@@ -4,15 +4,25 @@
 Связывает извлеченный контекст из документации с пользовательским запросом,
 формирует абстрактный системный промпт и обращается к API LLM для генерации.
 """
-import os
+import time
+import asyncio
 import logging
+import contextlib
+from dataclasses import dataclass
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain.chat_models import init_chat_model
 
-from src.config import LLM_PROVIDER, LLM_MODEL_NAME, CUSTOM_LLM_URL
-from src.retriever import get_relevant_context
+from src.config import (
+    LLM_PROVIDER, LLM_MODEL_NAME, RESPONSE_CACHE_ENABLED, REPAIR_MAX_ATTEMPTS, REPAIR_TIME_BUDGET
+)
+from src.concurrency import llm_slot, run_blocking
+from src.llm_clients import get_llm_registry, llm_run_config, with_request_timeout
+from src.metrics import span
+from src.response_cache import get_response_cache
+from src.shared_cache import single_flight, asingle_flight
+from src.retriever import get_engine, get_relevant_context, aget_relevant_context
+from src.validator import ValidationResult, validate_iac_detailed
 
 logger = logging.getLogger(__name__)
 
@@ -25,48 +35,332 @@ def clean_markdown(text: str) -> str:
         lines.pop()
     return "\n".join(lines).strip()
 
+class MarkdownFenceStripper:
+    """
+    Потоковый аналог clean_markdown.
+
+    Принимает фрагменты ответа по мере генерации и возвращает текст,
+    готовый к выводу: открывающая строка ```lang отбрасывается сразу,
+    а пустые строки и строки, похожие на закрывающий ```, придерживаются
+    до тех пор, пока не станет ясно, что за ними следует код.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._buffer = ""
+        self._held = []
+
+    def feed(self, chunk: str) -> str:
+        """Добавляет очередной фрагмент ответа и возвращает текст для вывода."""
+        self._buffer += chunk
+        output = []
+
+        if not self._started:
+            self._buffer = self._buffer.lstrip()
+            if "\n" not in self._buffer:
+                return ""
+            first_line, self._buffer = self._buffer.split("\n", 1)
+            self._started = True
+            if not first_line.strip().startswith("```"):
+                output.append(first_line + "\n")
+
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            stripped = line.strip()
+            if not stripped or stripped.startswith("```"):
+                self._held.append(line)
+                continue
+            output.extend(held + "\n" for held in self._held)
+            self._held.clear()
+            output.append(line + "\n")
+        return "".join(output)
+
+    def finish(self) -> str:
+        """Завершает поток и возвращает оставшийся текст без закрывающего ```."""
+        tail = self._held + [self._buffer]
+        self._held, self._buffer = [], ""
+        if not self._started:
+            self._started = True
+            line = tail[-1].strip()
+            return "" if line.startswith("```") else line
+        while tail and not tail[-1].strip():
+            tail.pop()
+        if tail and tail[-1].strip().startswith("```"):
+            tail.pop()
+        return "\n".join(tail).rstrip()
+
 def get_llm():
     """
-    Инициализирует и возвращает объект языковой модели 
-    в зависимости от выбранного провайдера.
-    """
-    provider = LLM_PROVIDER.lower()
-    verify_ssl = os.getenv("CUSTOM_LLM_VERIFY_SSL", "true").lower() != "false"
-
-    if provider == "custom":
-        import httpx
-        from langchain_openai import ChatOpenAI
-        http_client = httpx.Client(verify=verify_ssl) if not verify_ssl else None
-        return ChatOpenAI(
-            base_url=CUSTOM_LLM_URL,
-            api_key=os.getenv("CUSTOM_LLM_KEY", "not-needed"),
-            model_name=LLM_MODEL_NAME,
-            temperature=0,
-            http_client=http_client
-        )
-        
-    elif provider == "gigachat":
-        from langchain_gigachat.chat_models import GigaChat
-        return GigaChat(
-            credentials=os.getenv("GIGACHAT_CREDENTIALS"),
-            model=LLM_MODEL_NAME,
-            verify_ssl_certs=verify_ssl,
-            temperature=0
-        )
-        
-    elif provider == "yandex":
-        from langchain_community.chat_models import ChatYandexGPT
-        return ChatYandexGPT(
-            model_name=LLM_MODEL_NAME,
-            temperature=0
-            )
-        
-    else:
-        return init_chat_model(
-            model=LLM_MODEL_NAME,
-            model_provider=provider,
-            temperature=0
+    Возвращает объект языковой модели для выбранного провайдера.
+
+    Экземпляр создается один раз на процесс и хранится в реестре клиентов
+    вместе с пулом HTTP-соединений (см. src.llm_clients).
+    """
+    return get_llm_registry().get(LLM_PROVIDER, LLM_MODEL_NAME)
+
+SYSTEM_PROMPT = """Ты – профессиональный DevOps-архитектор. Твоя цель – генерировать конфигурационные файлы {iac_tool} на основе предоставленного контекста.
+
+                        КОНТЕКСТ С КОРПОРАТИВНЫМИ ПРАВИЛАМИ:
+                        ====================
+                        {context}
+                        ====================
+
+                        ЖЕСТКИЕ ПРАВИЛА (STOP-RULES):
+                        1. ВЫВОД: Выведи АБСОЛЮТНО ЧИСТЫЙ текст файла. СТРОГО ЗАПРЕЩАЕТСЯ использовать markdown-разметку (никаких ```hcl или ```yaml).
+                        2. КОММЕНТАРИИ: Строго запрещено писать какие-либо пояснения, приветствия или комментарии до и после кода. Выдавай ТОЛЬКО рабочий синтаксис ресурсов и ничего более.
+                        3. СТАНДАРТЫ: Ты обязан неукоснительно применять все найденные в контексте внутренние регламенты, стандарты и политики. Игнорирование любых требований из контекста категорически запрещено!
+                        4. ФУНКЦИОНАЛЬНАЯ ПОЛНОТА: Код должен быть логически связанным и работоспособным. Используй свои внутренние знания о {iac_tool} и целевом облачном провайдере, чтобы самостоятельно добавить необходимые зависимости и сопутствующие ресурсы связности, без которых запрошенная инфраструктура не сможет функционировать.
+                        5. ЕСЛИ ТЫ НАПИШЕШЬ ТЕКСТ ПОМИМО КОДА – СИСТЕМА УПАДЕТ. Твой ответ должен начинаться сразу с кода.
+                        """
+
+REPAIR_PROMPT = """Ты – профессиональный DevOps-архитектор. Конфигурационный файл {iac_tool} не прошел синтаксическую проверку. Исправь ошибки, сохранив назначение и структуру ресурсов.
+
+                        КОНТЕКСТ С КОРПОРАТИВНЫМИ ПРАВИЛАМИ:
+                        ====================
+                        {context}
+                        ====================
+
+                        ОШИБКИ ПАРСЕРА:
+                        {errors}
+
+                        ЖЕСТКИЕ ПРАВИЛА (STOP-RULES):
+                        1. ВЫВОД: Выведи полный исправленный файл АБСОЛЮТНО ЧИСТЫМ текстом, без markdown-разметки.
+                        2. КОММЕНТАРИИ: Строго запрещено писать пояснения до и после кода.
+                        3. СТАНДАРТЫ: Исправления не должны нарушать требования из контекста.
+                        """
+
+@dataclass
+class GenerationResult:
+    """Результат генерации: код, его валидация и число попыток исправления."""
+    code: str
+    validation: ValidationResult
+    repair_attempts: int = 0
+    cached: bool = False
+
+    @property
+    def is_valid(self) -> bool:
+        return self.validation.is_valid
+
+def _build_chain(llm):
+    """Собирает цепочку генерации: промпт -> модель -> строковый ответ."""
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_PROMPT),
+        ("human", "{query}")
+    ])
+    return prompt | llm | StrOutputParser()
+
+def _clean_response(response: str) -> str:
+    with span("clean_markdown"):
+        return clean_markdown(response)
+
+def _build_repair_chain(llm):
+    """Собирает цепочку исправления: ошибочный код и ошибки парсера -> исправленный код."""
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", REPAIR_PROMPT),
+        ("human", "{code}")
+    ])
+    return prompt | llm | StrOutputParser()
+
+def _format_diagnostics(validation: ValidationResult) -> str:
+    lines = []
+    for diagnostic in validation.diagnostics:
+        position = f"строка {diagnostic.line}, столбец {diagnostic.column}: " if diagnostic.line else ""
+        lines.append(f"- {position}{diagnostic.message}")
+    return "\n".join(lines) or "- структура файла не распознана"
+
+def _repair_inputs(code: str, validation: ValidationResult, iac_tool: str, context: str) -> dict:
+    return {"context": context, "errors": _format_diagnostics(validation), "code": code, "iac_tool": iac_tool}
+
+def _repair_limit(max_attempts) -> int:
+    return REPAIR_MAX_ATTEMPTS if max_attempts is None else max(0, max_attempts)
+
+def _iter_repairs(code: str, iac_tool: str, context: str, llm, max_attempts=None, time_budget: float = REPAIR_TIME_BUDGET):
+    """
+    Исправляет невалидный код, возвращая модели ошибки парсера и уже найденный контекст.
+
+    Повторный поиск и расширение запроса не выполняются. Новая попытка
+    начинается, только если предыдущая не дала валидного кода, лимит попыток
+    не исчерпан и не истек бюджет времени (0 - без ограничения). Запрос
+    к модели ограничен остатком бюджета через таймаут клиента LLM.
+
+    Yields:
+        GenerationResult: Исходный результат, затем результат каждой попытки.
+    """
+    result = GenerationResult(code, validate_iac_detailed(code, iac_tool))
+    yield result
+    limit = _repair_limit(max_attempts)
+    deadline = time.monotonic() + time_budget if time_budget > 0 else None
+    chain = _build_repair_chain(llm) if limit else None
+
+    while not result.is_valid and result.repair_attempts < limit:
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if remaining is not None and remaining <= 0:
+            logger.warning(f"Бюджет времени на исправление ({time_budget} с) исчерпан.")
+            break
+        attempt = result.repair_attempts + 1
+        logger.info(f"Исправление кода по ошибкам валидатора: попытка {attempt} из {limit}")
+        inputs = _repair_inputs(result.code, result.validation, iac_tool, context)
+        # Вызов выполняется в текущем потоке: его длительность ограничивает таймаут
+        # запроса клиента LLM (остаток бюджета или LLM_HTTP_TIMEOUT)
+        attempt_chain = chain if remaining is None else _build_repair_chain(
+            with_request_timeout(llm, LLM_PROVIDER, remaining)
         )
+        started = time.monotonic()
+        try:
+            with span("repair_llm"):
+                response = attempt_chain.invoke(inputs, config=llm_run_config("repair"))
+        except Exception:
+            # Ошибка на исходе бюджета - это таймаут запроса, остальные ошибки пробрасываются
+            if remaining is None or time.monotonic() - started < remaining * 0.95:
+                raise
+            logger.warning(f"Бюджет времени на исправление ({time_budget} с) исчерпан во время попытки {attempt}.")
+            break
+        code = _clean_response(response)
+        result = GenerationResult(code, validate_iac_detailed(code, iac_tool), attempt)
+        yield result
+
+async def _avalidate(code: str, iac_tool: str) -> ValidationResult:
+    """Проверяет код в общем пуле потоков, не блокируя цикл событий."""
+    return await run_blocking(validate_iac_detailed, code, iac_tool)
+
+async def _aiter_repairs(code: str, iac_tool: str, context: str, llm, max_attempts=None,
+                         time_budget: float = REPAIR_TIME_BUDGET, validate=_avalidate):
+    """Асинхронная версия _iter_repairs: попытка прерывается по истечении бюджета времени."""
+    result = GenerationResult(code, await validate(code, iac_tool))
+    yield result
+    limit = _repair_limit(max_attempts)
+    deadline = time.monotonic() + time_budget if time_budget > 0 else None
+    chain = _build_repair_chain(llm) if limit else None
+
+    while not result.is_valid and result.repair_attempts < limit:
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if remaining is not None and remaining <= 0:
+            logger.warning(f"Бюджет времени на исправление ({time_budget} с) исчерпан.")
+            break
+        attempt = result.repair_attempts + 1
+        logger.info(f"Исправление кода по ошибкам валидатора: попытка {attempt} из {limit}")
+        try:
+            async with llm_slot(LLM_PROVIDER):
+                with span("repair_llm"):
+                    response = await asyncio.wait_for(
+                        chain.ainvoke(
+                            _repair_inputs(result.code, result.validation, iac_tool, context),
+                            config=llm_run_config("repair")
+                        ),
+                        timeout=remaining
+                    )
+        except asyncio.TimeoutError:
+            logger.warning(f"Бюджет времени на исправление ({time_budget} с) исчерпан во время попытки {attempt}.")
+            break
+        code = _clean_response(response)
+        result = GenerationResult(code, await validate(code, iac_tool), attempt)
+        yield result
+
+def repair_iac_script(code: str, iac_tool: str, context: str, llm=None, max_attempts=None,
+                      time_budget: float = REPAIR_TIME_BUDGET) -> GenerationResult:
+    """
+    Проверяет код и при ошибках синтаксиса пытается исправить его силами LLM.
+
+    Args:
+        code (str): Сгенерированный код.
+        iac_tool (str): Инструмент IaC.
+        context (str): Контекст, уже использованный при генерации.
+        llm: Языковая модель (по умолчанию - модель из конфигурации).
+        max_attempts (int): Максимум попыток (по умолчанию REPAIR_MAX_ATTEMPTS, 0 - без исправления).
+        time_budget (float): Бюджет времени на исправление в секундах (0 - без ограничения).
+
+    Returns:
+        GenerationResult: Последний полученный вариант кода и число попыток.
+    """
+    result = None
+    for result in _iter_repairs(code, iac_tool, context, llm or get_llm(), max_attempts, time_budget):
+        pass
+    return result
+
+def _cache_model() -> str:
+    return f"{LLM_PROVIDER}:{LLM_MODEL_NAME}"
+
+def _generation_flight(user_query: str, iac_tool: str, index_version, flight=single_flight):
+    """
+    Single-flight генерации: одинаковые одновременные запросы (в том числе на разных
+    воркерах) вызывают LLM один раз, остальные получают ответ из общего кэша.
+    Для асинхронных функций передается flight=asingle_flight.
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return contextlib.nullcontext()
+    cache = get_response_cache()
+    key = cache.key(iac_tool, _cache_model(), index_version, user_query)
+    return flight(f"generation:{key}", lambda: cache.peek(iac_tool, _cache_model(), index_version, user_query))
+
+def _cache_lookup(user_query: str, iac_tool: str):
+    """
+    Ищет ответ в кэше.
+
+    Returns:
+        tuple: (код или None, эмбеддинг запроса, версия индекса).
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return None, None, None
+    engine = get_engine()
+    index_version = engine.current_index_version()
+    with span("embedding"):
+        vector = engine.embeddings.embed_query(user_query)
+    code = get_response_cache().lookup(iac_tool, _cache_model(), index_version, user_query, vector)
+    if code is not None:
+        logger.info("Ответ найден в кэше. Обращение к LLM пропущено.")
+    return code, vector, index_version
+
+def _cache_store(user_query: str, iac_tool: str, result: GenerationResult, vector, index_version) -> None:
+    """Сохраняет ответ в кэш, только если он прошел валидацию (по уже полученному результату проверки)."""
+    if not RESPONSE_CACHE_ENABLED:
+        return
+    if result.is_valid:
+        get_response_cache().store(iac_tool, _cache_model(), index_version, user_query, result.code, vector)
+
+def generate_iac(user_query: str, iac_tool: str = "terraform", max_repair_attempts=None) -> GenerationResult:
+    """
+    Генерирует сценарий (IaC) и при ошибках синтаксиса исправляет его.
+
+    Args:
+        user_query (str): Описание требуемой инфраструктуры.
+        iac_tool (str): Инструмент IaC (по умолчанию 'terraform').
+        max_repair_attempts (int): Максимум попыток исправления (по умолчанию REPAIR_MAX_ATTEMPTS).
+
+    Returns:
+        GenerationResult: Код, результат валидации и число использованных попыток исправления.
+    """
+    logger.info(f"Генерация для {iac_tool.upper()} (Провайдер: {LLM_PROVIDER.upper()}, Модель: {LLM_MODEL_NAME})")
+
+    try:
+        cached, query_vector, index_version = _cache_lookup(user_query, iac_tool)
+        if cached is not None:
+            return GenerationResult(cached, validate_iac_detailed(cached, iac_tool), cached=True)
+
+        with _generation_flight(user_query, iac_tool, index_version) as shared:
+            if shared is not None:
+                return GenerationResult(shared, validate_iac_detailed(shared, iac_tool), cached=True)
+
+            llm = get_llm()
+            with span("retrieval"):
+                context = get_relevant_context(user_query, llm=llm, k=3, iac_tool=iac_tool)
+
+            chain = _build_chain(llm)
+
+            with span("generation_llm"):
+                response = chain.invoke({
+                    "context": context,
+                    "query": user_query,
+                    "iac_tool": iac_tool
+                }, config=llm_run_config("generation"))
+            logger.info("Генерация успешно завершена.")
+
+            result = repair_iac_script(_clean_response(response), iac_tool, context, llm, max_repair_attempts)
+            _cache_store(user_query, iac_tool, result, query_vector, index_version)
+            return result
+
+    except Exception as e:
+        logger.error(f"Ошибка при обращении к LLM: {str(e)}")
+        raise RuntimeError(f"Сбой компонента Generator: {str(e)}")
 
 def generate_iac_script(user_query: str, iac_tool: str = "terraform") -> str:
     """
@@ -79,44 +373,187 @@ def generate_iac_script(user_query: str, iac_tool: str = "terraform") -> str:
     Returns:
         str: Сгенерированный код конфигурации.
     """
+    return generate_iac(user_query, iac_tool).code
+
+def stream_iac_script(user_query: str, iac_tool: str = "terraform", max_repair_attempts=None):
+    """
+    Генерирует сценарий (IaC), отдавая ответ модели по мере его поступления.
+
+    Yields:
+        tuple: ("token", текст) для очередных фрагментов кода без markdown-разметки,
+            ("repair", GenerationResult) после каждой попытки исправления
+            и финальное ("done", GenerationResult) с итоговым кодом.
+    """
+    logger.info(f"Потоковая генерация для {iac_tool.upper()} (Провайдер: {LLM_PROVIDER.upper()}, Модель: {LLM_MODEL_NAME})")
+
+    try:
+        cached, query_vector, index_version = _cache_lookup(user_query, iac_tool)
+        if cached is not None:
+            yield "token", cached
+            yield "done", GenerationResult(cached, validate_iac_detailed(cached, iac_tool), cached=True)
+            return
+
+        with _generation_flight(user_query, iac_tool, index_version) as shared:
+            if shared is not None:
+                yield "token", shared
+                yield "done", GenerationResult(shared, validate_iac_detailed(shared, iac_tool), cached=True)
+                return
+
+            llm = get_llm()
+            with span("retrieval"):
+                context = get_relevant_context(user_query, llm=llm, k=3, iac_tool=iac_tool)
+
+            stripper = MarkdownFenceStripper()
+            parts = []
+            with span("generation_llm"):
+                for chunk in _build_chain(llm).stream({
+                    "context": context,
+                    "query": user_query,
+                    "iac_tool": iac_tool
+                }, config=llm_run_config("generation")):
+                    parts.append(chunk)
+                    text = stripper.feed(chunk)
+                    if text:
+                        yield "token", text
+            text = stripper.finish()
+            if text:
+                yield "token", text
+            logger.info("Генерация успешно завершена.")
+
+            result = None
+            for result in _iter_repairs(_clean_response("".join(parts)), iac_tool, context, llm, max_repair_attempts):
+                if result.repair_attempts:
+                    yield "repair", result
+            _cache_store(user_query, iac_tool, result, query_vector, index_version)
+            yield "done", result
+
+    except Exception as e:
+        logger.error(f"Ошибка при обращении к LLM: {str(e)}")
+        raise RuntimeError(f"Сбой компонента Generator: {str(e)}")
+
+async def agenerate_iac(user_query: str, iac_tool: str = "terraform", max_repair_attempts=None,
+                        validate=_avalidate) -> GenerationResult:
+    """
+    Асинхронная версия generate_iac для REST API.
+
+    Вызовы LLM выполняются через ainvoke с ограничением параллелизма
+    на провайдера, поиск по базе знаний и валидация - в пуле потоков.
+
+    Args:
+        user_query (str): Описание требуемой инфраструктуры.
+        iac_tool (str): Инструмент IaC (по умолчанию 'terraform').
+        max_repair_attempts (int): Максимум попыток исправления (по умолчанию REPAIR_MAX_ATTEMPTS).
+        validate: Асинхронная функция проверки (код, инструмент) -> ValidationResult
+            (пакетная обработка группирует проверки, см. src.batch).
+
+    Returns:
+        GenerationResult: Код, результат валидации и число использованных попыток исправления.
+    """
     logger.info(f"Генерация для {iac_tool.upper()} (Провайдер: {LLM_PROVIDER.upper()}, Модель: {LLM_MODEL_NAME})")
-    
+
     try:
-        llm = get_llm()
-        context = get_relevant_context(user_query, llm=llm, k=3)
-        
-        system_prompt = """Ты – профессиональный DevOps-архитектор. Твоя цель – генерировать конфигурационные файлы {iac_tool} на основе предоставленного контекста.
+        cached, query_vector, index_version = await run_blocking(_cache_lookup, user_query, iac_tool)
+        if cached is not None:
+            return GenerationResult(cached, await validate(cached, iac_tool), cached=True)
 
-                        КОНТЕКСТ С КОРПОРАТИВНЫМИ ПРАВИЛАМИ:
-                        ====================
-                        {context}
-                        ====================
+        async with _generation_flight(user_query, iac_tool, index_version, asingle_flight) as shared:
+            if shared is not None:
+                return GenerationResult(shared, await validate(shared, iac_tool), cached=True)
+
+            llm = get_llm()
+            with span("retrieval"):
+                context = await aget_relevant_context(user_query, llm=llm, k=3, provider=LLM_PROVIDER, iac_tool=iac_tool)
+
+            chain = _build_chain(llm)
+
+            async with llm_slot(LLM_PROVIDER):
+                with span("generation_llm"):
+                    response = await chain.ainvoke({
+                        "context": context,
+                        "query": user_query,
+                        "iac_tool": iac_tool
+                    }, config=llm_run_config("generation"))
+            logger.info("Генерация успешно завершена.")
+
+            result = None
+            async for result in _aiter_repairs(_clean_response(response), iac_tool, context, llm, max_repair_attempts,
+                                               validate=validate):
+                pass
+            await run_blocking(_cache_store, user_query, iac_tool, result, query_vector, index_version)
+            return result
+
+    except Exception as e:
+        logger.error(f"Ошибка при обращении к LLM: {str(e)}")
+        raise RuntimeError(f"Сбой компонента Generator: {str(e)}")
+
+async def agenerate_iac_script(user_query: str, iac_tool: str = "terraform") -> str:
+    """
+    Асинхронная версия generate_iac_script для REST API.
+
+    Args:
+        user_query (str): Описание требуемой инфраструктуры.
+        iac_tool (str): Инструмент IaC (по умолчанию 'terraform').
+
+    Returns:
+        str: Сгенерированный код конфигурации.
+    """
+    return (await agenerate_iac(user_query, iac_tool)).code
+
+async def astream_iac_script(user_query: str, iac_tool: str = "terraform", max_repair_attempts=None):
+    """
+    Асинхронная потоковая генерация сценария (IaC) для REST API.
+
+    Yields:
+        tuple: ("token", текст) для очередных фрагментов кода без markdown-разметки,
+            ("repair", GenerationResult) после каждой попытки исправления
+            и финальное ("done", GenerationResult) с итоговым кодом.
+    """
+    logger.info(f"Потоковая генерация для {iac_tool.upper()} (Провайдер: {LLM_PROVIDER.upper()}, Модель: {LLM_MODEL_NAME})")
+
+    try:
+        cached, query_vector, index_version = await run_blocking(_cache_lookup, user_query, iac_tool)
+        if cached is not None:
+            yield "token", cached
+            validation = await run_blocking(validate_iac_detailed, cached, iac_tool)
+            yield "done", GenerationResult(cached, validation, cached=True)
+            return
+
+        async with _generation_flight(user_query, iac_tool, index_version, asingle_flight) as shared:
+            if shared is not None:
+                yield "token", shared
+                validation = await run_blocking(validate_iac_detailed, shared, iac_tool)
+                yield "done", GenerationResult(shared, validation, cached=True)
+                return
+
+            llm = get_llm()
+            with span("retrieval"):
+                context = await aget_relevant_context(user_query, llm=llm, k=3, provider=LLM_PROVIDER, iac_tool=iac_tool)
+
+            stripper = MarkdownFenceStripper()
+            parts = []
+            async with llm_slot(LLM_PROVIDER):
+                with span("generation_llm"):
+                    async for chunk in _build_chain(llm).astream({
+                        "context": context,
+                        "query": user_query,
+                        "iac_tool": iac_tool
+                    }, config=llm_run_config("generation")):
+                        parts.append(chunk)
+                        text = stripper.feed(chunk)
+                        if text:
+                            yield "token", text
+            text = stripper.finish()
+            if text:
+                yield "token", text
+            logger.info("Генерация успешно завершена.")
+
+            result = None
+            async for result in _aiter_repairs(_clean_response("".join(parts)), iac_tool, context, llm, max_repair_attempts):
+                if result.repair_attempts:
+                    yield "repair", result
+            await run_blocking(_cache_store, user_query, iac_tool, result, query_vector, index_version)
+            yield "done", result
 
-                        ЖЕСТКИЕ ПРАВИЛА (STOP-RULES):
-                        1. ВЫВОД: Выведи АБСОЛЮТНО ЧИСТЫЙ текст файла. СТРОГО ЗАПРЕЩАЕТСЯ использовать markdown-разметку (никаких ```hcl или ```yaml).
-                        2. КОММЕНТАРИИ: Строго запрещено писать какие-либо пояснения, приветствия или комментарии до и после кода. Выдавай ТОЛЬКО рабочий синтаксис ресурсов и ничего более.
-                        3. СТАНДАРТЫ: Ты обязан неукоснительно применять все найденные в контексте внутренние регламенты, стандарты и политики. Игнорирование любых требований из контекста категорически запрещено!
-                        4. ФУНКЦИОНАЛЬНАЯ ПОЛНОТА: Код должен быть логически связанным и работоспособным. Используй свои внутренние знания о {iac_tool} и целевом облачном провайдере, чтобы самостоятельно добавить необходимые зависимости и сопутствующие ресурсы связности, без которых запрошенная инфраструктура не сможет функционировать.
-                        5. ЕСЛИ ТЫ НАПИШЕШЬ ТЕКСТ ПОМИМО КОДА – СИСТЕМА УПАДЕТ. Твой ответ должен начинаться сразу с кода.
-                        """
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("human", "{query}")
-        ])
-        
-        chain = prompt | llm | StrOutputParser()
-        
-        response = chain.invoke({
-            "context": context,
-            "query": user_query,
-            "iac_tool": iac_tool
-        })
-        logger.info("Генерация успешно завершена.")
-
-        cleaned_response = clean_markdown(response)
-        return cleaned_response
-        
     except Exception as e:
         logger.error(f"Ошибка при обращении к LLM: {str(e)}")
-        raise RuntimeError(f"Сбой компонента Generator: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Сбой компонента Generator: {str(e)}")
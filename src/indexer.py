@@ -2,82 +2,385 @@
 Модуль векторизации технической документации.
 
 Осуществляет чтение файлов документации из директории docs/,
-разбиение текста на фрагменты (чанки), преобразование их в векторные 
-представления (эмбеддинги) и сохранение в локальную базу данных Chroma.
+разбиение текста на фрагменты (чанки), преобразование их в векторные
+представления (эмбеддинги) и сохранение в векторное хранилище
+(Chroma или встроенный индекс NumPy, см. src.vector_store).
+
+По умолчанию индексация инкрементальная: манифест хранит хэши файлов
+и идентификаторы их чанков, поэтому повторно векторизуются только
+новые и измененные документы, а чанки удаленных файлов вычищаются из коллекции.
+
+Загрузка и разбиение файлов выполняются в пуле процессов, а готовые чанки
+потоком уходят на векторизацию и запись в базу ограниченными пакетами.
+
+Каждый чанк помечается метаданными (категория и тип документа по имени файла,
+формат, применимый инструмент IaC по содержимому), по которым retriever
+направляет подзапросы в нужное подмножество индекса.
 """
 
 import os
+import re
+import json
 import shutil
+import hashlib
 import logging
-from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader, BSHTMLLoader
+import argparse
+import uuid
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from langchain_community.document_loaders import TextLoader, PyPDFLoader, BSHTMLLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
 
-from src.config import DOCS_DIR, DB_DIR
+from src.config import DOCS_DIR, DB_DIR, INDEX_WORKERS, INDEX_BATCH_SIZE, HYBRID_SEARCH_ENABLED
+from src.embeddings import ensure_embedding_backend, compact_embedding_cache
+from src.lexical import BM25Index, BM25SegmentBuilder, update_index as update_lexical_index
+from src.retriever import get_engine, INDEX_VERSION_FILE, LEXICAL_INDEX_DIR
+from src.vector_store import create_vector_store, vector_store_id
 
 logger = logging.getLogger(__name__)
 
-def create_vector_db() -> None:
+MANIFEST_FILE = "index_manifest.json"
+MANIFEST_VERSION = 5
+LEXICAL_PAGE_SIZE = 5000
+
+CATEGORY_KEYWORDS = {
+    "security": ("security", "безопасн", "firewall", "access"),
+    "budget": ("budget", "cost", "pricing", "tariff", "бюджет", "тариф"),
+    "architecture": ("architecture", "topology", "архитектур"),
+    "standards": ("standard", "corporate", "стандарт"),
+}
+DOC_TYPE_KEYWORDS = {
+    "rules": ("rules", "policy", "правила", "политик"),
+    "guidelines": ("guidelines", "guide", "рекомендац"),
+    "standards": ("standards", "standard", "стандарт"),
+}
+TOOL_PATTERNS = {
+    "terraform": re.compile(r"terraform|\bhcl\b|resource\s+\"", re.IGNORECASE),
+    "ansible": re.compile(r"ansible|playbook", re.IGNORECASE),
+}
+
+LOADERS = {
+    ".md": (TextLoader, {'encoding': 'utf-8'}),
+    ".pdf": (PyPDFLoader, {}),
+    ".html": (BSHTMLLoader, {'open_encoding': 'utf-8', 'bs_kwargs': {'features': 'html.parser'}}),
+}
+
+def _write_index_version() -> None:
+    """Фиксирует новую версию индекса, по которой работающие процессы узнают о пересборке."""
+    (DB_DIR / INDEX_VERSION_FILE).write_text(uuid.uuid4().hex, encoding="utf-8")
+
+def _file_hash(path) -> str:
+    """Вычисляет SHA-256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _chunk_ids(rel_path: str, chunks) -> list:
+    """
+    Формирует стабильные идентификаторы чанков по хэшу их содержимого.
+
+    Позиция чанка в идентификатор не входит: правка текста выше по файлу не меняет
+    идентификаторы остальных чанков, и они не векторизуются повторно. Одинаковые
+    чанки одного файла различаются счетчиком вхождений. Смещение start_index
+    хранится только в метаданных (при сборке контекста оно сверяется с текстом).
+    """
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        base = hashlib.sha256(f"{rel_path}\0{chunk.page_content}".encode("utf-8")).hexdigest()
+        seen[base] = seen.get(base, 0) + 1
+        ids.append(base if seen[base] == 1 else f"{base}-{seen[base]}")
+    return ids
+
+def _load_manifest(model_name: str, store_id: str):
+    """Читает манифест индекса. Возвращает None, если он отсутствует или устарел."""
+    manifest_path = DB_DIR / MANIFEST_FILE
+    if not manifest_path.exists():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Манифест индекса поврежден и будет пересоздан: {e}")
+        return None
+    if (manifest.get("version") != MANIFEST_VERSION or manifest.get("model") != model_name
+            or manifest.get("store") != store_id):
+        logger.info("Манифест индекса создан другой версией индексатора, модели или хранилища.")
+        return None
+    return manifest
+
+def _save_manifest(manifest: dict) -> None:
+    """Атомарно сохраняет манифест индекса."""
+    manifest_path = DB_DIR / MANIFEST_FILE
+    tmp_path = manifest_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp_path, manifest_path)
+
+def _discover_files() -> dict:
+    """Находит все поддерживаемые файлы документации (относительный путь -> абсолютный)."""
+    files = {}
+    for path in sorted(DOCS_DIR.rglob("*")):
+        if path.is_file() and path.suffix.lower() in LOADERS:
+            files[path.relative_to(DOCS_DIR).as_posix()] = path
+    return files
+
+def _match_keywords(text: str, keywords: dict, default: str) -> str:
+    for name, words in keywords.items():
+        if any(word in text for word in words):
+            return name
+    return default
+
+def _file_metadata(rel_path: str) -> dict:
+    """Определяет категорию, тип и формат документа по его пути."""
+    name = rel_path.lower()
+    return {
+        "category": _match_keywords(name, CATEGORY_KEYWORDS, "general"),
+        "doc_type": _match_keywords(os.path.basename(name), DOC_TYPE_KEYWORDS, "document"),
+        "doc_format": os.path.splitext(name)[1].lstrip("."),
+    }
+
+def _detect_iac_tool(text: str) -> str:
+    """Определяет инструмент IaC, к которому относится фрагмент ('any' - общий для всех)."""
+    tools = [tool for tool, pattern in TOOL_PATTERNS.items() if pattern.search(text)]
+    return tools[0] if len(tools) == 1 else "any"
+
+def _tag_chunks(rel_path: str, chunks) -> list:
+    """Добавляет к чанкам метаданные для фильтрации при поиске."""
+    metadata = _file_metadata(rel_path)
+    for chunk in chunks:
+        chunk.metadata.update(metadata)
+        chunk.metadata["iac_tool"] = _detect_iac_tool(chunk.page_content)
+    return chunks
+
+_text_splitter = None
+
+def _get_text_splitter():
+    """Возвращает разделитель текста (один экземпляр на процесс-воркер)."""
+    global _text_splitter
+    if _text_splitter is None:
+        _text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=2000,
+            chunk_overlap=300,
+            separators=["\n\n", "\n", " ", ""],
+            add_start_index=True
+        )
+    return _text_splitter
+
+def _process_file(rel_path: str, path: str, known_hash):
+    """
+    Хэширует, загружает и разбивает на чанки один файл (выполняется в пуле процессов).
+
+    Returns:
+        tuple: (rel_path, file_hash, chunks, error). Для неизмененных файлов
+            chunks равен None, при ошибке загрузки заполнено поле error.
+    """
+    file_hash = _file_hash(path)
+    if file_hash == known_hash:
+        return rel_path, file_hash, None, None
+    try:
+        suffix = os.path.splitext(path)[1].lower()
+        loader_cls, loader_kwargs = LOADERS[suffix]
+        documents = loader_cls(path, **loader_kwargs).load()
+        return rel_path, file_hash, _tag_chunks(rel_path, _get_text_splitter().split_documents(documents)), None
+    except Exception as e:
+        return rel_path, file_hash, None, str(e)
+
+def _iter_processed_files(files: dict, indexed: dict, workers: int):
+    """
+    Обрабатывает файлы в пуле процессов и отдает результаты по мере готовности.
+
+    Число одновременно обрабатываемых файлов ограничено, чтобы не держать
+    в памяти чанки всего корпуса документации.
+    """
+    tasks = [
+        (rel_path, str(path), indexed.get(rel_path, {}).get("hash"))
+        for rel_path, path in files.items()
+    ]
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _process_file(*task)
+        return
+
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        task_iter = iter(tasks)
+        for task in task_iter:
+            pending.add(pool.submit(_process_file, *task))
+            if len(pending) >= max_in_flight:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+            for task in task_iter:
+                pending.add(pool.submit(_process_file, *task))
+                if len(pending) >= max_in_flight:
+                    break
+
+class _BatchWriter:
+    """Накапливает чанки и записывает их в хранилище пакетами фиксированного размера."""
+
+    def __init__(self, vector_db, batch_size: int):
+        self.vector_db = vector_db
+        self.batch_size = max(1, batch_size)
+        self.chunks = []
+        self.ids = []
+        self.written = 0
+
+    def add(self, chunks, ids) -> None:
+        self.chunks.extend(chunks)
+        self.ids.extend(ids)
+        while len(self.chunks) >= self.batch_size:
+            self._write(self.batch_size)
+
+    def flush(self) -> None:
+        while self.chunks:
+            self._write(self.batch_size)
+
+    def _write(self, size: int) -> None:
+        batch_chunks, self.chunks = self.chunks[:size], self.chunks[size:]
+        batch_ids, self.ids = self.ids[:size], self.ids[size:]
+        self.vector_db.add_documents(documents=batch_chunks, ids=batch_ids)
+        self.written += len(batch_chunks)
+        logger.info(f"Записан пакет из {len(batch_chunks)} чанков (всего {self.written}).")
+
+def _build_lexical_index(vector_db) -> None:
+    """
+    Строит лексический индекс BM25 по всем фрагментам хранилища.
+
+    Нужен, только если индекс отсутствует при непустом хранилище (например,
+    гибридный поиск включен после индексации); обычно индекс обновляется
+    инкрементально сегментами добавленных фрагментов.
+    """
+    logger.info("Построение лексического индекса BM25 по всему хранилищу...")
+    lexical_dir = DB_DIR / LEXICAL_INDEX_DIR
+    if lexical_dir.exists():
+        shutil.rmtree(lexical_dir)
+    builder = BM25SegmentBuilder()
+    for page_ids, page_texts in vector_db.iter_texts(LEXICAL_PAGE_SIZE):
+        builder.add(page_ids, page_texts)
+    update_lexical_index(lexical_dir, builder)
+    logger.info(f"Лексический индекс BM25 построен: {len(builder)} фрагментов.")
+
+def create_vector_db(incremental: bool = True, workers: int = INDEX_WORKERS,
+                     batch_size: int = INDEX_BATCH_SIZE) -> None:
     """
-    Создает и сохраняет векторную базу данных на основе файлов из DOCS_DIR.
-    
+    Создает или обновляет векторную базу данных на основе файлов из DOCS_DIR.
+
+    Args:
+        incremental (bool): Обновлять коллекцию на месте, векторизуя только
+            новые и измененные файлы. При отсутствии совместимого манифеста
+            автоматически выполняется полная пересборка.
+        workers (int): Число процессов для загрузки и разбиения файлов.
+        batch_size (int): Размер пакета чанков для векторизации и записи в базу.
+
     Raises:
         RuntimeError: В случае ошибки при чтении файлов или создании БД.
     """
     logger.info("Запуск процесса индексации документации.")
-    
+
     try:
         logger.info(f"Поиск файлов документации в директории {DOCS_DIR}...")
-        
-        loaders = [
-            DirectoryLoader(str(DOCS_DIR), glob="**/*.md", loader_cls=TextLoader, loader_kwargs={'encoding': 'utf-8'}),
-            DirectoryLoader(str(DOCS_DIR), glob="**/*.pdf", loader_cls=PyPDFLoader),
-            DirectoryLoader(str(DOCS_DIR), glob="**/*.html", loader_cls=BSHTMLLoader, loader_kwargs={'open_encoding': 'utf-8', 'bs_kwargs': {'features': 'html.parser'}})
-        ]
-
-        documents = []
-        for loader in loaders:
-            try:
-                docs = loader.load()
-                documents.extend(docs)
-                logger.info(f"Загружено {len(docs)} документов формата {loader.glob}")
-            except Exception as e:
-                logger.warning(f"Ошибка загрузки файлов по маске {loader.glob}: {e}")
-
-        if not documents:
+        files = _discover_files()
+
+        engine = get_engine()
+        ensure_embedding_backend(engine.model_name, engine.backend)
+        store_id = vector_store_id()
+        manifest = _load_manifest(engine.embedding_id, store_id) if incremental else None
+
+        if manifest is None and not files:
             logger.warning("Директория с документацией пуста. Индексация прервана.")
             return
 
-        logger.info(f"Успешно загружено документов: {len(documents)}")
+        if manifest is None:
+            logger.info("Выполняется полная пересборка индекса.")
+            if os.path.exists(DB_DIR):
+                logger.info("Удаление предыдущей версии векторной базы данных...")
+                engine.release()
+                shutil.rmtree(DB_DIR)
+            DB_DIR.mkdir(parents=True, exist_ok=True)
+            manifest = {"version": MANIFEST_VERSION, "model": engine.embedding_id, "store": store_id, "files": {}}
 
-        logger.info("Разбиение документов на текстовые фрагменты...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000,
-            chunk_overlap=300,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        chunks = text_splitter.split_documents(documents)
-        logger.info(f"Сформировано текстовых фрагментов (чанков): {len(chunks)}")
+        vector_db = create_vector_store(DB_DIR, engine.embeddings)
+        indexed = manifest["files"]
+        writer = _BatchWriter(vector_db, batch_size)
+        added, deleted, changed_files = 0, 0, 0
 
-        logger.info("Загрузка модели эмбеддингов (paraphrase-multilingual-MiniLM-L12-v2)...")
-        embeddings = HuggingFaceEmbeddings(model_name="paraphrase-multilingual-MiniLM-L12-v2")
+        lexical_dir = DB_DIR / LEXICAL_INDEX_DIR
+        if not HYBRID_SEARCH_ENABLED and lexical_dir.exists():
+            # Без гибридного поиска индекс не обновляется и устарел бы при повторном включении
+            shutil.rmtree(lexical_dir)
+        lexical_rebuild = HYBRID_SEARCH_ENABLED and bool(indexed) and not BM25Index.exists(lexical_dir)
+        lexical_added = BM25SegmentBuilder() if HYBRID_SEARCH_ENABLED and not lexical_rebuild else None
+        lexical_removed = []
 
-        if os.path.exists(DB_DIR):
-            logger.info("Удаление предыдущей версии векторной базы данных...")
-            shutil.rmtree(DB_DIR)
+        for rel_path in sorted(set(indexed) - set(files)):
+            stale_ids = indexed.pop(rel_path)["chunks"]
+            vector_db.delete(stale_ids)
+            lexical_removed.extend(stale_ids)
+            deleted += len(stale_ids)
+            changed_files += 1
+            logger.info(f"Удален из индекса: {rel_path} ({len(stale_ids)} чанков)")
+
+        logger.info(f"Обработка {len(files)} файлов в {max(1, workers)} процессах...")
+        for rel_path, file_hash, chunks, error in _iter_processed_files(files, indexed, workers):
+            if error is not None:
+                logger.warning(f"Ошибка загрузки файла {rel_path}: {error}")
+                continue
+            if chunks is None:
+                continue
+
+            entry = indexed.get(rel_path)
+            ids = _chunk_ids(rel_path, chunks)
+            old_ids = set(entry["chunks"]) if entry else set()
+            new_ids = set(ids)
+
+            stale_ids = sorted(old_ids - new_ids)
+            if stale_ids:
+                vector_db.delete(stale_ids)
+                lexical_removed.extend(stale_ids)
+            fresh = [(chunk, chunk_id) for chunk, chunk_id in zip(chunks, ids) if chunk_id not in old_ids]
+            if fresh:
+                writer.add([c for c, _ in fresh], [i for _, i in fresh])
+                if lexical_added is not None:
+                    lexical_added.add([i for _, i in fresh], [c.page_content for c, _ in fresh])
+
+            indexed[rel_path] = {"hash": file_hash, "chunks": ids}
+            added += len(fresh)
+            deleted += len(stale_ids)
+            changed_files += 1
+            logger.info(f"Проиндексирован {rel_path}: +{len(fresh)} / -{len(stale_ids)} чанков")
+
+        writer.flush()
+        vector_db.persist()
+        compact_embedding_cache(engine.embeddings)
+
+        if not changed_files and not lexical_rebuild:
+            logger.info("Документация не изменилась. Индекс актуален.")
+            return
 
-        logger.info("Построение индексов и сохранение в базу Chroma...")
-        Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=str(DB_DIR)
+        if lexical_rebuild:
+            _build_lexical_index(vector_db)
+        elif HYBRID_SEARCH_ENABLED:
+            update_lexical_index(lexical_dir, lexical_added, lexical_removed)
+            logger.info(f"Лексический индекс BM25 обновлен: +{len(lexical_added)} / -{len(lexical_removed)} фрагментов.")
+        _save_manifest(manifest)
+        _write_index_version()
+        engine.reload()
+        logger.info(
+            f"Векторная база данных обновлена: измененных файлов {changed_files}, "
+            f"добавлено чанков {added}, удалено {deleted}."
         )
-        logger.info("Векторная база данных успешно сформирована и сохранена.")
 
     except Exception as e:
         logger.error(f"Произошла ошибка в процессе индексации: {str(e)}")
         raise RuntimeError(f"Сбой индексации: {str(e)}")
 
 if __name__ == "__main__":
-    create_vector_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Индексация документации в векторную базу данных.")
+    parser.add_argument("--full", action="store_true", help="Полная пересборка индекса вместо инкрементального обновления")
+    parser.add_argument("--workers", type=int, default=INDEX_WORKERS, help="Число процессов загрузки и разбиения файлов")
+    parser.add_argument("--batch-size", type=int, default=INDEX_BATCH_SIZE, help="Размер пакета чанков при записи в базу")
+    args = parser.parse_args()
+    create_vector_db(incremental=not args.full, workers=args.workers, batch_size=args.batch_size)
@@ -0,0 +1,347 @@
+"""
+Лексический поиск BM25 по фрагментам документации.
+
+Дополняет плотный поиск MiniLM точным совпадением идентификаторов
+(типы инстансов, CIDR-диапазоны, названия тарифов, ключи меток).
+Индекс хранится на диске в компактном CSR-виде (массивы NumPy, которые
+открываются через memory map), поэтому загрузка почти мгновенна,
+а поиск сводится к векторизованному суммированию по спискам вхождений.
+
+Индекс состоит из неизменяемых сегментов: каждый запуск индексатора
+токенизирует только добавленные фрагменты и записывает их новым сегментом,
+а удаленные фрагменты помечаются в списке удаленных своего сегмента.
+Когда сегментов или удаленных записей становится много, сегменты сливаются
+в один векторизованными операциями над списками вхождений, без повторного
+чтения текстов. Состав индекса описывает файл index.json, который
+заменяется атомарно.
+"""
+
+import os
+import re
+import json
+import uuid
+import shutil
+import logging
+from collections import Counter
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[0-9a-zа-яё](?:[0-9a-zа-яё._:/\-]*[0-9a-zа-яё])?", re.IGNORECASE)
+SUBTOKEN_PATTERN = re.compile(r"[._:/\-]+")
+
+INDEX_FILE = "index.json"
+MAX_SEGMENTS = 8
+MAX_DELETED_RATIO = 0.2
+
+
+def tokenize(text: str) -> list:
+    """
+    Разбивает текст на термы.
+
+    Составные идентификаторы (t3.medium, 10.0.0.0/16, cost_center) сохраняются
+    целиком и дополнительно разбиваются на части, чтобы находиться
+    как по точному значению, так и по отдельным словам.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = SUBTOKEN_PATTERN.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class BM25Segment:
+    """
+    Неизменяемый сегмент инвертированного индекса в формате CSR.
+
+    Для терма t списки вхождений хранятся в postings_docs/postings_tf
+    на отрезке [offsets[t], offsets[t + 1]).
+    """
+
+    def __init__(self, name, ids, vocab, offsets, postings_docs, postings_tf, doc_len):
+        self.name = name
+        self.ids = ids
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf
+        self.doc_len = doc_len
+
+    def save(self, directory) -> None:
+        path = directory / self.name
+        path.mkdir(parents=True)
+        np.save(path / "offsets.npy", self.offsets)
+        np.save(path / "postings_docs.npy", self.postings_docs)
+        np.save(path / "postings_tf.npy", self.postings_tf)
+        np.save(path / "doc_len.npy", self.doc_len)
+        (path / "vocab.json").write_text(json.dumps(self.vocab, ensure_ascii=False), encoding="utf-8")
+        (path / "ids.json").write_text(json.dumps(self.ids), encoding="utf-8")
+
+    @classmethod
+    def load(cls, directory, name: str):
+        path = directory / name
+        return cls(
+            name=name,
+            ids=json.loads((path / "ids.json").read_text(encoding="utf-8")),
+            vocab=json.loads((path / "vocab.json").read_text(encoding="utf-8")),
+            offsets=np.load(path / "offsets.npy", mmap_mode="r"),
+            postings_docs=np.load(path / "postings_docs.npy", mmap_mode="r"),
+            postings_tf=np.load(path / "postings_tf.npy", mmap_mode="r"),
+            doc_len=np.load(path / "doc_len.npy"),
+        )
+
+    def df(self, term: str) -> int:
+        term_idx = self.vocab.get(term)
+        return int(self.offsets[term_idx + 1] - self.offsets[term_idx]) if term_idx is not None else 0
+
+
+class BM25SegmentBuilder:
+    """Накапливает списки вхождений добавляемых фрагментов (тексты не сохраняются)."""
+
+    def __init__(self):
+        self.ids = []
+        self.vocab = {}
+        self.term_docs = []
+        self.term_tfs = []
+        self.doc_len = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, ids, texts) -> None:
+        for doc_id, text in zip(ids, texts):
+            doc_idx = len(self.ids)
+            counts = Counter(tokenize(text or ""))
+            self.ids.append(doc_id)
+            self.doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_idx = self.vocab.setdefault(term, len(self.vocab))
+                if term_idx == len(self.term_docs):
+                    self.term_docs.append([])
+                    self.term_tfs.append([])
+                self.term_docs[term_idx].append(doc_idx)
+                self.term_tfs[term_idx].append(tf)
+
+    def build(self) -> BM25Segment:
+        lengths = np.fromiter((len(d) for d in self.term_docs), dtype=np.int64, count=len(self.term_docs))
+        offsets = np.zeros(len(self.term_docs) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        total = int(offsets[-1])
+        postings_docs = np.fromiter((d for docs in self.term_docs for d in docs), dtype=np.int32, count=total)
+        postings_tf = np.fromiter(
+            (min(tf, 65535) for tfs in self.term_tfs for tf in tfs), dtype=np.uint16, count=total
+        )
+        return BM25Segment(
+            _segment_name(), list(self.ids), self.vocab, offsets, postings_docs, postings_tf,
+            np.asarray(self.doc_len, dtype=np.int32)
+        )
+
+
+def _segment_name() -> str:
+    return f"seg-{uuid.uuid4().hex[:12]}"
+
+
+def _merge_segments(segments, deleted: dict) -> BM25Segment:
+    """Сливает сегменты в один, отбрасывая удаленные фрагменты (без повторной токенизации)."""
+    vocab = {}
+    ids, doc_len_parts, term_parts, doc_parts, tf_parts = [], [], [], [], []
+    base = 0
+    for segment in segments:
+        removed = deleted.get(segment.name, ())
+        live = np.fromiter((doc_id not in removed for doc_id in segment.ids), dtype=bool, count=len(segment.ids))
+        new_doc = np.cumsum(live) - 1 + base
+        terms = sorted(segment.vocab, key=segment.vocab.get)
+        global_terms = np.fromiter((vocab.setdefault(t, len(vocab)) for t in terms), dtype=np.int64, count=len(terms))
+        posting_terms = np.repeat(global_terms, np.diff(np.asarray(segment.offsets)))
+        docs = np.asarray(segment.postings_docs)
+        keep = live[docs]
+        term_parts.append(posting_terms[keep])
+        doc_parts.append(new_doc[docs[keep]])
+        tf_parts.append(np.asarray(segment.postings_tf)[keep])
+        ids.extend(doc_id for doc_id, alive in zip(segment.ids, live) if alive)
+        doc_len_parts.append(np.asarray(segment.doc_len)[live])
+        base += int(live.sum())
+
+    terms = np.concatenate(term_parts) if term_parts else np.zeros(0, dtype=np.int64)
+    order = np.argsort(terms, kind="stable")
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=len(vocab)), out=offsets[1:])
+    postings_docs = (np.concatenate(doc_parts) if doc_parts else np.zeros(0, np.int64))[order].astype(np.int32)
+    postings_tf = (np.concatenate(tf_parts) if tf_parts else np.zeros(0, np.uint16))[order].astype(np.uint16)
+    doc_len = np.concatenate(doc_len_parts).astype(np.int32) if doc_len_parts else np.zeros(0, np.int32)
+    return BM25Segment(_segment_name(), ids, vocab, offsets, postings_docs, postings_tf, doc_len)
+
+
+class BM25Index:
+    """
+    Индекс BM25 из нескольких сегментов.
+
+    Статистика корпуса (число фрагментов, средняя длина, частоты термов)
+    считается по всем сегментам, поэтому оценки не зависят от того, как
+    фрагменты распределены по сегментам. Частоты термов до слияния учитывают
+    и удаленные фрагменты - как и в Lucene, это небольшая погрешность idf.
+    """
+
+    def __init__(self, segments, deleted: dict = None, k1: float = 1.5, b: float = 0.75):
+        self.segments = segments
+        self.deleted = {name: set(ids) for name, ids in (deleted or {}).items()}
+        self.k1 = k1
+        self.b = b
+
+        self._live = []
+        total_len = 0
+        for segment in segments:
+            removed = self.deleted.get(segment.name, ())
+            live = np.fromiter((doc_id not in removed for doc_id in segment.ids), dtype=bool, count=len(segment.ids))
+            self._live.append(live)
+            total_len += int(np.asarray(segment.doc_len)[live].sum())
+        self.n_docs = int(sum(live.sum() for live in self._live))
+        self.avgdl = total_len / self.n_docs if self.n_docs else 0.0
+        self._norm = [
+            (k1 * (1 - b + b * np.asarray(segment.doc_len) / self.avgdl)).astype(np.float32)
+            if self.n_docs else np.asarray(segment.doc_len, dtype=np.float32)
+            for segment in segments
+        ]
+
+    @staticmethod
+    def exists(directory) -> bool:
+        return (directory / INDEX_FILE).exists()
+
+    @classmethod
+    def load(cls, directory):
+        """Загружает индекс с диска (массивы открываются через memory map)."""
+        for attempt in range(2):
+            meta = json.loads((directory / INDEX_FILE).read_text(encoding="utf-8"))
+            try:
+                segments = [BM25Segment.load(directory, name) for name in meta["segments"]]
+                return cls(segments, meta.get("deleted"), k1=meta["k1"], b=meta["b"])
+            except FileNotFoundError:
+                # Сегмент удален писателем между чтением index.json и открытием файлов
+                if attempt:
+                    raise
+
+    def save(self, directory, fresh=()) -> None:
+        """
+        Записывает новые сегменты и атомарно заменяет описание индекса.
+
+        Сегменты, не входящие ни в новое, ни в предыдущее описание, удаляются:
+        предыдущие остаются доступны процессам, еще не перезагрузившим индекс.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        previous = set()
+        if self.exists(directory):
+            previous = set(json.loads((directory / INDEX_FILE).read_text(encoding="utf-8"))["segments"])
+        for segment in fresh:
+            segment.save(directory)
+
+        names = [segment.name for segment in self.segments]
+        meta = {
+            "segments": names,
+            "deleted": {name: sorted(ids) for name, ids in self.deleted.items() if ids and name in names},
+            "k1": self.k1,
+            "b": self.b,
+        }
+        tmp_path = directory / f"{INDEX_FILE}.tmp"
+        tmp_path.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp_path, directory / INDEX_FILE)
+
+        for path in directory.iterdir():
+            if path.is_dir() and path.name not in previous and path.name not in names:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def search(self, query: str, k: int = 10) -> list:
+        """
+        Ищет фрагменты по запросу.
+
+        Returns:
+            list: Пары (идентификатор фрагмента, оценка BM25) по убыванию оценки.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.n_docs:
+            return []
+        idf = {}
+        for term in terms:
+            df = sum(segment.df(term) for segment in self.segments)
+            if df:
+                idf[term] = float(np.log1p((self.n_docs - df + 0.5) / (df + 0.5)))
+        if not idf:
+            return []
+
+        hits = []
+        for segment, live, norm in zip(self.segments, self._live, self._norm):
+            docs_parts, score_parts = [], []
+            for term, weight in idf.items():
+                term_idx = segment.vocab.get(term)
+                if term_idx is None:
+                    continue
+                start, end = segment.offsets[term_idx], segment.offsets[term_idx + 1]
+                docs = np.asarray(segment.postings_docs[start:end])
+                tf = np.asarray(segment.postings_tf[start:end], dtype=np.float32)
+                docs_parts.append(docs)
+                score_parts.append(weight * tf * (self.k1 + 1) / (tf + norm[docs]))
+            if not docs_parts:
+                continue
+            scores = np.bincount(
+                np.concatenate(docs_parts), weights=np.concatenate(score_parts), minlength=len(segment.ids)
+            )
+            scores[~live] = 0.0
+            top_k = min(k, int(np.count_nonzero(scores)))
+            if top_k <= 0:
+                continue
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            hits.extend((float(scores[i]), segment.ids[i]) for i in top)
+
+        hits.sort(key=lambda hit: (-hit[0], hit[1]))
+        return [(doc_id, score) for score, doc_id in hits[:k]]
+
+
+def update_index(directory, added: BM25SegmentBuilder = None, removed=(), k1: float = 1.5, b: float = 0.75) -> BM25Index:
+    """
+    Добавляет в индекс сегмент с новыми фрагментами и помечает удаленные.
+
+    Фрагменты, идентификаторы которых добавлены повторно, удаляются из старых
+    сегментов. При превышении MAX_SEGMENTS сегментов или доли удаленных
+    MAX_DELETED_RATIO все сегменты сливаются в один.
+
+    Args:
+        directory: Каталог индекса.
+        added (BM25SegmentBuilder): Добавленные фрагменты (опционально).
+        removed: Идентификаторы удаленных фрагментов.
+
+    Returns:
+        BM25Index: Обновленный индекс.
+    """
+    index = BM25Index.load(directory) if BM25Index.exists(directory) else BM25Index([], k1=k1, b=b)
+    segments = list(index.segments)
+    deleted = {name: set(ids) for name, ids in index.deleted.items()}
+
+    stale = set(removed)
+    if added is not None and len(added):
+        stale.update(added.ids)
+    if stale:
+        for segment in segments:
+            hit = stale.intersection(segment.ids)
+            if hit:
+                deleted.setdefault(segment.name, set()).update(hit)
+
+    fresh = []
+    if added is not None and len(added):
+        fresh.append(added.build())
+        segments.append(fresh[-1])
+
+    total = sum(len(segment.ids) for segment in segments)
+    removed_count = sum(len(ids) for ids in deleted.values())
+    if len(segments) > MAX_SEGMENTS or (total and removed_count / total > MAX_DELETED_RATIO):
+        logger.info(f"Слияние {len(segments)} сегментов BM25 (удаленных фрагментов: {removed_count})...")
+        merged = _merge_segments(segments, deleted)
+        segments, deleted, fresh = [merged], {}, [merged]
+
+    updated = BM25Index(segments, deleted, k1=index.k1, b=index.b)
+    updated.save(directory, fresh)
+    return updated
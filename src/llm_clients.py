@@ -0,0 +1,284 @@
+"""
+Реестр клиентов языковых моделей.
+
+Создает объекты LLM один раз на процесс и переиспользует их между запросами,
+а для OpenAI-совместимых провайдеров держит общие пулы keep-alive соединений
+httpx, чтобы каждый запрос не платил за новое TLS-рукопожатие.
+Собирает статистику переиспользования экземпляров и соединений,
+а также расход токенов по назначению вызова (генерация, расширение запроса,
+исправление кода).
+"""
+
+import os
+import logging
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.config import (
+    CUSTOM_LLM_URL,
+    LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE,
+    LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_HTTP_TIMEOUT,
+    LLM_HTTP_CONNECT_TIMEOUT,
+)
+from src.metrics import record_tokens
+
+logger = logging.getLogger(__name__)
+
+POOLED_HTTP_PROVIDERS = ("custom", "openai")
+# Провайдеры, SDK которых принимает таймаут отдельного запроса (аргумент timeout вызова)
+REQUEST_TIMEOUT_PROVIDERS = ("custom", "openai", "groq")
+
+
+class _ConnectionStats:
+    """Считает HTTP-запросы и новые TCP-соединения через trace-расширение httpcore."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def _on_event(self, event_name: str) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    def _on_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def sync_hook(self, request) -> None:
+        self._on_request()
+        request.extensions["trace"] = lambda event_name, info: self._on_event(event_name)
+
+    async def async_hook(self, request) -> None:
+        self._on_request()
+
+        async def trace(event_name, info):
+            self._on_event(event_name)
+
+        request.extensions["trace"] = trace
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            requests, new_connections = self.requests, self.new_connections
+        reused = max(0, requests - new_connections)
+        return {
+            "requests": requests,
+            "new_connections": new_connections,
+            "reused_connections": reused,
+            "reuse_ratio": reused / requests if requests else 0.0,
+        }
+
+
+class LLMClientRegistry:
+    """
+    Процессный реестр экземпляров LLM и HTTP-пулов.
+
+    Экземпляры кэшируются по ключу (провайдер, модель, URL), поэтому
+    повторные вызовы get() возвращают уже инициализированный клиент.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._instances = {}
+        self._http_clients = []
+        self._connection_stats = _ConnectionStats()
+        self._stats = {"instances_created": 0, "cache_hits": 0}
+
+    def get(self, provider: str, model_name: str):
+        """Возвращает (создавая при первом обращении) клиент LLM для провайдера и модели."""
+        provider = provider.lower()
+        key = (provider, model_name, CUSTOM_LLM_URL if provider == "custom" else None)
+        llm = self._instances.get(key)
+        if llm is not None:
+            with self._lock:
+                self._stats["cache_hits"] += 1
+            return llm
+
+        with self._lock:
+            llm = self._instances.get(key)
+            if llm is None:
+                logger.info(f"Инициализация клиента LLM (Провайдер: {provider.upper()}, Модель: {model_name})")
+                llm = self._create(provider, model_name)
+                self._instances[key] = llm
+                self._stats["instances_created"] += 1
+            else:
+                self._stats["cache_hits"] += 1
+        return llm
+
+    def _http_clients_pair(self, verify_ssl: bool):
+        """Создает пару синхронного и асинхронного httpx-клиентов с общими настройками пула."""
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY
+        )
+        timeout = httpx.Timeout(LLM_HTTP_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT)
+        http_client = httpx.Client(
+            verify=verify_ssl, limits=limits, timeout=timeout,
+            event_hooks={"request": [self._connection_stats.sync_hook]}
+        )
+        http_async_client = httpx.AsyncClient(
+            verify=verify_ssl, limits=limits, timeout=timeout,
+            event_hooks={"request": [self._connection_stats.async_hook]}
+        )
+        self._http_clients.extend([http_client, http_async_client])
+        return http_client, http_async_client
+
+    def _create(self, provider: str, model_name: str):
+        """Инициализирует объект языковой модели в зависимости от выбранного провайдера."""
+        verify_ssl = os.getenv("CUSTOM_LLM_VERIFY_SSL", "true").lower() != "false"
+
+        if provider == "custom":
+            from langchain_openai import ChatOpenAI
+            http_client, http_async_client = self._http_clients_pair(verify_ssl)
+            return ChatOpenAI(
+                base_url=CUSTOM_LLM_URL,
+                api_key=os.getenv("CUSTOM_LLM_KEY", "not-needed"),
+                model_name=model_name,
+                temperature=0,
+                http_client=http_client,
+                http_async_client=http_async_client
+            )
+
+        elif provider == "gigachat":
+            from langchain_gigachat.chat_models import GigaChat
+            return GigaChat(
+                credentials=os.getenv("GIGACHAT_CREDENTIALS"),
+                model=model_name,
+                verify_ssl_certs=verify_ssl,
+                timeout=LLM_HTTP_TIMEOUT,
+                temperature=0
+            )
+
+        elif provider == "stub":
+            from src.stub_llm import StubChatModel
+            return StubChatModel(model_name=model_name)
+
+        elif provider == "yandex":
+            from langchain_community.chat_models import ChatYandexGPT
+            return ChatYandexGPT(
+                model_name=model_name,
+                temperature=0
+            )
+
+        else:
+            from langchain.chat_models import init_chat_model
+            kwargs = {}
+            if provider in POOLED_HTTP_PROVIDERS:
+                kwargs["http_client"], kwargs["http_async_client"] = self._http_clients_pair(True)
+            return init_chat_model(
+                model=model_name,
+                model_provider=provider,
+                temperature=0,
+                **kwargs
+            )
+
+    def get_stats(self) -> dict:
+        """Возвращает статистику переиспользования клиентов и HTTP-соединений."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["instances"] = len(self._instances)
+        stats["http"] = self._connection_stats.snapshot()
+        return stats
+
+    def close(self) -> None:
+        """Закрывает синхронные HTTP-пулы и сбрасывает кэш экземпляров."""
+        with self._lock:
+            for client in self._http_clients:
+                if hasattr(client, "close"):
+                    try:
+                        client.close()
+                    except Exception as e:
+                        logger.debug(f"Ошибка при закрытии HTTP-клиента: {e}")
+            self._http_clients.clear()
+            self._instances.clear()
+
+    async def aclose(self) -> None:
+        """Закрывает все HTTP-пулы (включая асинхронные) и сбрасывает кэш экземпляров."""
+        async_clients = [c for c in self._http_clients if hasattr(c, "aclose")]
+        for client in async_clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.debug(f"Ошибка при закрытии HTTP-клиента: {e}")
+        with self._lock:
+            self._http_clients = [c for c in self._http_clients if c not in async_clients]
+        self.close()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_llm_registry() -> LLMClientRegistry:
+    """Возвращает общий для процесса реестр клиентов LLM."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = LLMClientRegistry()
+    return _registry
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Учитывает токены из usage_metadata (или token_usage провайдера) в метриках."""
+
+    def __init__(self, purpose: str):
+        self.purpose = purpose
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        if not input_tokens and not output_tokens:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens = usage.get("prompt_tokens", 0)
+            output_tokens = usage.get("completion_tokens", 0)
+        record_tokens(self.purpose, input_tokens, output_tokens)
+
+
+_usage_handlers = {}
+
+
+def with_request_timeout(llm, provider: str, timeout: float):
+    """
+    Ограничивает время одного запроса к модели.
+
+    Для провайдеров из REQUEST_TIMEOUT_PROVIDERS таймаут передается в SDK
+    с каждым вызовом; для остальных запрос ограничен таймаутом HTTP-клиента
+    (LLM_HTTP_TIMEOUT) и модель возвращается без изменений.
+
+    Args:
+        llm: Экземпляр языковой модели.
+        provider (str): Провайдер модели.
+        timeout (float): Таймаут запроса в секундах.
+    """
+    if provider.lower() in REQUEST_TIMEOUT_PROVIDERS:
+        return llm.bind(timeout=min(timeout, LLM_HTTP_TIMEOUT))
+    return llm
+
+
+def llm_run_config(purpose: str) -> dict:
+    """
+    Возвращает конфигурацию вызова цепочки с учетом токенов.
+
+    Args:
+        purpose (str): Назначение вызова ('generation', 'expansion', 'repair').
+
+    Returns:
+        dict: Аргумент config для invoke/ainvoke/stream/astream.
+    """
+    handler = _usage_handlers.get(purpose)
+    if handler is None:
+        handler = _usage_handlers.setdefault(purpose, TokenUsageHandler(purpose))
+    return {"callbacks": [handler], "run_name": purpose}
@@ -0,0 +1,260 @@
+"""
+Метрики и трассировка этапов генерации.
+
+Содержит минимальный реестр метрик в текстовом формате Prometheus
+(счетчики, гистограммы и вычисляемые показатели) без внешних зависимостей,
+замер длительности этапов (эмбеддинги, поиск, обращения к LLM, очистка,
+валидация) и трассировку отдельного запроса через contextvars.
+"""
+
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Базовый класс метрики с набором меток."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами корзин."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        lines = self._header()
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Показатель, значения которого вычисляются функцией в момент выгрузки."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def render(self) -> list:
+        try:
+            values = self._collect() or {}
+        except Exception:
+            values = {}
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(float(value))}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames=(), collect=None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, collect))
+
+    def render(self) -> str:
+        """Выгружает все метрики в текстовом формате Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+STAGE_SECONDS = _registry.histogram(
+    "iac_stage_duration_seconds", "Длительность этапов обработки запроса.", ("stage",)
+)
+LLM_TOKENS = _registry.counter(
+    "iac_llm_tokens_total", "Число токенов, потраченных на обращения к LLM.", ("purpose", "kind")
+)
+HTTP_REQUEST_SECONDS = _registry.histogram(
+    "iac_http_request_duration_seconds", "Длительность HTTP-запросов к API.", ("method", "path", "status")
+)
+RERANK_DROPPED_TOKENS = _registry.counter(
+    "iac_rerank_dropped_tokens_total", "Оценка токенов контекста, отсеченных переранжированием."
+)
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Возвращает реестр метрик процесса."""
+    return _registry
+
+
+class Trace:
+    """Трасса одного запроса: идентификатор, замеры этапов и расход токенов."""
+
+    def __init__(self, trace_id: str = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans = []
+        self.tokens = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.spans.append({"stage": stage, "seconds": round(seconds, 6)})
+
+    def add_tokens(self, purpose: str, kind: str, count: int) -> None:
+        with self._lock:
+            key = f"{purpose}_{kind}"
+            self.tokens[key] = self.tokens.get(key, 0) + count
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"trace_id": self.trace_id, "spans": list(self.spans), "tokens": dict(self.tokens)}
+
+
+_current_trace = contextvars.ContextVar("iac_trace", default=None)
+
+
+def start_trace(trace_id: str = None):
+    """
+    Начинает трассу запроса в текущем контексте.
+
+    Returns:
+        tuple: (Trace, токен для end_trace).
+    """
+    trace = Trace(trace_id)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token) -> None:
+    """Завершает трассу, начатую start_trace."""
+    _current_trace.reset(token)
+
+
+def current_trace():
+    """Возвращает трассу текущего запроса или None."""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage: str):
+    """Замеряет длительность этапа и записывает ее в гистограмму и трассу запроса."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(stage, elapsed)
+
+
+def record_tokens(purpose: str, input_tokens: int = 0, output_tokens: int = 0) -> None:
+    """Учитывает расход токенов на обращение к LLM."""
+    trace = _current_trace.get()
+    for kind, count in (("input", input_tokens), ("output", output_tokens)):
+        if not count:
+            continue
+        LLM_TOKENS.inc(count, purpose=purpose, kind=kind)
+        if trace is not None:
+            trace.add_tokens(purpose, kind, count)
+
+
+def render_metrics() -> str:
+    """Выгружает метрики процесса в текстовом формате Prometheus."""
+    return _registry.render()
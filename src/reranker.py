@@ -0,0 +1,141 @@
+"""
+Переранжирование найденных фрагментов перед сборкой контекста.
+
+Кандидаты после слияния рангов (RRF) переоцениваются относительно исходного
+запроса пользователя: косинусной близостью эмбеддингов или небольшим
+кросс-энкодером на CPU. В режиме cosine векторы фрагментов читаются из
+векторного хранилища; заново (через кэш эмбеддингов, если он включен)
+векторизуются только фрагменты, которых в хранилище нет, и сам запрос.
+В контекст попадают не более RERANK_TOP_N фрагментов с оценкой не ниже
+RERANK_THRESHOLD. Стоимость этапа ограничена числом кандидатов
+RERANK_MAX_CANDIDATES, а ее длительность и объем отсеченного контекста
+попадают в метрики и трассу запроса, что позволяет сравнить затраты
+на переранжирование с экономией на генерации.
+"""
+
+import logging
+import threading
+
+import numpy as np
+
+from src.config import (
+    RERANK_MODE, RERANK_MODEL, RERANK_TOP_N, RERANK_THRESHOLD,
+    RERANK_MAX_CANDIDATES, RERANK_BATCH_SIZE,
+)
+from src.metrics import span, current_trace, RERANK_DROPPED_TOKENS
+
+logger = logging.getLogger(__name__)
+
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+
+
+def get_cross_encoder():
+    """Возвращает общий для процесса кросс-энкодер, загружая его при первом обращении."""
+    global _cross_encoder
+    if _cross_encoder is None:
+        with _cross_encoder_lock:
+            if _cross_encoder is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+
+                    logger.info(f"Загрузка модели переранжирования {RERANK_MODEL}...")
+                    _cross_encoder = CrossEncoder(RERANK_MODEL, device="cpu")
+                except Exception as e:
+                    logger.error(f"Ошибка загрузки модели переранжирования: {str(e)}")
+                    raise RuntimeError(f"Сбой компонента Reranker: {str(e)}")
+    return _cross_encoder
+
+
+def _cosine_scores(query: str, docs: list, embeddings, stored_vectors=None) -> np.ndarray:
+    """Оценивает фрагменты косинусной близостью их эмбеддингов к запросу."""
+    stored = stored_vectors([doc.id for doc in docs if doc.id]) if stored_vectors is not None else {}
+    missing = [i for i, doc in enumerate(docs) if doc.id not in stored]
+    computed = embeddings.embed_documents([docs[i].page_content for i in missing]) if missing else []
+
+    query_vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    matrix = np.empty((len(docs), len(query_vector)), dtype=np.float32)
+    for i, doc in enumerate(docs):
+        if doc.id in stored:
+            matrix[i] = stored[doc.id]
+    for i, vector in zip(missing, computed):
+        matrix[i] = vector
+    query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return matrix @ query_vector
+
+
+def _cross_encoder_scores(query: str, texts: list) -> np.ndarray:
+    """Оценивает пары (запрос, фрагмент) кросс-энкодером батчами на CPU."""
+    model = get_cross_encoder()
+    scores = model.predict([(query, text) for text in texts], batch_size=RERANK_BATCH_SIZE,
+                           show_progress_bar=False, convert_to_numpy=True)
+    return np.asarray(scores, dtype=np.float32).reshape(-1)
+
+
+def rerank(query: str, ranked_docs, embeddings=None, mode: str = RERANK_MODE,
+           top_n: int = RERANK_TOP_N, threshold: float = RERANK_THRESHOLD, stored_vectors=None) -> list:
+    """
+    Переоценивает фрагменты относительно запроса и отсекает слабые.
+
+    Переоцениваются только первые RERANK_MAX_CANDIDATES фрагментов в порядке RRF,
+    остальные отбрасываются без оценки. Если ни один фрагмент не прошел порог,
+    сохраняется лучший, чтобы генерация не осталась без контекста.
+
+    Args:
+        query (str): Исходный запрос пользователя.
+        ranked_docs: Список пар (Document, оценка) в порядке убывания релевантности.
+        embeddings: Модель эмбеддингов для режима cosine.
+        mode (str): none, cosine или cross-encoder.
+        top_n (int): Максимум фрагментов в результате (0 - без ограничения).
+        threshold (float): Минимальная оценка фрагмента.
+        stored_vectors: Функция, возвращающая сохраненные векторы фрагментов
+            по идентификаторам (режим cosine; None - векторизовать все фрагменты).
+
+    Returns:
+        list: Пары (Document, новая оценка) в порядке убывания оценки.
+
+    Raises:
+        RuntimeError: При сбое модели переранжирования.
+    """
+    if mode == "none" or not ranked_docs:
+        return ranked_docs
+
+    from src.context import estimate_tokens
+
+    candidates = ranked_docs[:RERANK_MAX_CANDIDATES] if RERANK_MAX_CANDIDATES > 0 else ranked_docs
+    docs = [doc for doc, _ in candidates]
+    texts = [doc.page_content for doc in docs]
+
+    try:
+        with span("rerank"):
+            if mode == "cross-encoder":
+                scores = _cross_encoder_scores(query, texts)
+            else:
+                scores = _cosine_scores(query, docs, embeddings, stored_vectors)
+    except RuntimeError:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка переранжирования фрагментов: {str(e)}")
+        raise RuntimeError(f"Сбой компонента Reranker: {str(e)}")
+
+    order = np.argsort(-scores, kind="stable")
+    kept = [int(i) for i in order if scores[i] >= threshold]
+    if top_n > 0:
+        kept = kept[:top_n]
+    if not kept:
+        kept = [int(order[0])]
+
+    kept_set = set(kept)
+    dropped_tokens = sum(estimate_tokens(doc.page_content) for doc, _ in ranked_docs[len(candidates):])
+    dropped_tokens += sum(estimate_tokens(texts[i]) for i in range(len(candidates)) if i not in kept_set)
+    RERANK_DROPPED_TOKENS.inc(dropped_tokens)
+    trace = current_trace()
+    if trace is not None:
+        trace.add_tokens("rerank", "dropped", dropped_tokens)
+
+    logger.info(
+        f"Переранжирование ({mode}): оставлено {len(kept)} из {len(ranked_docs)} фрагментов, "
+        f"отсечено ~{dropped_tokens} токенов контекста."
+    )
+    return [(candidates[i][0], float(scores[i])) for i in kept]
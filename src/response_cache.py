@@ -0,0 +1,212 @@
+"""
+Семантический кэш ответов генератора.
+
+Хранит провалидированные результаты generate_iac_script и отдает их
+для полностью совпадающих или достаточно близких по смыслу запросов
+(косинусная близость эмбеддингов запросов не ниже порога). Семантическое
+попадание принимается, только если в запросах совпадают все литералы -
+числа, CIDR, регионы и другие идентификаторы, - чтобы запрос "ВМ с 2 ядрами"
+не получил ответ, сгенерированный для "ВМ с 4 ядрами".
+Записи привязаны к инструменту, модели и версии индекса, поэтому
+пересборка базы знаний автоматически делает кэш неактуальным.
+
+При включенном общем кэше (src.shared_cache) ответы дополнительно
+сохраняются в нем и становятся доступны остальным воркерам.
+"""
+
+import re
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from src.cache import TTLCache
+from src.config import (
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_SIMILARITY,
+)
+from src.embeddings import normalize_text
+from src.shared_cache import get_shared_cache
+
+logger = logging.getLogger(__name__)
+
+SHARED_NAMESPACE = "response"
+
+_TOKEN_PATTERN = re.compile(r"[\w.:/-]+", re.UNICODE)
+_QUOTED_PATTERN = re.compile(r"[\"'`«]([^\"'`»]+)[\"'`»]")
+
+
+def query_literals(query: str) -> tuple:
+    """
+    Извлекает из запроса литералы, которые должны совпадать при семантическом попадании.
+
+    Литералом считается слово с цифрами или разделителями (2, 10.0.0.0/16, ru-central1-a,
+    t3.micro, my_bucket) и любой текст в кавычках.
+    """
+    text = normalize_text(query).lower()
+    literals = {token.strip(".:/-") for token in _TOKEN_PATTERN.findall(text)
+                if any(ch.isdigit() or ch in "-_./:" for ch in token.strip(".:/-"))}
+    literals.update(quoted.strip() for quoted in _QUOTED_PATTERN.findall(text))
+    literals.discard("")
+    return tuple(sorted(literals))
+
+
+class ResponseCache:
+    """
+    Кэш ответов с точным и семантическим поиском.
+
+    Args:
+        max_entries (int): Максимальное число записей.
+        ttl (float): Время жизни записи в секундах.
+        similarity_threshold (float): Минимальная косинусная близость
+            запросов для семантического попадания (1.0 - только точные совпадения).
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: float = RESPONSE_CACHE_TTL,
+                 similarity_threshold: float = RESPONSE_CACHE_SIMILARITY):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self._entries = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self._index_version = None
+        self._stats = {
+            "exact_hits": 0, "shared_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "invalidations": 0
+        }
+
+    @staticmethod
+    def key(iac_tool: str, model: str, index_version, query: str) -> str:
+        """Ключ записи (также используется как ключ single-flight генерации)."""
+        payload = f"{iac_tool}\0{model}\0{index_version}\0{normalize_text(query).lower()}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, index_version) -> None:
+        """Сбрасывает кэш, если индекс был пересобран."""
+        with self._lock:
+            if index_version == self._index_version:
+                return
+            if self._index_version is not None:
+                logger.info("Индекс пересобран: кэш ответов сброшен.")
+                self._stats["invalidations"] += 1
+            self._index_version = index_version
+        self._entries.clear()
+
+    def _load_shared(self, key: str, scope: tuple):
+        """Ищет ответ в общем кэше и переносит его в локальный."""
+        shared = get_shared_cache()
+        payload = shared.get_json(SHARED_NAMESPACE, key) if shared is not None else None
+        if payload is None:
+            return None
+        vector = payload.get("vector")
+        entry = {
+            "scope": scope,
+            "vector": np.asarray(vector, dtype=np.float32) if vector is not None else None,
+            "literals": tuple(payload.get("literals") or ()),
+            "code": payload["code"],
+        }
+        self._entries.set(key, entry)
+        return entry
+
+    def peek(self, iac_tool: str, model: str, index_version, query: str):
+        """Точный поиск ответа в локальном и общем кэше без учета статистики."""
+        key = self.key(iac_tool, model, index_version, query)
+        entry = self._entries.get(key) or self._load_shared(key, (iac_tool, model, index_version))
+        return entry["code"] if entry is not None else None
+
+    def lookup(self, iac_tool: str, model: str, index_version, query: str, vector=None):
+        """
+        Ищет готовый ответ для запроса.
+
+        Returns:
+            str | None: Код из кэша или None при промахе.
+        """
+        self._check_version(index_version)
+        key = self.key(iac_tool, model, index_version, query)
+        entry = self._entries.get(key)
+        if entry is not None:
+            with self._lock:
+                self._stats["exact_hits"] += 1
+            return entry["code"]
+
+        entry = self._load_shared(key, (iac_tool, model, index_version))
+        if entry is not None:
+            with self._lock:
+                self._stats["shared_hits"] += 1
+            logger.info("Ответ найден в общем кэше.")
+            return entry["code"]
+
+        if vector is not None and self.similarity_threshold < 1.0:
+            scope = (iac_tool, model, index_version)
+            literals = query_literals(query)
+            candidates = [
+                entry for _, entry in self._entries.items()
+                if entry["scope"] == scope and entry["vector"] is not None and entry.get("literals") == literals
+            ]
+            if candidates:
+                matrix = np.stack([entry["vector"] for entry in candidates])
+                scores = matrix @ self._normalize(vector)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    with self._lock:
+                        self._stats["semantic_hits"] += 1
+                    logger.info(f"Семантическое попадание в кэш ответов (близость {scores[best]:.3f}).")
+                    return candidates[best]["code"]
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def store(self, iac_tool: str, model: str, index_version, query: str, code: str, vector=None) -> None:
+        """Сохраняет провалидированный ответ."""
+        self._check_version(index_version)
+        key = self.key(iac_tool, model, index_version, query)
+        normalized = self._normalize(vector) if vector is not None else None
+        self._entries.set(key, {
+            "scope": (iac_tool, model, index_version),
+            "vector": normalized,
+            "literals": query_literals(query),
+            "code": code,
+        })
+        shared = get_shared_cache()
+        if shared is not None:
+            shared.set_json(SHARED_NAMESPACE, key, {
+                "code": code,
+                "vector": normalized.tolist() if normalized is not None else None,
+                "literals": list(query_literals(query)),
+            }, ttl=self.ttl)
+        with self._lock:
+            self._stats["stores"] += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        """Возвращает статистику попаданий."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["entries"] = len(self._entries)
+        hits = stats["exact_hits"] + stats["shared_hits"] + stats["semantic_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Возвращает общий для процесса кэш ответов."""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
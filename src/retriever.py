@@ -1,84 +1,732 @@
 """Модуль семантического поиска и извлечения контекста.
 
 Реализует функционал поиска релевантных фрагментов документации
-с использованием векторной базы данных Chroma и ручного алгоритма Query Expansion.
+с использованием векторного хранилища (Chroma или встроенного индекса NumPy,
+см. src.vector_store) и ручного алгоритма Query Expansion.
+
+Модель эмбеддингов и векторное хранилище загружаются один раз на процесс
+и разделяются между REST API, CLI и индексатором (см. RetrievalEngine).
+Плотный поиск дополняется лексическим индексом BM25 (гибридный поиск).
+Подзапросы Query Expansion направляются в подмножество индекса своей
+категории документов и выбранного инструмента IaC (по метаданным чанков).
 """
 
+import re
+import json
+import hashlib
 import logging
+import threading
+import time
 
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-
-from src.config import DB_DIR
+from src.config import DB_DIR, EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND
+from src.metrics import span
+from src.shared_cache import get_shared_cache, single_flight, asingle_flight
 
 logger = logging.getLogger(__name__)
 
+INDEX_VERSION_FILE = "index_version"
+LEXICAL_INDEX_DIR = "bm25"
+INDEX_VERSION_CHECK_INTERVAL = 2.0
+RRF_K = 60
+EXPANSION_SHARED_NAMESPACE = "expansion"
+
+
+class _ReadWriteLock:
+    """Простая блокировка читатель-писатель.
+
+    Поисковые запросы выполняются параллельно (читатели), а перезагрузка
+    хранилища (писатель) дожидается завершения всех активных запросов.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            while self._writer:
+                self._cond.wait()
+            self._writer = True
+            while self._readers > 0:
+                self._cond.wait()
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+class RetrievalEngine:
+    """Долгоживущий движок поиска по векторной базе знаний.
+
+    Загружает модель эмбеддингов и открывает векторное хранилище один раз,
+    после чего переиспользует их во всех запросах. Безопасен для вызова
+    из нескольких потоков, автоматически перечитывает индекс после его
+    пересборки и накапливает метрики времени загрузки и поиска.
+    """
+
+    def __init__(self, persist_directory=DB_DIR, model_name: str = EMBEDDING_MODEL_NAME,
+                 backend: str = EMBEDDING_BACKEND):
+        self.persist_directory = persist_directory
+        self.model_name = model_name
+        self.backend = backend
+
+        self._init_lock = threading.Lock()
+        self._rw_lock = _ReadWriteLock()
+        self._stats_lock = threading.Lock()
+
+        self._embeddings = None
+        self._store = None
+        self._lexical = None
+        self._index_version = None
+        self._last_version_check = 0.0
+
+        self._metrics = {
+            "model_load_seconds": None,
+            "store_load_seconds": None,
+            "reloads": 0,
+            "queries": 0,
+            "query_seconds_total": 0.0,
+            "query_seconds_max": 0.0,
+        }
+
+    @property
+    def embedding_id(self) -> str:
+        """Идентификатор модели эмбеддингов с учетом бэкенда (для манифеста индекса)."""
+        from src.embeddings import embedding_model_id
+
+        return embedding_model_id(self.model_name, self.backend)
+
+    @property
+    def embeddings(self):
+        """Модель эмбеддингов (загружается при первом обращении)."""
+        if self._embeddings is None:
+            with self._init_lock:
+                if self._embeddings is None:
+                    from src.embeddings import create_embeddings, resolve_embedding_backend
+
+                    self.backend = resolve_embedding_backend(self.model_name, self.backend)
+                    logger.info(f"Загрузка модели эмбеддингов ({self.model_name}, бэкенд {self.backend})...")
+                    started = time.perf_counter()
+                    self._embeddings = create_embeddings(self.model_name, self.backend)
+                    self._metrics["model_load_seconds"] = time.perf_counter() - started
+                    logger.info(f"Модель эмбеддингов загружена за {self._metrics['model_load_seconds']:.2f} с.")
+        return self._embeddings
+
+    @property
+    def index_version(self):
+        """Идентификатор текущей версии индекса (меняется при каждой пересборке)."""
+        return self._index_version
+
+    def current_index_version(self):
+        """Возвращает версию индекса, предварительно проверив, не был ли он пересобран."""
+        self._acquire_store()
+        self._rw_lock.release_read()
+        return self._index_version
+
+    def _read_index_version(self):
+        version_file = self.persist_directory / INDEX_VERSION_FILE
+        try:
+            return version_file.read_text(encoding="utf-8").strip()
+        except OSError:
+            return None
+
+    def _open_store(self):
+        from src.vector_store import create_vector_store
+
+        embeddings = self.embeddings
+        started = time.perf_counter()
+        store = create_vector_store(self.persist_directory, embeddings)
+        self._lexical = self._open_lexical()
+        self._metrics["store_load_seconds"] = time.perf_counter() - started
+        self._index_version = self._read_index_version()
+        self._last_version_check = time.monotonic()
+        logger.info(
+            f"Векторная база данных ({store.name}) открыта за {self._metrics['store_load_seconds'] * 1000:.1f} мс."
+        )
+        return store
+
+    def _open_lexical(self):
+        from src.config import HYBRID_SEARCH_ENABLED
+        from src.lexical import BM25Index
+
+        lexical_dir = self.persist_directory / LEXICAL_INDEX_DIR
+        if not HYBRID_SEARCH_ENABLED or not lexical_dir.exists():
+            return None
+        try:
+            return BM25Index.load(lexical_dir)
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить лексический индекс BM25: {e}")
+            return None
+
+    def _close_store(self):
+        if self._store is not None:
+            self._store.close()
+        self._store = None
+        self._lexical = None
+
+    def warmup(self) -> None:
+        """Заранее загружает модель и хранилище, чтобы первый запрос не ждал загрузки."""
+        self.embeddings.embed_query("warmup")
+        self._acquire_store()
+        self._rw_lock.release_read()
+
+    def release(self) -> None:
+        """Закрывает хранилище (например, перед удалением каталога индекса)."""
+        self._rw_lock.acquire_write()
+        try:
+            self._close_store()
+            self._index_version = None
+        finally:
+            self._rw_lock.release_write()
+
+    def reload(self, force: bool = True) -> None:
+        """
+        Переоткрывает векторное хранилище после пересборки индекса.
+
+        Args:
+            force (bool): Переоткрыть хранилище, даже если другой поток уже
+                открыл текущую версию индекса (False - только при необходимости).
+        """
+        self._rw_lock.acquire_write()
+        try:
+            if not force and self._store is not None and self._read_index_version() == self._index_version:
+                return
+            logger.info("Перезагрузка векторной базы данных...")
+            self._close_store()
+            self._store = self._open_store()
+            with self._stats_lock:
+                self._metrics["reloads"] += 1
+        finally:
+            self._rw_lock.release_write()
+
+    def _index_changed(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_version_check < INDEX_VERSION_CHECK_INTERVAL:
+            return False
+        self._last_version_check = now
+        return self._read_index_version() != self._index_version
+
+    def _acquire_store(self):
+        """Захватывает хранилище на чтение, при необходимости открывая или перезагружая его."""
+        if self._store is None or self._index_changed():
+            self.reload(force=False)
+        self._rw_lock.acquire_read()
+        if self._store is None:
+            self._rw_lock.release_read()
+            self.reload(force=False)
+            self._rw_lock.acquire_read()
+        return self._store
+
+    def similarity_search(self, query: str, k: int = 3, where: dict = None):
+        """Потокобезопасный поиск ближайших фрагментов для одного запроса."""
+        store = self._acquire_store()
+        started = time.perf_counter()
+        try:
+            with span("vector_search"):
+                return store.similarity_search(query, k=k, where=where)
+        finally:
+            self._rw_lock.release_read()
+            self._record_query(time.perf_counter() - started)
+
+    def multi_search(self, queries, k: int = 3, where=None):
+        """
+        Пакетный поиск: все запросы векторизуются одним батчем и ищутся
+        многовекторными запросами к хранилищу (по одному на каждый фильтр).
+
+        Args:
+            queries: Тексты запросов.
+            k (int): Число фрагментов на запрос.
+            where: Фильтр по метаданным для всех запросов (dict) или список
+                фильтров для каждого запроса (None - без фильтра).
+
+        Returns:
+            list: Список результатов (списков Document) для каждого запроса.
+        """
+        if not queries:
+            return []
+        embeddings = self.embeddings
+        embed_batch = getattr(embeddings, "embed_queries", embeddings.embed_documents)
+        with span("embedding"):
+            vectors = embed_batch(list(queries))
+
+        store = self._acquire_store()
+        started = time.perf_counter()
+        try:
+            with span("vector_search"):
+                if where is None or isinstance(where, dict):
+                    return store.query(vectors, k, where)
+                groups = {}
+                for i, condition in enumerate(where):
+                    groups.setdefault(json.dumps(condition, sort_keys=True), []).append(i)
+                results = [None] * len(vectors)
+                for indexes in groups.values():
+                    found = store.query([vectors[i] for i in indexes], k, where[indexes[0]])
+                    for i, docs in zip(indexes, found):
+                        results[i] = docs
+                return results
+        finally:
+            self._rw_lock.release_read()
+            self._record_query(time.perf_counter() - started)
+
+    def lexical_search(self, queries, k: int = 3):
+        """
+        Лексический поиск BM25 по каждому запросу.
+
+        Returns:
+            list: Список результатов (списков Document) для каждого запроса.
+                Пустые списки, если лексический индекс не построен.
+        """
+        store = self._acquire_store()
+        try:
+            lexical = self._lexical
+            if lexical is None:
+                return [[] for _ in queries]
+            with span("lexical_search"):
+                hits = [[doc_id for doc_id, _ in lexical.search(q, k=k)] for q in queries]
+            wanted = sorted({doc_id for ids in hits for doc_id in ids})
+            if not wanted:
+                return [[] for _ in queries]
+            found = store.get(wanted)
+        finally:
+            self._rw_lock.release_read()
+
+        by_id = {doc.id: doc for doc in found}
+        return [[by_id[doc_id] for doc_id in ids if doc_id in by_id] for ids in hits]
+
+    def get_vectors(self, ids) -> dict:
+        """Возвращает сохраненные в хранилище векторы фрагментов (без повторной векторизации)."""
+        store = self._acquire_store()
+        try:
+            return store.get_vectors(ids)
+        finally:
+            self._rw_lock.release_read()
+
+    def _record_query(self, elapsed: float) -> None:
+        with self._stats_lock:
+            self._metrics["queries"] += 1
+            self._metrics["query_seconds_total"] += elapsed
+            self._metrics["query_seconds_max"] = max(self._metrics["query_seconds_max"], elapsed)
+
+    def get_metrics(self) -> dict:
+        """Возвращает снимок метрик загрузки и поиска."""
+        with self._stats_lock:
+            metrics = dict(self._metrics)
+        queries = metrics["queries"]
+        metrics["query_seconds_avg"] = metrics["query_seconds_total"] / queries if queries else 0.0
+        metrics["model_name"] = self.model_name
+        metrics["embedding_backend"] = self.backend
+        metrics["index_version"] = self._index_version
+        metrics["loaded"] = self._store is not None
+        metrics["vector_store"] = self._store.name if self._store is not None else None
+        metrics["lexical_index_size"] = len(self._lexical) if self._lexical is not None else 0
+        if hasattr(self._embeddings, "get_stats"):
+            metrics["embedding_cache"] = self._embeddings.get_stats()
+        return metrics
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> RetrievalEngine:
+    """Возвращает общий для процесса экземпляр RetrievalEngine."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine()
+    return _engine
+
+
+def reciprocal_rank_fusion(result_lists, rrf_k: int = RRF_K, weights=None):
+    """Объединяет несколько ранжированных списков документов методом Reciprocal Rank Fusion.
+
+    Одинаковые фрагменты (по тексту) из разных списков сливаются, их оценки
+    суммируются. Порядок детерминирован: по убыванию оценки, затем по лучшей
+    позиции в исходных списках и по идентификатору фрагмента.
+
+    Args:
+        result_lists: Списки Document, отсортированные по релевантности.
+        rrf_k (int): Сглаживающая константа RRF.
+        weights: Веса списков (по умолчанию все равны 1).
+
+    Returns:
+        list: Пары (Document, score) в порядке убывания релевантности.
+    """
+    fused = {}
+    if weights is None:
+        weights = [1.0] * len(result_lists)
+    for docs, weight in zip(result_lists, weights):
+        for rank, doc in enumerate(docs):
+            entry = fused.setdefault(doc.page_content, [doc, 0.0, rank])
+            entry[1] += weight / (rrf_k + rank + 1)
+            entry[2] = min(entry[2], rank)
+    ordered = sorted(fused.values(), key=lambda e: (-e[1], e[2], e[0].id or "", e[0].page_content))
+    return [(doc, score) for doc, score, _ in ordered]
+
+
+EXPANSION_PROMPT = """Сгенерируй 4 альтернативных поисковых запроса для базы знаний корпоративных стандартов.
+                                Исходный запрос пользователя: {query}
+
+                                ПРАВИЛА ГЕНЕРАЦИИ ЗАПРОСОВ:
+                                1. Запрос с меткой security должен фокусироваться на политиках информационной безопасности и ограничениях для запрошенных компонентов.
+                                2. Запрос с меткой standards должен искать административные и корпоративные стандарты.
+                                3. Запрос с меткой architecture должен быть направлен на технические требования и архитектурную связность.
+                                4. Запрос с меткой budget должен искать правила оптимизации затрат и выбора тарифных планов для указанных компонентов.
+
+                                Выведи строго 4 строки в формате "метка: запрос", например "security: ...". Без нумерации и дополнительных слов.
+                                """
+
+# Категории документов, на которые нацелены подзапросы (метки строк ответа на EXPANSION_PROMPT).
+EXPANSION_CATEGORIES = ("security", "standards", "architecture", "budget")
+# Категория документов без явной тематики: доступна подзапросам всех категорий.
+GENERAL_CATEGORY = "general"
+EXPANSION_FORMAT_VERSION = 2
+
+_EXPANSION_LINE_PATTERN = re.compile(
+    r"^[\s\-*\d.)]*\**(" + "|".join(EXPANSION_CATEGORIES) + r")\**\s*[:\-\u2014]\s*(.+)$", re.IGNORECASE
+)
+
+
+def _parse_expansion(response) -> list:
+    """
+    Извлекает подзапросы из ответа языковой модели.
+
+    Строки "метка: запрос" направляются в свою категорию, прочие строки
+    (вступления, пояснения) отбрасываются. Если модель не соблюла формат
+    и ни одной метки нет, все строки используются как подзапросы без категории,
+    то есть ищутся по всему индексу.
+
+    Returns:
+        list: Пары [категория или None, подзапрос].
+    """
+    content = response.content if hasattr(response, 'content') else str(response)
+    lines = [line.strip() for line in content.strip().split('\n') if line.strip()]
+    tagged = []
+    for line in lines:
+        match = _EXPANSION_LINE_PATTERN.match(line)
+        if match and match.group(2).strip():
+            tagged.append([match.group(1).lower(), match.group(2).strip()])
+    if tagged:
+        return tagged
+    if lines:
+        logger.warning("Ответ Query Expansion без меток категорий. Подзапросы ищутся по всему индексу.")
+    return [[None, line] for line in lines]
+
 
-def get_relevant_context(query: str, llm=None, k: int = 3) -> str:
+def _llm_model_id(llm) -> str:
+    """Определяет идентификатор модели для ключа кэша подзапросов."""
+    model = getattr(llm, "model_name", None) or getattr(llm, "model", None)
+    return f"{type(llm).__name__}:{model}"
+
+
+_expansion_cache = None
+_expansion_cache_lock = threading.Lock()
+
+
+def get_expansion_cache():
+    """Возвращает общий для процесса кэш результатов Query Expansion."""
+    global _expansion_cache
+    if _expansion_cache is None:
+        with _expansion_cache_lock:
+            if _expansion_cache is None:
+                from src.cache import TTLCache
+                from src.config import EXPANSION_CACHE_MAX_ENTRIES, EXPANSION_CACHE_TTL
+                _expansion_cache = TTLCache(max_entries=EXPANSION_CACHE_MAX_ENTRIES, ttl=EXPANSION_CACHE_TTL)
+    return _expansion_cache
+
+
+def _expansion_key(query: str, llm) -> str:
+    from src.embeddings import normalize_text
+    return f"v{EXPANSION_FORMAT_VERSION}\0{_llm_model_id(llm)}\0{normalize_text(query).lower()}"
+
+
+def _shared_expansion_key(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _load_expansion(key: str):
+    """Ищет подзапросы в локальном, а затем в общем кэше (см. src.shared_cache)."""
+    cached = get_expansion_cache().get(key)
+    if cached is None:
+        shared = get_shared_cache()
+        found = shared.get_json(EXPANSION_SHARED_NAMESPACE, _shared_expansion_key(key)) if shared is not None else None
+        if found is not None:
+            cached = tuple(tuple(pair) for pair in found)
+            get_expansion_cache().set(key, cached)
+    return [list(pair) for pair in cached] if cached is not None else None
+
+
+def _store_expansion(key: str, queries: list) -> None:
+    from src.config import EXPANSION_CACHE_TTL
+
+    get_expansion_cache().set(key, tuple(tuple(pair) for pair in queries))
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.set_json(EXPANSION_SHARED_NAMESPACE, _shared_expansion_key(key), queries, ttl=EXPANSION_CACHE_TTL)
+
+
+def expand_query(query: str, llm) -> list:
+    """Генерирует альтернативные поисковые запросы (с кэшированием по запросу и модели).
+
+    Одинаковые одновременные запросы разных воркеров обращаются к модели
+    один раз (single-flight через общий кэш).
+
+    Args:
+        query (str): Исходный запрос пользователя.
+        llm: Экземпляр языковой модели.
+
+    Returns:
+        list: Пары [категория или None, подзапрос] (см. _parse_expansion).
+            Пустой список, если модель не ответила.
+    """
+    key = _expansion_key(query, llm)
+    cached = _load_expansion(key)
+    if cached is not None:
+        logger.info("Подзапросы найдены в кэше Query Expansion.")
+        return cached
+
+    from src.llm_clients import llm_run_config
+
+    with single_flight(f"expansion:{_shared_expansion_key(key)}", lambda: _load_expansion(key)) as shared:
+        if shared is not None:
+            return shared
+        logger.info("Запуск алгоритма расширения запроса (Query Expansion)...")
+        try:
+            with span("expansion_llm"):
+                response = llm.invoke(EXPANSION_PROMPT.format(query=query), config=llm_run_config("expansion"))
+            queries = _parse_expansion(response)
+        except Exception as e:
+            logger.warning(f"Ошибка генерации подзапросов: {str(e)}")
+            return []
+        _store_expansion(key, queries)
+        return queries
+
+
+async def aexpand_query(query: str, llm, provider: str = None) -> list:
+    """Асинхронная версия expand_query с учетом лимита параллелизма провайдера."""
+    from src.concurrency import llm_slot, run_blocking
+    from src.llm_clients import llm_run_config
+
+    key = _expansion_key(query, llm)
+    cached = await run_blocking(_load_expansion, key)
+    if cached is not None:
+        logger.info("Подзапросы найдены в кэше Query Expansion.")
+        return cached
+
+    async with asingle_flight(f"expansion:{_shared_expansion_key(key)}", lambda: _load_expansion(key)) as shared:
+        if shared is not None:
+            return shared
+        logger.info("Запуск алгоритма расширения запроса (Query Expansion)...")
+        try:
+            async with llm_slot(provider or "default"):
+                with span("expansion_llm"):
+                    response = await llm.ainvoke(EXPANSION_PROMPT.format(query=query), config=llm_run_config("expansion"))
+            queries = _parse_expansion(response)
+        except Exception as e:
+            logger.warning(f"Ошибка генерации подзапросов: {str(e)}")
+            return []
+        await run_blocking(_store_expansion, key, queries)
+        return queries
+
+
+def _route_filter(category, iac_tool):
+    """Формирует фильтр метаданных для подзапроса категории и инструмента IaC."""
+    conditions = []
+    if category:
+        conditions.append({"category": {"$in": [category, GENERAL_CATEGORY]}})
+    if iac_tool:
+        conditions.append({"iac_tool": {"$in": [iac_tool, "any"]}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def _matches_tool(doc, iac_tool) -> bool:
+    return not iac_tool or doc.metadata.get("iac_tool", "any") in (iac_tool, "any")
+
+
+def _search_expanded(engine: RetrievalEngine, query: str, queries: list, k: int, iac_tool: str = None) -> list:
+    """Ищет фрагменты по всем подзапросам одним батчем и объединяет результаты через RRF.
+
+    Возвращает пары (Document, score) в порядке убывания релевантности.
+
+    Подзапросы передаются парами [категория, текст] (см. _parse_expansion).
+    При включенной маршрутизации (RETRIEVAL_FILTERS_ENABLED) каждый подзапрос ищется
+    среди фрагментов своей категории и общей категории general для инструмента IaC,
+    а исходный запрос и подзапросы без категории - среди всех фрагментов инструмента.
+    Если подмножество пусто (например, индекс построен без метаданных), подзапрос
+    ищется по всему индексу.
+
+    При включенном гибридном поиске к плотным результатам каждого подзапроса
+    добавляются результаты BM25 с весом HYBRID_LEXICAL_WEIGHT.
+    """
+    from src.config import HYBRID_SEARCH_ENABLED, HYBRID_LEXICAL_WEIGHT, RETRIEVAL_FILTERS_ENABLED
+
+    routed = {}
+    for category, q in list(queries) + [[None, query]]:
+        if q.strip():
+            routed.setdefault(q.strip(), category)
+    queries = list(routed)
+
+    if RETRIEVAL_FILTERS_ENABLED:
+        filters = [_route_filter(routed[q], iac_tool) for q in queries]
+        result_lists = engine.multi_search(queries, k=k, where=filters)
+        missing = [i for i, docs in enumerate(result_lists) if not docs and filters[i] is not None]
+        if missing:
+            logger.info(f"Для {len(missing)} подзапросов не найдено фрагментов по фильтру. Поиск по всему индексу.")
+            for i, docs in zip(missing, engine.multi_search([queries[i] for i in missing], k=k)):
+                result_lists[i] = docs
+    else:
+        result_lists = engine.multi_search(queries, k=k)
+
+    weights = [1.0] * len(result_lists)
+    if HYBRID_SEARCH_ENABLED:
+        lexical_lists = engine.lexical_search(queries, k=k)
+        if RETRIEVAL_FILTERS_ENABLED:
+            lexical_lists = [[doc for doc in docs if _matches_tool(doc, iac_tool)] for docs in lexical_lists]
+        result_lists += lexical_lists
+        weights += [HYBRID_LEXICAL_WEIGHT] * len(lexical_lists)
+
+    fused = reciprocal_rank_fusion(result_lists, weights=weights)
+    logger.info(f"Успех! Извлечено {len(fused)} уникальных фрагментов базы знаний.")
+    return fused
+
+
+def _rerank(engine: RetrievalEngine, query: str, ranked_docs) -> list:
+    """Переоценивает фрагменты относительно исходного запроса (при включенном RERANK_MODE)."""
+    from src.reranker import rerank
+    return rerank(query, ranked_docs, embeddings=engine.embeddings, stored_vectors=engine.get_vectors)
+
+
+def _join_context(ranked_docs) -> str:
+    """Собирает текст контекста из ранжированных фрагментов в пределах бюджета токенов."""
+    from src.context import assemble_context
+    with span("context_assembly"):
+        return assemble_context(ranked_docs)
+
+
+def _build_context(engine: RetrievalEngine, query: str, ranked_docs) -> str:
+    """Переранжирует фрагменты и собирает из них контекст (CPU-работа, вне цикла событий)."""
+    return _join_context(_rerank(engine, query, ranked_docs))
+
+
+def get_relevant_context(query: str, llm=None, k: int = 3, latency_budget: float = None,
+                         iac_tool: str = None) -> str:
     """Извлекает релевантный контекст из векторной базы данных.
 
+    Если задан бюджет задержки, расширение запроса и обычный поиск по исходному
+    запросу выполняются одновременно: при готовности подзапросов в пределах
+    бюджета используется расширенный поиск, иначе - результат обычного поиска
+    (подзапросы при этом догенерируются в фоне и попадают в кэш).
+
     Args:
         query (str): Исходный запрос пользователя.
         llm: Экземпляр языковой модели для генерации подзапросов (опционально).
         k (int): Количество извлекаемых фрагментов на каждый запрос.
+        latency_budget (float): Бюджет ожидания Query Expansion в секундах
+            (по умолчанию EXPANSION_LATENCY_BUDGET, 0 - без ограничения).
+        iac_tool (str): Целевой инструмент для фильтрации фрагментов (опционально).
 
     Returns:
         str: Объединенный текст извлеченных фрагментов документации.
              Возвращает пустую строку в случае критической ошибки.
     """
+    from src.config import EXPANSION_LATENCY_BUDGET
+
+    if latency_budget is None:
+        latency_budget = EXPANSION_LATENCY_BUDGET
+
     try:
-        embeddings = HuggingFaceEmbeddings(
-            model_name="paraphrase-multilingual-MiniLM-L12-v2"
-        )
-        vector_db = Chroma(
-            persist_directory=str(DB_DIR),
-            embedding_function=embeddings
-        )
+        engine = get_engine()
 
         if llm is None:
-            docs = vector_db.similarity_search(query, k=k)
+            ranked = _search_expanded(engine, query, [], k, iac_tool)
+        elif latency_budget > 0:
+            from concurrent.futures import TimeoutError as FutureTimeoutError
+            from src.concurrency import submit_blocking
+
+            started = time.monotonic()
+            expansion = submit_blocking(expand_query, query, llm)
+            plain_ranked = _search_expanded(engine, query, [], k, iac_tool)
+            try:
+                queries = expansion.result(timeout=max(0.0, latency_budget - (time.monotonic() - started)))
+                ranked = _search_expanded(engine, query, queries, k, iac_tool)
+            except FutureTimeoutError:
+                logger.info(f"Query Expansion не уложился в бюджет {latency_budget:.1f} с. Используется обычный поиск.")
+                ranked = plain_ranked
         else:
-            logger.info("Запуск алгоритма расширения запроса (Query Expansion)...")
-            expansion_prompt = """Сгенерируй 4 альтернативных поисковых запроса для базы знаний корпоративных стандартов.
-                                Исходный запрос пользователя: {query}
+            ranked = _search_expanded(engine, query, expand_query(query, llm), k, iac_tool)
 
-                                ПРАВИЛА ГЕНЕРАЦИИ ЗАПРОСОВ:
-                                1. Первый запрос должен фокусироваться на политиках информационной безопасности и ограничениях для запрошенных компонентов.
-                                2. Второй запрос должен искать административные и корпоративные стандарты.
-                                3. Третий запрос должен быть направлен на технические требования и архитектурную связность.
-                                4. Четвертый запрос должен искать правила оптимизации затрат и выбора тарифных планов для указанных компонентов.
+        return _build_context(engine, query, ranked)
 
-                                Выведи строго 4 запроса. Каждый запрос с новой строки. Без нумерации, дефисов и дополнительных слов.
-                                """
+    except Exception as e:
+        logger.error(f"Ошибка при извлечении контекста: {str(e)}")
+        raise RuntimeError(f"Сбой компонента Retriever: {str(e)}")
 
-            try:
-                response = llm.invoke(expansion_prompt)
-                content = response.content if hasattr(response, 'content') else str(response)
-                queries = content.strip().split('\n')
-            except Exception as e:
-                logger.warning(f"Ошибка генерации подзапросов: {str(e)}")
-                queries = []
 
-            queries.append(query)
+async def aget_relevant_context(query: str, llm=None, k: int = 3, provider: str = None,
+                                latency_budget: float = None, iac_tool: str = None) -> str:
+    """Асинхронная версия get_relevant_context.
 
-            all_docs = []
-            seen_contents = set()
+    Подзапросы генерируются через ainvoke с учетом лимита одновременных
+    вызовов провайдера, а векторизация и поиск выполняются в общем
+    ограниченном пуле потоков, не блокируя цикл событий.
 
-            for q in queries:
-                if not q.strip():
-                    continue
-                found_docs = vector_db.similarity_search(q.strip(), k=k)
-                for d in found_docs:
-                    if d.page_content not in seen_contents:
-                        seen_contents.add(d.page_content)
-                        all_docs.append(d)
+    Args:
+        query (str): Исходный запрос пользователя.
+        llm: Экземпляр языковой модели для генерации подзапросов (опционально).
+        k (int): Количество извлекаемых фрагментов на каждый запрос.
+        provider (str): Имя провайдера LLM для учета лимита параллелизма.
+        latency_budget (float): Бюджет ожидания Query Expansion в секундах.
+        iac_tool (str): Целевой инструмент для фильтрации фрагментов (опционально).
 
-            docs = all_docs
-            logger.info(f"Успех! Извлечено {len(docs)} уникальных фрагментов базы знаний.")
+    Returns:
+        str: Объединенный текст извлеченных фрагментов документации.
+    """
+    import asyncio
+    from src.concurrency import run_blocking
+    from src.config import EXPANSION_LATENCY_BUDGET
+
+    if latency_budget is None:
+        latency_budget = EXPANSION_LATENCY_BUDGET
+
+    try:
+        engine = get_engine()
+
+        if llm is None:
+            ranked = await run_blocking(_search_expanded, engine, query, [], k, iac_tool)
+        elif latency_budget > 0:
+            started = time.monotonic()
+            expansion = asyncio.ensure_future(aexpand_query(query, llm, provider))
+            plain_ranked = await run_blocking(_search_expanded, engine, query, [], k, iac_tool)
+            try:
+                remaining = max(0.0, latency_budget - (time.monotonic() - started))
+                queries = await asyncio.wait_for(asyncio.shield(expansion), timeout=remaining)
+                ranked = await run_blocking(_search_expanded, engine, query, queries, k, iac_tool)
+            except asyncio.TimeoutError:
+                logger.info(f"Query Expansion не уложился в бюджет {latency_budget:.1f} с. Используется обычный поиск.")
+                ranked = plain_ranked
+        else:
+            queries = await aexpand_query(query, llm, provider)
+            ranked = await run_blocking(_search_expanded, engine, query, queries, k, iac_tool)
 
-        context = "\n\n---\n\n".join([doc.page_content for doc in docs])
-        return context
+        return await run_blocking(_build_context, engine, query, ranked)
 
     except Exception as e:
         logger.error(f"Ошибка при извлечении контекста: {str(e)}")
-        raise RuntimeError(f"Сбой компонента Retriever: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Сбой компонента Retriever: {str(e)}")
@@ -0,0 +1,433 @@
+"""
+Общий кэш для нескольких процессов (воркеров uvicorn).
+
+Кэши в памяти (ответы генератора, подзапросы Query Expansion, эмбеддинги)
+у каждого воркера свои и прогреваются независимо. Общий уровень кэша
+хранит те же данные в хранилище, доступном всем воркерам:
+- sqlite: локальный файл SQLite в режиме WAL (воркеры одного хоста);
+- redis: Redis-совместимый сервер (клиент можно передать явно,
+  например локальную замену для тестов).
+
+Single-flight: одинаковые запросы, пришедшие одновременно на разные воркеры,
+вызывают LLM один раз. Первый запрос захватывает блокировку в общем хранилище,
+остальные дожидаются появления результата в кэше.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+from src.config import (
+    SHARED_CACHE_BACKEND,
+    SHARED_CACHE_PATH,
+    SHARED_CACHE_REDIS_URL,
+    SHARED_CACHE_TTL,
+    SHARED_CACHE_MAX_ENTRIES,
+    SHARED_CACHE_FLIGHT_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+FLIGHT_POLL_INTERVAL = 0.05
+PRUNE_EVERY_WRITES = 1000
+
+# Снятие блокировки только ее владельцем: проверка токена и удаление выполняются атомарно
+REDIS_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SharedCache:
+    """
+    Базовый класс общего кэша: байтовые значения по ключам в пространствах имен
+    и блокировки с ограниченным временем жизни для single-flight.
+    """
+
+    name = "base"
+
+    def __init__(self, ttl: float = SHARED_CACHE_TTL):
+        self.ttl = ttl
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "flights_led": 0, "flights_waited": 0, "errors": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _get_many(self, keys: list) -> dict:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+    def _set_many(self, items: list, ttl: float) -> None:
+        for key, value in items:
+            self._set(key, value, ttl)
+
+    def _acquire(self, key: str, token: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    def _release(self, key: str, token: str) -> None:
+        raise NotImplementedError
+
+    def _locked(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def get_many(self, namespace: str, keys) -> dict:
+        """Возвращает найденные значения {ключ: bytes}. Ошибки хранилища считаются промахами."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            found = self._get_many([f"{namespace}:{key}" for key in keys])
+        except Exception as e:
+            logger.warning(f"Общий кэш ({self.name}) недоступен: {e}")
+            self._count("errors")
+            found = {}
+        prefix = len(namespace) + 1
+        result = {full_key[prefix:]: value for full_key, value in found.items()}
+        self._count("hits", len(result))
+        self._count("misses", len(keys) - len(result))
+        return result
+
+    def get(self, namespace: str, key: str):
+        """Возвращает значение (bytes) или None."""
+        return self.get_many(namespace, [key]).get(key)
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: float = None) -> None:
+        """Сохраняет значение на ttl секунд (по умолчанию SHARED_CACHE_TTL, 0 - без ограничения)."""
+        try:
+            self._set(f"{namespace}:{key}", value, self.ttl if ttl is None else ttl)
+            self._count("sets")
+        except Exception as e:
+            logger.warning(f"Не удалось записать в общий кэш ({self.name}): {e}")
+            self._count("errors")
+
+    def set_many(self, namespace: str, items, ttl: float = None) -> None:
+        """Сохраняет несколько значений [(ключ, bytes)] за одно обращение, если хранилище это поддерживает."""
+        items = [(f"{namespace}:{key}", value) for key, value in items]
+        if not items:
+            return
+        try:
+            self._set_many(items, self.ttl if ttl is None else ttl)
+            self._count("sets", len(items))
+        except Exception as e:
+            logger.warning(f"Не удалось записать в общий кэш ({self.name}): {e}")
+            self._count("errors")
+
+    def get_json(self, namespace: str, key: str):
+        value = self.get(namespace, key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, namespace: str, key: str, value, ttl: float = None) -> None:
+        self.set(namespace, key, json.dumps(value, ensure_ascii=False).encode("utf-8"), ttl)
+
+    def acquire(self, key: str, ttl: float = SHARED_CACHE_FLIGHT_TIMEOUT):
+        """Захватывает блокировку single-flight. Возвращает токен владельца или None."""
+        token = uuid.uuid4().hex
+        try:
+            return token if self._acquire(f"flight:{key}", token, ttl) else None
+        except Exception as e:
+            logger.warning(f"Не удалось захватить блокировку в общем кэше ({self.name}): {e}")
+            self._count("errors")
+            return token
+
+    def release(self, key: str, token: str) -> None:
+        try:
+            self._release(f"flight:{key}", token)
+        except Exception as e:
+            logger.warning(f"Не удалось снять блокировку в общем кэше ({self.name}): {e}")
+            self._count("errors")
+
+    def locked(self, key: str) -> bool:
+        try:
+            return self._locked(f"flight:{key}")
+        except Exception:
+            return False
+
+    def get_stats(self) -> dict:
+        """Возвращает статистику обращений к общему кэшу."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["backend"] = self.name
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+class SQLiteSharedCache(SharedCache):
+    """
+    Общий кэш в локальном файле SQLite.
+
+    Лимит записей действует для каждого пространства имен отдельно, поэтому
+    массовая запись эмбеддингов индексатором не вытесняет ответы генератора
+    и подзапросы Query Expansion.
+
+    Args:
+        path: Путь к файлу базы.
+        ttl (float): Время жизни записей по умолчанию.
+        max_entries (int): Максимальное число записей в пространстве имен
+            (самые старые вытесняются).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=SHARED_CACHE_PATH, ttl: float = SHARED_CACHE_TTL,
+                 max_entries: int = SHARED_CACHE_MAX_ENTRIES):
+        super().__init__(ttl)
+        self.path = str(path)
+        self.max_entries = max(1, max_entries)
+        self._local = threading.local()
+        self._writes = {}
+        self._writes_lock = threading.Lock()
+        with self._connect() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(entries)")]
+            if columns and "namespace" not in columns:
+                # Таблица предыдущего формата: кэш можно просто пересоздать
+                conn.execute("DROP TABLE entries")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, namespace TEXT, value BLOB, stored_at REAL, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_namespace_stored_at ON entries (namespace, stored_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT, expires_at REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока (создается при первом обращении)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _get_many(self, keys: list) -> dict:
+        now = time.time()
+        found = {}
+        conn = self._connect()
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, value FROM entries WHERE key IN ({','.join('?' * len(batch))}) "
+                "AND (expires_at = 0 OR expires_at > ?)",
+                (*batch, now)
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        self._set_many([(key, value)], ttl)
+
+    def _set_many(self, items: list, ttl: float) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else 0
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, namespace, value, stored_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, key.split(":", 1)[0], sqlite3.Binary(value), now, expires_at) for key, value in items]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        written = {}
+        for key, _ in items:
+            namespace = key.split(":", 1)[0]
+            written[namespace] = written.get(namespace, 0) + 1
+        for namespace, count in written.items():
+            with self._writes_lock:
+                previous = self._writes.get(namespace, 0)
+                self._writes[namespace] = previous + count
+            if previous // PRUNE_EVERY_WRITES != (previous + count) // PRUNE_EVERY_WRITES:
+                self._prune(conn, namespace, now)
+
+    def _prune(self, conn: sqlite3.Connection, namespace: str, now: float) -> None:
+        """Удаляет просроченные записи пространства имен и самые старые записи сверх лимита."""
+        conn.execute("DELETE FROM entries WHERE namespace = ? AND expires_at != 0 AND expires_at <= ?",
+                     (namespace, now))
+        excess = conn.execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)
+        ).fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries WHERE namespace = ? ORDER BY stored_at LIMIT ?)", (namespace, excess)
+            )
+
+    def _acquire(self, key: str, token: str, ttl: float) -> bool:
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO locks (key, token, expires_at) VALUES (?, ?, ?)",
+                                  (key, token, now + ttl))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def _release(self, key: str, token: str) -> None:
+        self._connect().execute("DELETE FROM locks WHERE key = ? AND token = ?", (key, token))
+
+    def _locked(self, key: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM locks WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+
+class RedisSharedCache(SharedCache):
+    """
+    Общий кэш в Redis-совместимом хранилище.
+
+    Args:
+        client: Готовый клиент с методами mget/set/exists/eval
+            (по умолчанию создается redis.Redis по url).
+        url (str): Адрес сервера.
+        prefix (str): Префикс ключей.
+        ttl (float): Время жизни записей по умолчанию.
+    """
+
+    name = "redis"
+
+    def __init__(self, client=None, url: str = SHARED_CACHE_REDIS_URL, prefix: str = "iac:",
+                 ttl: float = SHARED_CACHE_TTL):
+        super().__init__(ttl)
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _get_many(self, keys: list) -> dict:
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        self.client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def _acquire(self, key: str, token: str, ttl: float) -> bool:
+        return bool(self.client.set(self.prefix + key, token, nx=True, px=max(1, int(ttl * 1000))))
+
+    def _release(self, key: str, token: str) -> None:
+        self.client.eval(REDIS_RELEASE_SCRIPT, 1, self.prefix + key, token)
+
+    def _locked(self, key: str) -> bool:
+        return bool(self.client.exists(self.prefix + key))
+
+
+_shared_cache = None
+_shared_cache_configured = False
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """Возвращает общий кэш процесса или None, если он отключен (SHARED_CACHE_BACKEND=none)."""
+    global _shared_cache, _shared_cache_configured
+    if not _shared_cache_configured:
+        with _shared_cache_lock:
+            if not _shared_cache_configured:
+                try:
+                    if SHARED_CACHE_BACKEND == "sqlite":
+                        _shared_cache = SQLiteSharedCache()
+                    elif SHARED_CACHE_BACKEND == "redis":
+                        _shared_cache = RedisSharedCache()
+                except Exception as e:
+                    logger.warning(f"Не удалось подключить общий кэш ({SHARED_CACHE_BACKEND}): {e}")
+                _shared_cache_configured = True
+    return _shared_cache
+
+
+def set_shared_cache(cache) -> None:
+    """Подменяет общий кэш процесса (например, RedisSharedCache с тестовым клиентом или None)."""
+    global _shared_cache, _shared_cache_configured
+    with _shared_cache_lock:
+        _shared_cache, _shared_cache_configured = cache, True
+
+
+@contextmanager
+def single_flight(key: str, load, timeout: float = SHARED_CACHE_FLIGHT_TIMEOUT):
+    """
+    Гарантирует, что дорогое вычисление по ключу выполняется одним процессом.
+
+    Владелец блокировки получает None и выполняет вычисление внутри блока
+    (блокировка снимается на выходе). Остальные ждут, пока load() не вернет
+    результат, и получают его; если владелец завершился без результата
+    или истек timeout, вычисление выполняется самостоятельно.
+
+    Args:
+        key (str): Ключ вычисления.
+        load: Функция без аргументов, возвращающая готовый результат или None.
+        timeout (float): Время жизни блокировки и предельное время ожидания.
+
+    Yields:
+        Результат, вычисленный другим процессом, или None.
+    """
+    cache = get_shared_cache()
+    token = cache.acquire(key, timeout) if cache is not None else None
+    if cache is None or token is not None:
+        if cache is not None:
+            cache._count("flights_led")
+        try:
+            yield None
+        finally:
+            if cache is not None:
+                cache.release(key, token)
+        return
+
+    cache._count("flights_waited")
+    deadline = time.monotonic() + timeout
+    value = None
+    while time.monotonic() < deadline:
+        time.sleep(FLIGHT_POLL_INTERVAL)
+        value = load()
+        if value is not None or not cache.locked(key):
+            break
+    if value is None:
+        logger.info("Результат параллельного запроса не получен. Выполняется собственное вычисление.")
+    yield value
+
+
+@asynccontextmanager
+async def asingle_flight(key: str, load, timeout: float = SHARED_CACHE_FLIGHT_TIMEOUT):
+    """Асинхронная версия single_flight: обращения к хранилищу выполняются в пуле потоков."""
+    from src.concurrency import run_blocking
+
+    cache = get_shared_cache()
+    token = await run_blocking(cache.acquire, key, timeout) if cache is not None else None
+    if cache is None or token is not None:
+        if cache is not None:
+            cache._count("flights_led")
+        try:
+            yield None
+        finally:
+            if cache is not None:
+                await run_blocking(cache.release, key, token)
+        return
+
+    cache._count("flights_waited")
+    deadline = time.monotonic() + timeout
+    value = None
+    while time.monotonic() < deadline:
+        await asyncio.sleep(FLIGHT_POLL_INTERVAL)
+        value = await run_blocking(load)
+        if value is not None or not await run_blocking(cache.locked, key):
+            break
+    if value is None:
+        logger.info("Результат параллельного запроса не получен. Выполняется собственное вычисление.")
+    yield value
@@ -0,0 +1,138 @@
+"""
+Детерминированная тестовая языковая модель (LLM_PROVIDER=stub).
+
+Не обращается к сети и отвечает по фиксированным правилам: на запрос
+Query Expansion возвращает 4 подзапроса, на запрос генерации - валидный
+шаблон Terraform или Ansible в markdown-обертке, на запрос исправления -
+тот же шаблон без обертки. Используется бенчмарками, чтобы замеры
+поиска, валидации и API не зависели от внешнего провайдера.
+"""
+
+import re
+import time
+import asyncio
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.config import STUB_LLM_LATENCY
+
+EXPANSION_QUERY_PATTERN = re.compile(r"Исходный запрос пользователя:\s*(.+)")
+EXPANSION_ASPECTS = (
+    ("security", "политики безопасности"),
+    ("standards", "корпоративные стандарты"),
+    ("architecture", "архитектурные требования"),
+    ("budget", "тарифные планы"),
+)
+STREAM_CHUNK_SIZE = 16
+
+TERRAFORM_TEMPLATE = """resource "yandex_vpc_network" "main" {
+  name = "main-network"
+}
+
+resource "yandex_compute_instance" "app" {
+  name        = "app-server"
+  platform_id = "standard-v3"
+
+  resources {
+    cores  = 2
+    memory = 4
+  }
+
+  labels = {
+    cost_center = "it-infra"
+  }
+}
+"""
+
+ANSIBLE_TEMPLATE = """- name: Configure application servers
+  hosts: app
+  become: true
+  tasks:
+    - name: Install nginx
+      ansible.builtin.package:
+        name: nginx
+        state: present
+"""
+
+
+def _message_text(message) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text.split()))
+
+
+class StubChatModel(BaseChatModel):
+    """Тестовая модель с детерминированными ответами и настраиваемой задержкой."""
+
+    model_name: str = "stub"
+    latency: float = STUB_LLM_LATENCY
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _respond(self, messages) -> str:
+        texts = [_message_text(m) for m in messages]
+        prompt = "\n".join(texts)
+        system = next((text for m, text in zip(messages, texts) if m.type == "system"), "")
+
+        if not system:
+            match = EXPANSION_QUERY_PATTERN.search(prompt)
+            query = match.group(1).strip() if match else texts[-1].strip()
+            return "\n".join(f"{category}: {query} {aspect}" for category, aspect in EXPANSION_ASPECTS)
+
+        template = ANSIBLE_TEMPLATE if "ansible" in system.lower() else TERRAFORM_TEMPLATE
+        if "ОШИБКИ ПАРСЕРА" in system:
+            return template
+        lang = "yaml" if template is ANSIBLE_TEMPLATE else "hcl"
+        return f"```{lang}\n{template}```"
+
+    def _usage(self, messages, text: str) -> dict:
+        input_tokens = sum(_estimate_tokens(_message_text(m)) for m in messages)
+        output_tokens = _estimate_tokens(text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _result(self, messages) -> ChatResult:
+        text = self._respond(messages)
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, messages):
+        text = self._respond(messages)
+        pieces = [text[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(text), STREAM_CHUNK_SIZE)]
+        for i, piece in enumerate(pieces):
+            usage = self._usage(messages, text) if i == len(pieces) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
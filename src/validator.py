@@ -1,52 +1,204 @@
 """
 Модуль валидации сгенерированных сценариев инфраструктуры.
 
-Поддерживает синтаксическую проверку YAML (Ansible) и HCL (Terraform)
+Поддерживает синтаксическую проверку YAML (Ansible) и HCL (Terraform).
+
+Результаты возвращаются в виде структурированной диагностики (строка, столбец,
+сообщение) и кэшируются по хэшу содержимого. Для пакетных задач доступна
+параллельная проверка в пуле процессов (validate_many, см. src.batch).
 """
 
+import re
+import hashlib
+import logging
+import multiprocessing
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor
+
 import yaml
 import hcl2
-import logging
+
+from src.cache import TTLCache
+from src.config import VALIDATION_CACHE_SIZE, VALIDATION_WORKERS
+from src.metrics import span
 
 logger = logging.getLogger(__name__)
 
-def validate_iac(content: str, iac_tool: str) -> bool:
-    """
-    Проверяет валидность кода в зависимости от выбранного инструмента.
-    
-    Args:
-        content (str): Сгенерированный код.
-        iac_tool (str): Целевой инструмент ('terraform' или 'ansible').
-        
-    Returns:
-        bool: True, если валидация пройдена.
-    """
-    logger.info(f"Запуск валидации кода для инструмента: {iac_tool.upper()}")
-    
+_POSITION_PATTERN = re.compile(r"line (\d+),? col(?:umn)? (\d+)", re.IGNORECASE)
+
+_cache = TTLCache(max_entries=VALIDATION_CACHE_SIZE)
+
+
+@dataclass
+class Diagnostic:
+    """Сообщение валидатора с позицией в исходном тексте."""
+    message: str
+    line: Optional[int] = None
+    column: Optional[int] = None
+    severity: str = "error"
+
+
+@dataclass
+class ValidationResult:
+    """Результат проверки сгенерированного кода."""
+    tool: str
+    is_valid: bool
+    diagnostics: List[Diagnostic] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _content_key(content: str, iac_tool: str) -> str:
+    return hashlib.sha256(f"{iac_tool}\0{content}".encode("utf-8")).hexdigest()
+
+
+def _yaml_diagnostic(exc: yaml.YAMLError) -> Diagnostic:
+    mark = getattr(exc, "problem_mark", None)
+    message = " ".join(filter(None, [getattr(exc, "context", None), getattr(exc, "problem", None)])) or str(exc)
+    if mark is None:
+        return Diagnostic(message=message)
+    return Diagnostic(message=message, line=mark.line + 1, column=mark.column + 1)
+
+
+def _hcl_diagnostic(exc: Exception) -> Diagnostic:
+    line, column = getattr(exc, "line", None), getattr(exc, "column", None)
+    text = str(exc)
+    if not isinstance(line, int) or line < 1:
+        match = _POSITION_PATTERN.search(text)
+        line, column = (int(match.group(1)), int(match.group(2))) if match else (None, None)
+    message = text.strip().splitlines()[0] if text.strip() else type(exc).__name__
+    return Diagnostic(message=message, line=line, column=column)
+
+
+def _validate_uncached(content: str, iac_tool: str) -> ValidationResult:
+    """Разбирает код парсером выбранного инструмента и формирует диагностику."""
     if iac_tool == 'ansible':
         try:
             parsed_data = yaml.safe_load(content)
             if not parsed_data or not isinstance(parsed_data, (dict, list)):
-                logger.warning("Сгенерированный код пуст или не является валидной структурой.")
-                return False
-            logger.info("Синтаксис YAML (Ansible) корректен.")
-            return True
+                return ValidationResult(iac_tool, False, [
+                    Diagnostic("Сгенерированный код пуст или не является валидной структурой.")
+                ])
+            return ValidationResult(iac_tool, True)
         except yaml.YAMLError as exc:
-            logger.error(f"Ошибка парсинга YAML: {exc}")
-            return False
+            return ValidationResult(iac_tool, False, [_yaml_diagnostic(exc)])
 
     elif iac_tool == 'terraform':
         try:
             parsed_data = hcl2.loads(content)
             if not parsed_data:
-                logger.warning("Сгенерированный код HCL пуст или не содержит структур данных.")
-                return False
-            logger.info("Синтаксис HCL (Terraform) корректен.")
-            return True
+                return ValidationResult(iac_tool, False, [
+                    Diagnostic("Сгенерированный код HCL пуст или не содержит структур данных.")
+                ])
+            return ValidationResult(iac_tool, True)
         except Exception as exc:
-            logger.error(f"Ошибка парсинга HCL (Terraform): {exc}")
-            return False
+            return ValidationResult(iac_tool, False, [_hcl_diagnostic(exc)])
+
+    else:
+        return ValidationResult(iac_tool, True, [
+            Diagnostic(f"Неизвестный тип IaC: {iac_tool}. Валидация пропущена.", severity="warning")
+        ])
+
+
+def validate_iac_detailed(content: str, iac_tool: str) -> ValidationResult:
+    """
+    Проверяет код и возвращает структурированную диагностику.
+
+    Результат кэшируется по хэшу содержимого, поэтому повторная проверка
+    того же кода (например, в API после генератора) не требует разбора.
+
+    Args:
+        content (str): Сгенерированный код.
+        iac_tool (str): Целевой инструмент ('terraform' или 'ansible').
+
+    Returns:
+        ValidationResult: Признак валидности и список диагностик.
+    """
+    logger.info(f"Запуск валидации кода для инструмента: {iac_tool.upper()}")
+    key = _content_key(content, iac_tool)
+    result = _cache.get(key)
+    if result is None:
+        with span("validation"):
+            result = _validate_uncached(content, iac_tool)
+        _cache.set(key, result)
+
+    for diagnostic in result.diagnostics:
+        if diagnostic.severity == "warning":
+            logger.warning(diagnostic.message)
+            continue
+        position = f" (строка {diagnostic.line}, столбец {diagnostic.column})" if diagnostic.line else ""
+        logger.error(f"Ошибка валидации {iac_tool.upper()}{position}: {diagnostic.message}")
+
+    if result.is_valid and iac_tool in ('ansible', 'terraform'):
+        kind = "YAML (Ansible)" if iac_tool == 'ansible' else "HCL (Terraform)"
+        logger.info(f"Синтаксис {kind} корректен.")
+    return result
+
+
+def validate_iac(content: str, iac_tool: str) -> bool:
+    """
+    Проверяет валидность кода в зависимости от выбранного инструмента.
+
+    Args:
+        content (str): Сгенерированный код.
+        iac_tool (str): Целевой инструмент ('terraform' или 'ansible').
 
+    Returns:
+        bool: True, если валидация пройдена.
+    """
+    return validate_iac_detailed(content, iac_tool).is_valid
+
+
+def get_validation_cache_stats() -> dict:
+    """Возвращает статистику кэша результатов валидации."""
+    return _cache.get_stats()
+
+
+def validate_many(items, workers: int = VALIDATION_WORKERS, pool: ProcessPoolExecutor = None) -> List[ValidationResult]:
+    """
+    Проверяет множество фрагментов кода параллельно в пуле процессов.
+
+    Уже проверенные фрагменты берутся из кэша, в пул отправляются только новые.
+
+    Args:
+        items: Последовательность пар (код, инструмент).
+        workers (int): Число процессов.
+        pool (ProcessPoolExecutor): Готовый пул процессов (опционально). Если
+            он передан, проверка всегда выполняется в нем, иначе пул создается
+            на время вызова.
+
+    Returns:
+        list: Результаты в порядке входных элементов.
+    """
+    items = list(items)
+    keys = [_content_key(content, tool) for content, tool in items]
+    results = [_cache.get(key) for key in keys]
+
+    pending = {}
+    for i, result in enumerate(results):
+        if result is None:
+            pending.setdefault(keys[i], []).append(i)
+    if not pending:
+        return results
+
+    unique = [(key, items[indexes[0]]) for key, indexes in pending.items()]
+    contents = [content for _, (content, _) in unique]
+    tools = [tool for _, (_, tool) in unique]
+    chunksize = max(1, len(unique) // (max(1, workers) * 4))
+    if pool is not None:
+        computed = list(pool.map(_validate_uncached, contents, tools, chunksize=chunksize))
+    elif workers <= 1 or len(unique) == 1:
+        computed = [_validate_uncached(content, tool) for content, tool in zip(contents, tools)]
     else:
-        logger.warning(f"Неизвестный тип IaC: {iac_tool}. Валидация пропущена.")
-        return True
\ No newline at end of file
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(unique)), mp_context=context) as own_pool:
+            computed = list(own_pool.map(_validate_uncached, contents, tools, chunksize=chunksize))
+
+    for (key, _), result in zip(unique, computed):
+        _cache.set(key, result)
+        for i in pending[key]:
+            results[i] = result
+    return results
+
@@ -0,0 +1,591 @@
+"""
+Векторные хранилища фрагментов документации.
+
+Индексатор и движок поиска работают с хранилищем через общий интерфейс
+VectorStore, реализация выбирается настройкой VECTOR_STORE_BACKEND:
+- chroma: персистентная коллекция Chroma;
+- numpy: встроенный компактный индекс. Нормированные векторы (float32 или
+  int8 с масштабом на строку) хранятся в файле .npy и открываются через
+  memory map, поэтому воркеры uvicorn разделяют одни и те же страницы
+  без копирования, а открытие индекса занимает миллисекунды. Поиск top-k
+  выполняется матричным умножением только по строкам, прошедшим фильтр
+  по метаданным (столбцы метаданных также хранятся массивами NumPy).
+
+Фильтры задаются в синтаксисе Chroma: {"key": value}, {"key": {"$in": [...]}},
+{"$and": [...]}, {"$or": [...]}.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from src.config import VECTOR_STORE_BACKEND, VECTOR_STORE_DTYPE
+
+logger = logging.getLogger(__name__)
+
+NUMPY_STORE_DIR = "vectors"
+CURRENT_FILE = "CURRENT"
+SEGMENT_ROWS = 4096
+SCORE_BLOCK_ROWS = 65536
+INT8_MAX = 127
+
+
+def vector_store_id(backend: str = VECTOR_STORE_BACKEND, dtype: str = VECTOR_STORE_DTYPE) -> str:
+    """Идентификатор формата хранилища для манифеста индекса."""
+    return backend if backend == "chroma" else f"{backend}-{dtype}"
+
+
+def _document(doc_id, text, metadata):
+    from langchain_core.documents import Document
+    return Document(id=doc_id, page_content=text, metadata=metadata or {})
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _quantize(vectors: np.ndarray):
+    """Симметрично квантизует строки в int8 и возвращает (векторы, масштабы)."""
+    scales = np.abs(vectors).max(axis=1) / INT8_MAX if len(vectors) else np.zeros(0, dtype=np.float32)
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(vectors / scales[:, None]), -INT8_MAX, INT8_MAX).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class VectorStore:
+    """Интерфейс векторного хранилища фрагментов документации."""
+
+    name = "base"
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def add_documents(self, documents, ids) -> None:
+        """Векторизует и добавляет фрагменты."""
+        raise NotImplementedError
+
+    def delete(self, ids) -> None:
+        """Удаляет фрагменты по идентификаторам."""
+        raise NotImplementedError
+
+    def query(self, vectors, k: int, where: dict = None) -> list:
+        """
+        Ищет ближайшие фрагменты для нескольких векторов запросов.
+
+        Args:
+            vectors: Векторы запросов.
+            k (int): Число результатов на каждый запрос.
+            where (dict): Фильтр по метаданным (опционально).
+
+        Returns:
+            list: Списки Document для каждого запроса по убыванию близости.
+        """
+        raise NotImplementedError
+
+    def get(self, ids) -> list:
+        """Возвращает фрагменты по идентификаторам (отсутствующие пропускаются)."""
+        raise NotImplementedError
+
+    def get_vectors(self, ids) -> dict:
+        """Возвращает сохраненные векторы фрагментов по идентификаторам (отсутствующие пропускаются)."""
+        return {}
+
+    def iter_texts(self, page_size: int):
+        """Отдает все фрагменты хранилища страницами (ids, texts)."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Возвращает число фрагментов в хранилище."""
+        raise NotImplementedError
+
+    def similarity_search(self, query: str, k: int = 3, where: dict = None) -> list:
+        """Векторизует запрос и ищет ближайшие фрагменты."""
+        return self.query([self.embeddings.embed_query(query)], k, where)[0]
+
+    def persist(self) -> None:
+        """Сохраняет накопленные изменения (для хранилищ с отложенной записью)."""
+
+    def close(self) -> None:
+        """Освобождает ресурсы хранилища."""
+
+
+class ChromaVectorStore(VectorStore):
+    """Хранилище на базе персистентной коллекции Chroma."""
+
+    name = "chroma"
+
+    def __init__(self, directory, embeddings):
+        from langchain_chroma import Chroma
+
+        super().__init__(embeddings)
+        self._db = Chroma(persist_directory=str(directory), embedding_function=embeddings)
+
+    def add_documents(self, documents, ids) -> None:
+        self._db.add_documents(documents=documents, ids=ids)
+
+    def delete(self, ids) -> None:
+        if ids:
+            self._db.delete(ids=list(ids))
+
+    def query(self, vectors, k: int, where: dict = None) -> list:
+        result = self._db._collection.query(
+            query_embeddings=vectors,
+            n_results=k,
+            where=where or None,
+            include=["documents", "metadatas"]
+        )
+        return [
+            [_document(doc_id, text, metadata) for doc_id, text, metadata in zip(ids, texts, metadatas)]
+            for ids, texts, metadatas in zip(result["ids"], result["documents"], result["metadatas"])
+        ]
+
+    def get(self, ids) -> list:
+        found = self._db._collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return [
+            _document(doc_id, text, metadata)
+            for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        ]
+
+    def get_vectors(self, ids) -> dict:
+        found = self._db._collection.get(ids=list(ids), include=["embeddings"])
+        vectors = found.get("embeddings")
+        if vectors is None:
+            return {}
+        return {doc_id: np.asarray(vector, dtype=np.float32) for doc_id, vector in zip(found["ids"], vectors)}
+
+    def iter_texts(self, page_size: int):
+        offset = 0
+        while True:
+            page = self._db._collection.get(include=["documents"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield page["ids"], page["documents"]
+            offset += len(page["ids"])
+
+    def count(self) -> int:
+        return self._db._collection.count()
+
+    def close(self) -> None:
+        self._db = None
+        try:
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        except Exception as e:
+            logger.debug(f"Не удалось очистить кэш клиентов Chroma: {e}")
+
+
+class _ColumnBuilder:
+    """Накопитель столбцов метаданных нового тома индекса (ключ -> коды строк и словарь значений)."""
+
+    def __init__(self, count: int):
+        self.count = count
+        self.columns = {}
+
+    def column(self, key: str):
+        if key not in self.columns:
+            self.columns[key] = (np.full(self.count, -1, np.int32), {})
+        return self.columns[key]
+
+    def code(self, key: str, value_key: str) -> int:
+        values = self.column(key)[1]
+        return values.setdefault(value_key, len(values))
+
+    def add(self, row: int, metadata: dict) -> None:
+        for key, value in (metadata or {}).items():
+            self.column(key)[0][row] = self.code(key, _value_key(value))
+
+
+def _value_key(value) -> str:
+    """Ключ значения метаданных в словаре столбца (различает, например, True и 1)."""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Встроенный индекс в файлах NumPy.
+
+    Каталог vectors/ содержит тома v-<id>/ и файл CURRENT с именем активного тома.
+    Том содержит:
+    - vectors.npy: нормированные векторы N x D (float32 или int8);
+    - scales.npy: масштабы строк для int8;
+    - records.bin и offsets.npy: JSON-записи {"text", "metadata"} подряд,
+      декодируются только для найденных фрагментов;
+    - codes.npy и values-<j>.json: столбцы метаданных (коды значений N x K
+      и словари значений), по которым фильтр вычисляется без чтения записей;
+    - ids.json и meta.json.
+
+    Добавленные фрагменты сбрасываются на диск сегментами по SEGMENT_ROWS строк,
+    а persist() потоково собирает из старого тома и сегментов новый том и атомарно
+    переключает на него CURRENT. Читатели продолжают работать со старым томом до
+    перезагрузки индекса; предыдущий том удаляется только при следующей записи.
+    Писатель у каталога должен быть один (индексатор).
+    """
+
+    name = "numpy"
+
+    def __init__(self, directory, embeddings, dtype: str = VECTOR_STORE_DTYPE):
+        super().__init__(embeddings)
+        self.directory = Path(directory) / NUMPY_STORE_DIR
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._load()
+
+    def _current_volume(self):
+        try:
+            name = (self.directory / CURRENT_FILE).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return None
+        return name or None
+
+    def _load(self) -> None:
+        self._row_index = None
+        self._ids = None
+        self._value_codes = {}
+        self._staged = {}
+        self._segments = []
+        self._buffer = []
+        self._staging_dir = None
+        self._deleted = set()
+
+        for attempt in range(2):
+            self.volume = self._current_volume()
+            if self.volume is None:
+                break
+            try:
+                self._open(self.directory / self.volume)
+                return
+            except FileNotFoundError:
+                # Том удален писателем между чтением CURRENT и открытием файлов
+                if attempt:
+                    raise
+        self.volume = None
+        self._count = 0
+        self._ids = []
+        self.columns = []
+        self.vectors = None
+        self.scales = None
+        self.codes = None
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.records = np.zeros(0, dtype=np.uint8)
+
+    def _open(self, path: Path) -> None:
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        self.dtype = meta["dtype"]
+        self._count = meta["count"]
+        self.columns = meta["columns"]
+        self._volume_path = path
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        self.scales = np.load(path / "scales.npy", mmap_mode="r") if self.dtype == "int8" else None
+        self.codes = np.load(path / "codes.npy", mmap_mode="r")
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        records_path = path / "records.bin"
+        self.records = (
+            np.memmap(records_path, dtype=np.uint8, mode="r")
+            if records_path.stat().st_size else np.zeros(0, dtype=np.uint8)
+        )
+
+    @property
+    def ids(self) -> list:
+        """Идентификаторы фрагментов тома (читаются при первом обращении)."""
+        if self._ids is None:
+            with self._lock:
+                if self._ids is None:
+                    self._ids = json.loads((self._volume_path / "ids.json").read_text(encoding="utf-8"))
+        return self._ids
+
+    def _raw_record(self, row: int) -> bytes:
+        return self.records[int(self.offsets[row]):int(self.offsets[row + 1])].tobytes()
+
+    def _record(self, row: int) -> dict:
+        return json.loads(self._raw_record(row))
+
+    def _document(self, row: int):
+        record = self._record(row)
+        return _document(self.ids[row], record["text"], record["metadata"])
+
+    def _rows(self) -> dict:
+        if self._row_index is None:
+            ids = self.ids
+            with self._lock:
+                if self._row_index is None:
+                    self._row_index = {doc_id: row for row, doc_id in enumerate(ids)}
+        return self._row_index
+
+    def add_documents(self, documents, ids) -> None:
+        texts = [doc.page_content for doc in documents]
+        vectors = _normalize(self.embeddings.embed_documents(texts))
+        rows = self._rows()
+        for doc_id, doc, vector in zip(ids, documents, vectors):
+            if doc_id in rows:
+                self._deleted.add(doc_id)
+            record = json.dumps({"text": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False)
+            self._staged[doc_id] = (len(self._segments), len(self._buffer))
+            self._buffer.append((doc_id, vector, record.encode("utf-8")))
+        if len(self._buffer) >= SEGMENT_ROWS:
+            self._flush_segment()
+
+    def delete(self, ids) -> None:
+        rows = self._rows()
+        for doc_id in ids:
+            self._staged.pop(doc_id, None)
+            if doc_id in rows:
+                self._deleted.add(doc_id)
+
+    def _flush_segment(self) -> None:
+        """Сбрасывает буфер добавленных фрагментов на диск отдельным сегментом."""
+        if not self._buffer:
+            return
+        if self._staging_dir is None:
+            for stale in self.directory.glob("staging-*"):
+                shutil.rmtree(stale, ignore_errors=True)
+            self._staging_dir = self.directory / f"staging-{uuid.uuid4().hex[:12]}"
+            self._staging_dir.mkdir(parents=True)
+        path = self._staging_dir / f"{len(self._segments):06d}"
+        path.mkdir()
+        np.save(path / "vectors.npy", np.stack([vector for _, vector, _ in self._buffer]).astype(np.float32))
+        offsets = np.zeros(len(self._buffer) + 1, dtype=np.int64)
+        np.cumsum([len(record) for _, _, record in self._buffer], out=offsets[1:])
+        np.save(path / "offsets.npy", offsets)
+        with open(path / "records.bin", "wb") as f:
+            for _, _, record in self._buffer:
+                f.write(record)
+        self._segments.append((path, [doc_id for doc_id, _, _ in self._buffer]))
+        self._buffer = []
+
+    def _column_values(self, column: int) -> list:
+        return json.loads((self._volume_path / f"values-{column}.json").read_text(encoding="utf-8"))
+
+    def persist(self) -> None:
+        if not self._staged and not self._deleted:
+            return
+        self._flush_segment()
+
+        keep = np.array([row for row, doc_id in enumerate(self.ids) if doc_id not in self._deleted], dtype=np.int64)
+        fresh = []
+        for segment, (_, segment_ids) in enumerate(self._segments):
+            rows = [row for row, doc_id in enumerate(segment_ids) if self._staged.get(doc_id) == (segment, row)]
+            if rows:
+                fresh.append((segment, rows))
+        count = len(keep) + sum(len(rows) for _, rows in fresh)
+        if self.vectors is not None:
+            dim = self.vectors.shape[1]
+        elif fresh:
+            dim = np.load(self._segments[fresh[0][0]][0] / "vectors.npy", mmap_mode="r").shape[1]
+        else:
+            dim = 0
+
+        volume = f"v-{uuid.uuid4().hex[:12]}"
+        target = self.directory / volume
+        target.mkdir(parents=True)
+        vector_dtype = np.int8 if self.dtype == "int8" else np.float32
+        vectors = np.lib.format.open_memmap(target / "vectors.npy", mode="w+", dtype=vector_dtype, shape=(count, dim))
+        scales = (
+            np.lib.format.open_memmap(target / "scales.npy", mode="w+", dtype=np.float32, shape=(count,))
+            if self.dtype == "int8" else None
+        )
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        builder = _ColumnBuilder(count)
+        ids = []
+        out = 0
+
+        with open(target / "records.bin", "wb") as records_file:
+            remaps = [
+                np.array([builder.code(key, value) for value in self._column_values(j)] + [-1], dtype=np.int32)
+                for j, key in enumerate(self.columns)
+            ]
+            for start in range(0, len(keep), SEGMENT_ROWS):
+                block = keep[start:start + SEGMENT_ROWS]
+                end = out + len(block)
+                vectors[out:end] = self.vectors[block]
+                if scales is not None:
+                    scales[out:end] = self.scales[block]
+                block_codes = np.asarray(self.codes[block])
+                for j, key in enumerate(self.columns):
+                    builder.column(key)[0][out:end] = remaps[j][block_codes[:, j]]
+                for i, row in enumerate(block):
+                    record = self._raw_record(int(row))
+                    records_file.write(record)
+                    offsets[out + i + 1] = offsets[out + i] + len(record)
+                    ids.append(self.ids[int(row)])
+                out = end
+
+            for segment, rows in fresh:
+                path, segment_ids = self._segments[segment]
+                segment_vectors = np.load(path / "vectors.npy")[rows]
+                segment_offsets = np.load(path / "offsets.npy")
+                end = out + len(rows)
+                if scales is not None:
+                    vectors[out:end], scales[out:end] = _quantize(segment_vectors)
+                else:
+                    vectors[out:end] = segment_vectors
+                with open(path / "records.bin", "rb") as f:
+                    segment_records = f.read()
+                for i, row in enumerate(rows):
+                    record = segment_records[segment_offsets[row]:segment_offsets[row + 1]]
+                    records_file.write(record)
+                    offsets[out + i + 1] = offsets[out + i] + len(record)
+                    builder.add(out + i, json.loads(record)["metadata"])
+                    ids.append(segment_ids[row])
+                out = end
+
+        vectors.flush()
+        del vectors
+        if scales is not None:
+            scales.flush()
+            del scales
+        columns = list(builder.columns)
+        codes = (
+            np.stack([builder.columns[key][0] for key in columns], axis=1)
+            if columns else np.zeros((count, 0), dtype=np.int32)
+        )
+        np.save(target / "codes.npy", codes)
+        for j, key in enumerate(columns):
+            values = sorted(builder.columns[key][1], key=builder.columns[key][1].get)
+            (target / f"values-{j}.json").write_text(json.dumps(values, ensure_ascii=False), encoding="utf-8")
+        np.save(target / "offsets.npy", offsets)
+        (target / "ids.json").write_text(json.dumps(ids), encoding="utf-8")
+        (target / "meta.json").write_text(
+            json.dumps({"dtype": self.dtype, "dim": int(dim), "count": count, "columns": columns}), encoding="utf-8"
+        )
+
+        previous = self.volume
+        pointer_tmp = self.directory / f"{CURRENT_FILE}.tmp"
+        pointer_tmp.write_text(volume, encoding="utf-8")
+        os.replace(pointer_tmp, self.directory / CURRENT_FILE)
+
+        for stale in self.directory.glob("v-*"):
+            if stale.name not in (volume, previous):
+                shutil.rmtree(stale, ignore_errors=True)
+        if self._staging_dir is not None:
+            shutil.rmtree(self._staging_dir, ignore_errors=True)
+        self.close()
+        self._load()
+        logger.info(f"Встроенный векторный индекс сохранен: {count} фрагментов ({self.dtype}).")
+
+    def _scores(self, queries: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """Косинусное сходство фрагментов (всех или только rows) с запросами (N x M)."""
+        total = self._count if rows is None else len(rows)
+        scores = np.empty((total, len(queries)), dtype=np.float32)
+        for start in range(0, total, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, total)
+            index = slice(start, end) if rows is None else rows[start:end]
+            block_scores = np.asarray(self.vectors[index], dtype=np.float32) @ queries.T
+            if self.scales is not None:
+                block_scores *= np.asarray(self.scales[index])[:, None]
+            scores[start:end] = block_scores
+        return scores
+
+    def _codes_for(self, column: int, values) -> list:
+        """Коды значений столбца (словарь значений читается при первом обращении)."""
+        lookup = self._value_codes.get(column)
+        if lookup is None:
+            lookup = {value: code for code, value in enumerate(self._column_values(column))}
+            self._value_codes[column] = lookup
+        return [lookup[key] for key in map(_value_key, values) if key in lookup]
+
+    def _mask(self, where: dict) -> np.ndarray:
+        """Вычисляет маску фрагментов, удовлетворяющих фильтру."""
+        masks = []
+        for key, condition in where.items():
+            if key == "$and":
+                masks.extend(self._mask(item) for item in condition)
+                continue
+            if key == "$or":
+                any_mask = np.zeros(self._count, dtype=bool)
+                for item in condition:
+                    any_mask |= self._mask(item)
+                masks.append(any_mask)
+                continue
+            op, operand = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+            if op not in ("$eq", "$ne", "$in", "$nin"):
+                raise ValueError(f"Неподдерживаемый оператор фильтра: {op}")
+            wanted = operand if op in ("$in", "$nin") else [operand]
+            if key in self.columns:
+                column = self.columns.index(key)
+                mask = np.isin(self.codes[:, column], self._codes_for(column, wanted))
+            else:
+                mask = np.zeros(self._count, dtype=bool)
+            masks.append(~mask if op in ("$ne", "$nin") else mask)
+
+        result = np.ones(self._count, dtype=bool)
+        for mask in masks:
+            result &= mask
+        return result
+
+    def query(self, vectors, k: int, where: dict = None) -> list:
+        queries = _normalize(vectors)
+        if not self._count or k <= 0:
+            return [[] for _ in queries]
+
+        rows = np.flatnonzero(self._mask(where)) if where else None
+        if rows is not None and not len(rows):
+            return [[] for _ in queries]
+        scores = self._scores(queries, rows)
+        k = min(k, len(scores))
+
+        results = []
+        for column in scores.T:
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.lexsort((top, -column[top]))]
+            found = top if rows is None else rows[top]
+            results.append([self._document(int(row)) for row in found])
+        return results
+
+    def get(self, ids) -> list:
+        rows = self._rows()
+        return [self._document(rows[doc_id]) for doc_id in ids if doc_id in rows]
+
+    def get_vectors(self, ids) -> dict:
+        rows = self._rows()
+        found = {}
+        for doc_id in ids:
+            row = rows.get(doc_id)
+            if row is None:
+                continue
+            vector = np.asarray(self.vectors[row], dtype=np.float32)
+            found[doc_id] = vector * self.scales[row] if self.scales is not None else vector
+        return found
+
+    def iter_texts(self, page_size: int):
+        for start in range(0, self._count, page_size):
+            rows = range(start, min(start + page_size, self._count))
+            yield [self.ids[row] for row in rows], [self._record(row)["text"] for row in rows]
+
+    def count(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        self.vectors = None
+        self.scales = None
+        self.codes = None
+        self.records = np.zeros(0, dtype=np.uint8)
+
+
+def create_vector_store(directory, embeddings, backend: str = VECTOR_STORE_BACKEND,
+                        dtype: str = VECTOR_STORE_DTYPE) -> VectorStore:
+    """
+    Открывает векторное хранилище выбранного типа.
+
+    Args:
+        directory: Каталог векторной базы данных.
+        embeddings: Модель эмбеддингов.
+        backend (str): 'chroma' или 'numpy'.
+        dtype (str): Формат векторов встроенного индекса ('float32' или 'int8').
+
+    Returns:
+        VectorStore: Хранилище фрагментов.
+    """
+    if backend == "numpy":
+        return NumpyVectorStore(directory, embeddings, dtype)
+    return ChromaVectorStore(directory, embeddings)
@@ -0,0 +1,65 @@
+"""Тесты сборки контекста (src.context): слияние перекрытий, дедупликация SimHash, бюджет токенов."""
+
+import unittest
+
+from langchain_core.documents import Document
+
+from src.context import CONTEXT_SEPARATOR, assemble_context, estimate_tokens
+
+
+def _text(start: int, count: int) -> str:
+    return " ".join(f"слово{i}" for i in range(start, start + count))
+
+
+def _doc(text: str, source: str = "docs/a.md", start_index=None) -> Document:
+    metadata = {"source": source}
+    if start_index is not None:
+        metadata["start_index"] = start_index
+    return Document(page_content=text, metadata=metadata)
+
+
+class AssembleContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.full = _text(0, 60)
+        self.head = self.full[:300]
+        self.tail_start = 200
+        self.tail = self.full[self.tail_start:]
+
+    def test_overlapping_chunks_of_one_source_are_merged(self):
+        ranked = [(_doc(self.tail, start_index=self.tail_start), 0.9), (_doc(self.head, start_index=0), 0.8)]
+        self.assertEqual(assemble_context(ranked, token_budget=0), self.full)
+
+    def test_stale_offsets_fall_back_to_text_overlap(self):
+        ranked = [(_doc(self.head, start_index=0), 0.9), (_doc(self.tail, start_index=120), 0.8)]
+        self.assertEqual(assemble_context(ranked, token_budget=0), self.full)
+
+    def test_chunks_of_different_sources_are_not_merged(self):
+        ranked = [(_doc(self.head, "docs/a.md", 0), 0.9), (_doc(self.tail, "docs/b.md", self.tail_start), 0.8)]
+        self.assertEqual(assemble_context(ranked, token_budget=0).split(CONTEXT_SEPARATOR), [self.head, self.tail])
+
+    def test_near_duplicates_are_dropped(self):
+        duplicate = _text(100, 40)
+        other = _text(500, 40)
+        ranked = [(_doc(duplicate, "docs/a.md"), 0.9), (_doc(duplicate + " ", "docs/b.md"), 0.8),
+                  (_doc(other, "docs/c.md"), 0.7)]
+        self.assertEqual(assemble_context(ranked, token_budget=0).split(CONTEXT_SEPARATOR), [duplicate, other])
+
+    def test_budget_keeps_best_chunks_that_fit(self):
+        texts = [_text(1000 * i, 30) for i in range(3)]
+        ranked = [(_doc(text, f"docs/{i}.md"), 1.0 - i / 10) for i, text in enumerate(texts)]
+        budget = estimate_tokens(texts[0]) + estimate_tokens(CONTEXT_SEPARATOR) + estimate_tokens(texts[1])
+
+        context = assemble_context(ranked, token_budget=budget)
+
+        self.assertEqual(context.split(CONTEXT_SEPARATOR), texts[:2])
+
+    def test_first_chunk_is_truncated_to_budget(self):
+        text = _text(0, 100)
+        context = assemble_context([(_doc(text), 1.0)], token_budget=10)
+        self.assertTrue(text.startswith(context))
+        self.assertLessEqual(estimate_tokens(context), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
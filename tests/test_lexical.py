@@ -0,0 +1,102 @@
+"""Тесты лексического индекса BM25 (src.lexical): сегменты, удаление, слияние."""
+
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.lexical import BM25Index, BM25SegmentBuilder, tokenize, update_index
+
+DOCS = {
+    "vm": "Виртуальная машина Ubuntu 22.04 с 2 ядрами и 4 ГБ памяти",
+    "sg": "Группа безопасности запрещает порт 22 для 0.0.0.0/0",
+    "tags": "Все ресурсы должны иметь метку cost_center",
+    "net": "Сеть проекта использует диапазон 10.0.0.0/16 и подсеть для виртуальных машин",
+    "backup": "Резервные копии дисков виртуальных машин хранятся 14 дней",
+    "budget": "Бюджет проекта ограничен: не более 8 виртуальных машин",
+}
+QUERIES = ("виртуальная машина", "порт 22", "cost_center", "10.0.0.0/16 подсеть", "виртуальных машин дней")
+
+
+def _builder(ids) -> BM25SegmentBuilder:
+    builder = BM25SegmentBuilder()
+    builder.add(list(ids), [DOCS[doc_id] for doc_id in ids])
+    return builder
+
+
+def _monolithic(ids) -> BM25Index:
+    return BM25Index([_builder(ids).build()])
+
+
+class BM25IndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name) / "bm25"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertSameResults(self, index, expected):
+        for query in QUERIES:
+            actual = index.search(query, k=10)
+            wanted = expected.search(query, k=10)
+            self.assertEqual([doc_id for doc_id, _ in actual], [doc_id for doc_id, _ in wanted], query)
+            for (_, score), (_, wanted_score) in zip(actual, wanted):
+                self.assertAlmostEqual(score, wanted_score, places=4)
+
+    def test_tokenize_keeps_identifiers_and_their_parts(self):
+        tokens = tokenize("instance_type t3.medium")
+        self.assertIn("t3.medium", tokens)
+        self.assertIn("medium", tokens)
+        self.assertIn("instance_type", tokens)
+
+    def test_segmented_index_scores_like_monolithic(self):
+        update_index(self.directory, _builder(["vm", "sg", "tags"]))
+        update_index(self.directory, _builder(["net", "backup", "budget"]))
+        index = BM25Index.load(self.directory)
+
+        self.assertEqual(len(index.segments), 2)
+        self.assertSameResults(index, _monolithic(DOCS))
+
+    def test_deleted_documents_are_not_returned(self):
+        update_index(self.directory, _builder(DOCS))
+        update_index(self.directory, removed=["sg"])
+        index = BM25Index.load(self.directory)
+
+        self.assertEqual(len(index), len(DOCS) - 1)
+        self.assertNotIn("sg", [doc_id for doc_id, _ in index.search("порт 22", k=10)])
+
+    def test_readded_document_replaces_old_version(self):
+        update_index(self.directory, _builder(DOCS))
+        builder = BM25SegmentBuilder()
+        builder.add(["tags"], ["Метка owner обязательна для всех ресурсов"])
+        index = update_index(self.directory, builder)
+
+        self.assertEqual(len(index), len(DOCS))
+        self.assertEqual(index.search("cost_center", k=10), [])
+        self.assertEqual([doc_id for doc_id, _ in index.search("owner", k=10)], ["tags"])
+
+    def test_merge_drops_deleted_documents(self):
+        update_index(self.directory, _builder(["vm", "sg", "tags"]))
+        update_index(self.directory, _builder(["net", "backup", "budget"]))
+        update_index(self.directory, removed=["sg", "backup"])
+        index = BM25Index.load(self.directory)
+
+        self.assertEqual(len(index.segments), 1)
+        self.assertEqual(index.deleted, {})
+        self.assertSameResults(index, _monolithic(["vm", "tags", "net", "budget"]))
+
+    def test_unused_segments_are_removed_from_disk(self):
+        update_index(self.directory, _builder(["vm", "sg", "tags"]))
+        update_index(self.directory, _builder(["net", "backup", "budget"]))
+        update_index(self.directory, removed=["sg", "backup"])
+        update_index(self.directory, removed=["vm"])
+
+        index = BM25Index.load(self.directory)
+        on_disk = {path.name for path in self.directory.iterdir() if path.is_dir()}
+        self.assertLessEqual({segment.name for segment in index.segments}, on_disk)
+        self.assertLessEqual(len(on_disk), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Тесты метрик и трассировки запросов (src.metrics)."""
+
+import unittest
+
+from src.metrics import (
+    LLM_TOKENS, STAGE_SECONDS, MetricsRegistry, current_trace, end_trace, record_tokens, span, start_trace
+)
+
+
+def _sample(text: str, prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"Нет строки {prefix}")
+
+
+class MetricsRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_is_rendered_with_labels(self):
+        counter = self.registry.counter("iac_test_total", "Тестовый счетчик", ["kind"])
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        counter.inc(kind='b"c')
+
+        text = self.registry.render()
+
+        self.assertIn("# TYPE iac_test_total counter", text)
+        self.assertEqual(_sample(text, 'iac_test_total{kind="a"}'), 3.0)
+        self.assertEqual(_sample(text, 'iac_test_total{kind="b\\"c"}'), 1.0)
+        self.assertEqual(counter.value(kind="a"), 3.0)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("iac_test_seconds", "Тестовая гистограмма", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value)
+
+        text = self.registry.render()
+
+        self.assertEqual(_sample(text, 'iac_test_seconds_bucket{le="0.1"}'), 1)
+        self.assertEqual(_sample(text, 'iac_test_seconds_bucket{le="1.0"}'), 3)
+        self.assertEqual(_sample(text, 'iac_test_seconds_bucket{le="+Inf"}'), 4)
+        self.assertEqual(_sample(text, "iac_test_seconds_count"), 4)
+        self.assertAlmostEqual(_sample(text, "iac_test_seconds_sum"), 4.25)
+
+    def test_gauge_collects_on_render_and_ignores_errors(self):
+        self.registry.gauge("iac_test_size", "Тестовый показатель", ["name"], collect=lambda: {"cache": 7})
+        self.registry.gauge("iac_test_broken", "Сломанный показатель", collect=lambda: 1 / 0)
+
+        text = self.registry.render()
+
+        self.assertEqual(_sample(text, 'iac_test_size{name="cache"}'), 7)
+        self.assertIn("# TYPE iac_test_broken gauge", text)
+
+    def test_metric_is_registered_once(self):
+        first = self.registry.counter("iac_test_total", "Тестовый счетчик")
+        self.assertIs(self.registry.counter("iac_test_total", "Тестовый счетчик"), first)
+
+
+class TraceTest(unittest.TestCase):
+
+    def test_span_and_tokens_are_recorded_into_current_trace(self):
+        tokens_before = LLM_TOKENS.value(purpose="test", kind="input")
+        trace, token = start_trace("trace-1")
+        try:
+            self.assertIs(current_trace(), trace)
+            with span("test_stage"):
+                record_tokens("test", input_tokens=5, output_tokens=2)
+            record_tokens("test", input_tokens=1)
+        finally:
+            end_trace(token)
+
+        self.assertIsNone(current_trace())
+        data = trace.to_dict()
+        self.assertEqual(data["trace_id"], "trace-1")
+        self.assertEqual([item["stage"] for item in data["spans"]], ["test_stage"])
+        self.assertEqual(data["tokens"], {"test_input": 6, "test_output": 2})
+        self.assertEqual(LLM_TOKENS.value(purpose="test", kind="input") - tokens_before, 6)
+        self.assertIn('stage="test_stage"', "\n".join(STAGE_SECONDS.render()))
+
+    def test_metrics_without_trace(self):
+        with span("test_untraced"):
+            record_tokens("test_untraced", output_tokens=3)
+        self.assertIsNone(current_trace())
+        self.assertEqual(LLM_TOKENS.value(purpose="test_untraced", kind="output"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
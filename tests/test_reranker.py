@@ -0,0 +1,87 @@
+"""Тесты переранжирования фрагментов (src.reranker.rerank) в режиме cosine."""
+
+import unittest
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.metrics import start_trace, end_trace
+from src.reranker import rerank
+
+VECTORS = {
+    "query": [1.0, 0.0, 0.0],
+    "close": [0.9, 0.1, 0.0],
+    "middle": [0.6, 0.8, 0.0],
+    "far": [0.0, 0.0, 1.0],
+}
+
+
+class TableEmbeddings(Embeddings):
+    """Эмбеддинги из фиксированной таблицы с учетом векторизованных текстов."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [VECTORS[text] for text in texts]
+
+    def embed_query(self, text):
+        return VECTORS[text]
+
+
+def _ranked(*names):
+    return [(Document(id=name, page_content=name), 1.0 / (i + 1)) for i, name in enumerate(names)]
+
+
+class RerankTest(unittest.TestCase):
+
+    def setUp(self):
+        self.embeddings = TableEmbeddings()
+
+    def _rerank(self, ranked, **kwargs):
+        kwargs.setdefault("top_n", 0)
+        kwargs.setdefault("threshold", -1.0)
+        return rerank("query", ranked, embeddings=self.embeddings, mode="cosine", **kwargs)
+
+    def test_orders_by_similarity_to_query(self):
+        result = self._rerank(_ranked("far", "middle", "close"))
+        self.assertEqual([doc.id for doc, _ in result], ["close", "middle", "far"])
+        self.assertAlmostEqual(result[-1][1], 0.0, places=5)
+
+    def test_threshold_drops_weak_chunks(self):
+        result = self._rerank(_ranked("far", "middle", "close"), threshold=0.5)
+        self.assertEqual([doc.id for doc, _ in result], ["close", "middle"])
+
+    def test_top_n_limits_result(self):
+        result = self._rerank(_ranked("far", "middle", "close"), top_n=1)
+        self.assertEqual([doc.id for doc, _ in result], ["close"])
+
+    def test_best_chunk_is_kept_when_none_pass_threshold(self):
+        result = self._rerank(_ranked("far", "middle"), threshold=0.99)
+        self.assertEqual([doc.id for doc, _ in result], ["middle"])
+
+    def test_stored_vectors_are_not_embedded_again(self):
+        stored = {"close": VECTORS["close"], "far": VECTORS["far"]}
+        result = self._rerank(
+            _ranked("far", "middle", "close"),
+            stored_vectors=lambda ids: {doc_id: stored[doc_id] for doc_id in ids if doc_id in stored}
+        )
+        self.assertEqual([doc.id for doc, _ in result], ["close", "middle", "far"])
+        self.assertEqual(self.embeddings.embedded, ["middle"])
+
+    def test_dropped_tokens_are_traced(self):
+        trace, token = start_trace()
+        try:
+            self._rerank(_ranked("close", "far"), threshold=0.5)
+        finally:
+            end_trace(token)
+        self.assertGreater(trace.tokens.get("rerank_dropped", 0), 0)
+
+    def test_none_mode_returns_input(self):
+        ranked = _ranked("far", "close")
+        self.assertIs(rerank("query", ranked, embeddings=self.embeddings, mode="none"), ranked)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Тесты объединения результатов поиска (src.retriever.reciprocal_rank_fusion)."""
+
+import unittest
+
+from langchain_core.documents import Document
+
+from src.retriever import RRF_K, reciprocal_rank_fusion
+
+
+def _docs(*names):
+    return [Document(id=name, page_content=f"текст {name}") for name in names]
+
+
+class ReciprocalRankFusionTest(unittest.TestCase):
+
+    def test_documents_found_by_several_lists_rank_first(self):
+        fused = reciprocal_rank_fusion([_docs("a", "b", "c"), _docs("c", "d")])
+
+        self.assertEqual([doc.id for doc, _ in fused], ["c", "a", "b", "d"])
+        self.assertAlmostEqual(fused[0][1], 1 / (RRF_K + 3) + 1 / (RRF_K + 1))
+
+    def test_duplicates_are_merged_by_text(self):
+        copy = Document(id="other-id", page_content="текст a")
+        fused = reciprocal_rank_fusion([_docs("a"), [copy]])
+
+        self.assertEqual(len(fused), 1)
+        self.assertAlmostEqual(fused[0][1], 2 / (RRF_K + 1))
+
+    def test_weights_scale_list_contributions(self):
+        fused = reciprocal_rank_fusion([_docs("a"), _docs("b")], weights=[1.0, 2.0])
+        self.assertEqual([doc.id for doc, _ in fused], ["b", "a"])
+
+    def test_ties_are_ordered_deterministically(self):
+        first = reciprocal_rank_fusion([_docs("b"), _docs("a")])
+        second = reciprocal_rank_fusion([_docs("a"), _docs("b")])
+
+        self.assertEqual([doc.id for doc, _ in first], ["a", "b"])
+        self.assertEqual([doc.id for doc, _ in second], ["a", "b"])
+
+    def test_empty_lists(self):
+        self.assertEqual(reciprocal_rank_fusion([[], []]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
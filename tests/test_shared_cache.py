@@ -0,0 +1,194 @@
+"""Тесты общего кэша (src.shared_cache): бэкенды SQLite и Redis, single-flight."""
+
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+import multiprocessing
+from unittest import mock
+
+from src import shared_cache
+from src.shared_cache import (
+    SQLiteSharedCache,
+    RedisSharedCache,
+    REDIS_RELEASE_SCRIPT,
+    set_shared_cache,
+    single_flight,
+    asingle_flight,
+)
+
+
+class FakeRedis:
+    """Локальная замена клиента Redis: строки с временем жизни и скрипт снятия блокировки."""
+
+    def __init__(self):
+        self.data = {}
+
+    def _alive(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if value is not None and expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def get(self, key):
+        return self._alive(key)
+
+    def mget(self, keys):
+        return [self._alive(key) for key in keys]
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and self._alive(key) is not None:
+            return None
+        value = value.encode() if isinstance(value, str) else value
+        self.data[key] = (value, time.monotonic() + px / 1000 if px else None)
+        return True
+
+    def delete(self, key):
+        return 1 if self.data.pop(key, None) is not None else 0
+
+    def exists(self, key):
+        return 1 if self._alive(key) is not None else 0
+
+    def eval(self, script, numkeys, key, token):
+        assert script == REDIS_RELEASE_SCRIPT and numkeys == 1
+        return self.delete(key) if self._alive(key) == token.encode() else 0
+
+
+def _flight_worker(path, key, barrier, results):
+    """Процесс-участник single-flight: лидер вычисляет значение, остальные его дожидаются."""
+    cache = SQLiteSharedCache(path)
+    set_shared_cache(cache)
+    barrier.wait()
+    with single_flight(key, lambda: cache.get("test", key), timeout=10) as shared:
+        if shared is not None:
+            results.put(("waited", shared))
+            return
+        time.sleep(0.5)
+        cache.set("test", key, b"computed")
+        results.put(("led", b"computed"))
+
+
+class SQLiteSharedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "shared.sqlite3")
+        self.cache = SQLiteSharedCache(self.path, ttl=0, max_entries=5)
+
+    def tearDown(self):
+        set_shared_cache(None)
+        self.tmp.cleanup()
+
+    def test_get_set_json_and_namespaces(self):
+        self.cache.set_json("response", "k", {"code": "x"})
+        self.cache.set("embedding", "k", b"vector")
+        self.assertEqual(self.cache.get_json("response", "k"), {"code": "x"})
+        self.assertEqual(self.cache.get("embedding", "k"), b"vector")
+        self.assertIsNone(self.cache.get("expansion", "k"))
+        self.assertEqual(self.cache.get_many("embedding", ["k", "missing"]), {"k": b"vector"})
+
+    def test_expired_entries_are_misses(self):
+        self.cache.set("response", "k", b"value", ttl=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get("response", "k"))
+
+    def test_pruning_is_per_namespace(self):
+        with mock.patch.object(shared_cache, "PRUNE_EVERY_WRITES", 1):
+            self.cache.set("response", "answer", b"code")
+            self.cache.set_many("embedding", [(f"e{i}", b"v") for i in range(20)])
+        self.assertEqual(self.cache.get("response", "answer"), b"code")
+        embeddings = self.cache.get_many("embedding", [f"e{i}" for i in range(20)])
+        self.assertEqual(sorted(embeddings), sorted(f"e{i}" for i in range(15, 20)))
+
+    def test_lock_is_released_only_by_owner(self):
+        token = self.cache.acquire("key", ttl=10)
+        self.assertIsNotNone(token)
+        self.assertIsNone(self.cache.acquire("key", ttl=10))
+        self.cache.release("key", "other-token")
+        self.assertTrue(self.cache.locked("key"))
+        self.cache.release("key", token)
+        self.assertFalse(self.cache.locked("key"))
+
+    def test_expired_lock_can_be_taken_over(self):
+        self.assertIsNotNone(self.cache.acquire("key", ttl=0.05))
+        time.sleep(0.1)
+        self.assertIsNotNone(self.cache.acquire("key", ttl=10))
+
+    def test_single_flight_across_processes(self):
+        context = multiprocessing.get_context("spawn")
+        barrier = context.Barrier(4)
+        results = context.Queue()
+        processes = [
+            context.Process(target=_flight_worker, args=(self.path, "flight-key", barrier, results))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join(timeout=60)
+
+        self.assertEqual(sorted(role for role, _ in outcomes), ["led", "waited", "waited", "waited"])
+        self.assertTrue(all(value == b"computed" for _, value in outcomes))
+
+    def test_async_single_flight_waiters_get_leader_result(self):
+        set_shared_cache(self.cache)
+        calls = []
+
+        async def request():
+            async with asingle_flight("async-key", lambda: self.cache.get("test", "async-key"), timeout=10) as shared:
+                if shared is not None:
+                    return shared
+                calls.append(1)
+                await asyncio.sleep(0.3)
+                self.cache.set("test", "async-key", b"value")
+                return b"value"
+
+        async def run():
+            return await asyncio.gather(*(request() for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), [b"value"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_single_flight_without_cache_always_leads(self):
+        set_shared_cache(None)
+        with single_flight("key", lambda: b"never") as shared:
+            self.assertIsNone(shared)
+
+
+class RedisSharedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeRedis()
+        self.cache = RedisSharedCache(client=self.client, ttl=0)
+
+    def test_get_set(self):
+        self.cache.set_json("expansion", "k", [["security", "q"]])
+        self.assertEqual(self.cache.get_json("expansion", "k"), [["security", "q"]])
+        self.assertIsNone(self.cache.get("expansion", "missing"))
+
+    def test_expired_owner_does_not_release_new_lock(self):
+        first = self.cache.acquire("key", ttl=0.05)
+        time.sleep(0.1)
+        second = self.cache.acquire("key", ttl=10)
+        self.assertIsNotNone(second)
+        self.cache.release("key", first)
+        self.assertTrue(self.cache.locked("key"))
+        self.cache.release("key", second)
+        self.assertFalse(self.cache.locked("key"))
+
+    def test_storage_errors_are_misses(self):
+        broken = mock.Mock()
+        broken.mget.side_effect = ConnectionError("down")
+        broken.set.side_effect = ConnectionError("down")
+        cache = RedisSharedCache(client=broken)
+        self.assertIsNone(cache.get("response", "k"))
+        cache.set("response", "k", b"v")
+        self.assertIsNotNone(cache.acquire("key"))
+        self.assertEqual(cache.get_stats()["errors"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
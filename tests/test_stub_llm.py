@@ -0,0 +1,47 @@
+"""Тесты тестовой модели (src.stub_llm.StubChatModel) в цепочках расширения запроса, генерации и исправления."""
+
+import unittest
+
+from src.generator import _build_chain, _clean_response, _iter_repairs
+from src.retriever import EXPANSION_CATEGORIES, EXPANSION_PROMPT, _parse_expansion
+from src.stub_llm import StubChatModel
+from src.validator import validate_iac_detailed
+
+BROKEN_CODE = {
+    "terraform": 'resource "yandex_compute_instance" "app" {\n  name = "app-server"\n',
+    "ansible": "- name: Configure application servers\n  hosts: [app\n",
+}
+
+
+class StubChatModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.llm = StubChatModel(latency=0)
+
+    def test_expansion_lines_are_tagged_by_category(self):
+        query = "Создай ВМ Ubuntu"
+        response = self.llm.invoke(EXPANSION_PROMPT.format(query=query))
+        queries = _parse_expansion(response)
+
+        self.assertEqual([category for category, _ in queries], list(EXPANSION_CATEGORIES))
+        for _, sub_query in queries:
+            self.assertTrue(sub_query.startswith(query), sub_query)
+
+    def test_generated_code_is_valid(self):
+        for iac_tool in ("terraform", "ansible"):
+            response = _build_chain(self.llm).invoke({"context": "", "query": "Создай ВМ", "iac_tool": iac_tool})
+            code = _clean_response(response)
+            self.assertTrue(validate_iac_detailed(code, iac_tool).is_valid, iac_tool)
+
+    def test_broken_code_is_repaired_in_one_attempt(self):
+        for iac_tool, code in BROKEN_CODE.items():
+            results = list(_iter_repairs(code, iac_tool, "", self.llm, max_attempts=3, time_budget=0))
+
+            self.assertFalse(results[0].is_valid, iac_tool)
+            self.assertEqual(len(results), 2, iac_tool)
+            self.assertTrue(results[-1].is_valid, iac_tool)
+            self.assertEqual(results[-1].repair_attempts, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
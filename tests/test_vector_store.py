@@ -0,0 +1,108 @@
+"""Тесты встроенного векторного индекса (src.vector_store.NumpyVectorStore)."""
+
+import tempfile
+import unittest
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.vector_store import NumpyVectorStore
+
+VECTORS = {
+    "tf-security": [1.0, 0.1, 0.0, 0.0],
+    "tf-standards": [0.9, 0.3, 0.1, 0.0],
+    "ansible-security": [0.8, 0.0, 0.5, 0.1],
+    "general": [0.1, 1.0, 0.2, 0.0],
+    "budget": [0.0, 0.2, 0.1, 1.0],
+}
+METADATA = {
+    "tf-security": {"iac_tool": "terraform", "category": "security", "page": 1},
+    "tf-standards": {"iac_tool": "terraform", "category": "standards", "page": 2},
+    "ansible-security": {"iac_tool": "ansible", "category": "security"},
+    "general": {"iac_tool": "any", "category": "general"},
+    "budget": {"iac_tool": "terraform", "category": "budget"},
+}
+
+
+class TableEmbeddings(Embeddings):
+    """Эмбеддинги из фиксированной таблицы: текст документа совпадает с его идентификатором."""
+
+    def embed_documents(self, texts):
+        return [VECTORS[text] for text in texts]
+
+    def embed_query(self, text):
+        return VECTORS[text]
+
+
+class NumpyVectorStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _store(self, dtype: str = "float32") -> NumpyVectorStore:
+        store = NumpyVectorStore(self.tmp.name, TableEmbeddings(), dtype=dtype)
+        ids = list(VECTORS)
+        store.add_documents([Document(page_content=doc_id, metadata=METADATA[doc_id]) for doc_id in ids], ids)
+        store.persist()
+        return store
+
+    def _search(self, store, where=None, k: int = 10) -> list:
+        return [doc.id for doc in store.query([VECTORS["tf-security"]], k, where)[0]]
+
+    def test_search_orders_by_similarity(self):
+        store = self._store()
+        self.assertEqual(self._search(store, k=3), ["tf-security", "tf-standards", "ansible-security"])
+
+    def test_where_filters(self):
+        store = self._store()
+        cases = [
+            ({"iac_tool": "terraform"}, ["tf-security", "tf-standards", "budget"]),
+            ({"iac_tool": {"$ne": "terraform"}}, ["ansible-security", "general"]),
+            ({"category": {"$in": ["security", "general"]}}, ["tf-security", "ansible-security", "general"]),
+            ({"category": {"$nin": ["security", "general"]}}, ["tf-standards", "budget"]),
+            ({"$and": [{"iac_tool": "terraform"}, {"category": "security"}]}, ["tf-security"]),
+            ({"$or": [{"category": "budget"}, {"iac_tool": "ansible"}]}, ["ansible-security", "budget"]),
+            ({"page": 2}, ["tf-standards"]),
+            ({"missing": "x"}, []),
+            ({"$and": []}, list(store.ids)),
+        ]
+        for where, expected in cases:
+            self.assertEqual(sorted(self._search(store, where)), sorted(expected), where)
+
+    def test_unsupported_operator_is_rejected(self):
+        store = self._store()
+        with self.assertRaises(ValueError):
+            store.query([VECTORS["general"]], 3, {"page": {"$gt": 1}})
+
+    def test_int8_round_trip(self):
+        store = self._store("int8")
+        reopened = NumpyVectorStore(self.tmp.name, TableEmbeddings(), dtype="int8")
+
+        self.assertEqual(reopened.count(), len(VECTORS))
+        self.assertEqual(reopened.vectors.dtype, np.int8)
+        self.assertEqual(self._search(reopened, k=3), ["tf-security", "tf-standards", "ansible-security"])
+        for doc_id, vector in reopened.get_vectors(list(VECTORS)).items():
+            expected = np.asarray(VECTORS[doc_id]) / np.linalg.norm(VECTORS[doc_id])
+            restored = vector / np.linalg.norm(vector)
+            self.assertGreater(float(restored @ expected), 0.999)
+        self.assertEqual(store.get(["budget"])[0].metadata, METADATA["budget"])
+
+    def test_delete_and_readd_survive_persist(self):
+        store = self._store()
+        store.delete(["tf-security"])
+        store.add_documents([Document(page_content="tf-security", metadata={"iac_tool": "ansible"})],
+                            ["tf-security"])
+        store.persist()
+
+        reopened = NumpyVectorStore(self.tmp.name, TableEmbeddings())
+        self.assertEqual(reopened.count(), len(VECTORS))
+        found = self._search(reopened, {"iac_tool": "ansible"})
+        self.assertEqual(sorted(found), ["ansible-security", "tf-security"])
+
+
+if __name__ == "__main__":
+    unittest.main()